@@ -0,0 +1,266 @@
+"""Alert deduplication and aggregation
+
+Repeated alerts for one incident - the same tourist, alert type, zone (for
+geofence alerts) and location cell - are merged into a single Alert row while
+they keep recurring within ALERT_AGGREGATION_WINDOW_SECONDS of each other. The
+first occurrence inserts the row; later ones only bump its occurrence count and
+last-seen time in memory, and the counters are written back in one batch per
+flush interval.
+Callers notify dashboards only when an alert is new or its severity rises.
+
+Workers share occurrences through the connection manager's backplane, so a
+tourist whose pings land on different workers still maps to one alert.
+"""
+from typing import Dict, Optional, Tuple
+from datetime import datetime, timezone
+from sqlalchemy import case
+from sqlalchemy.orm import Session
+from decouple import config
+import asyncio
+import math
+import time
+from database import SessionLocal
+from models import Alert
+from websocket_manager import ConnectionManager, manager
+
+# Occurrences further apart than this start a new alert
+ALERT_AGGREGATION_WINDOW_SECONDS = config("ALERT_AGGREGATION_WINDOW_SECONDS", default=300, cast=int)
+
+# Location cell edge in degrees (about 550 m of latitude) within which alerts merge
+ALERT_AGGREGATION_CELL_DEG = config("ALERT_AGGREGATION_CELL_DEG", default=0.005, cast=float)
+
+# Seconds between batched writes of occurrence counts
+ALERT_AGGREGATION_FLUSH_SECONDS = config("ALERT_AGGREGATION_FLUSH_SECONDS", default=5.0, cast=float)
+
+ALERT_AGGREGATION_TOPIC = "alert_occurrence"
+SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+
+class AggregatedAlert:
+    """The open alert for one aggregation key"""
+
+    __slots__ = ("alert_id", "occurrence_count", "first_seen", "last_seen", "severity")
+
+    def __init__(self, alert_id: int, first_seen: float, severity: str):
+        self.alert_id = alert_id
+        self.occurrence_count = 1
+        self.first_seen = first_seen
+        self.last_seen = first_seen
+        self.severity = severity
+
+class PendingOccurrences:
+    """Occurrences recorded by this worker and not yet written to the database"""
+
+    __slots__ = ("count", "last_seen", "severity")
+
+    def __init__(self):
+        self.count = 0
+        self.last_seen = 0.0
+        self.severity: Optional[str] = None
+
+class AlertAggregator:
+    """Keyed index of open alerts and the batched writer of their counters"""
+
+    def __init__(self, websocket_manager: ConnectionManager,
+                 window_seconds: int = ALERT_AGGREGATION_WINDOW_SECONDS,
+                 cell_deg: float = ALERT_AGGREGATION_CELL_DEG,
+                 flush_seconds: float = ALERT_AGGREGATION_FLUSH_SECONDS):
+        self.websocket_manager = websocket_manager
+        self.window_seconds = window_seconds
+        self.cell_deg = cell_deg
+        self.flush_seconds = flush_seconds
+        self.alerts: Dict[Tuple, AggregatedAlert] = {}  # (tourist_id, alert_type, zone_id, cell x, cell y) -> open alert
+        self.pending: Dict[int, PendingOccurrences] = {}  # alert_id -> occurrences to write
+        self.inserting: Dict[Tuple, asyncio.Task] = {}  # key -> insert of its new alert, while in flight
+        self.flush_task: Optional[asyncio.Task] = None
+        self.alerts_created = 0
+        self.occurrences_merged = 0
+        websocket_manager.on_event(ALERT_AGGREGATION_TOPIC, self.apply_occurrence)
+
+    def key_for(self, tourist_id: Optional[int], alert_type: str, lat: Optional[float], lng: Optional[float],
+                zone_id: Optional[str] = None) -> Tuple:
+        if lat is None or lng is None:
+            return (tourist_id, alert_type, zone_id, None, None)
+        return (tourist_id, alert_type, zone_id, math.floor(lng / self.cell_deg), math.floor(lat / self.cell_deg))
+
+    def record(self, db: Optional[Session], tourist_id: Optional[int], alert_type: str, message: str,
+               severity: str = "medium", lat: Optional[float] = None, lng: Optional[float] = None,
+               metadata: Optional[Dict] = None, zone_id: Optional[str] = None) -> Tuple[AggregatedAlert, bool]:
+        """Record an alert occurrence, merging it into an open alert with the same key.
+
+        zone_id keeps alerts about different zones apart within one location
+        cell. Returns the aggregated alert and whether to notify: True when the
+        alert is new or its severity has risen.
+        """
+        now = time.time()
+        key = self.key_for(tourist_id, alert_type, lat, lng, zone_id)
+        merged = self.merge(key, severity, now)
+        if merged is not None:
+            return merged
+
+        alert_id = self.insert_alert(db, tourist_id, alert_type, message, severity, lat, lng, metadata, now)
+        self.opened(key, alert_id, severity, now)
+        return self.alerts[key], True
+
+    async def record_async(self, tourist_id: Optional[int], alert_type: str, message: str,
+                           severity: str = "medium", lat: Optional[float] = None, lng: Optional[float] = None,
+                           metadata: Optional[Dict] = None, zone_id: Optional[str] = None
+                           ) -> Tuple[AggregatedAlert, bool]:
+        """As record, with a new alert's row inserted off the event loop"""
+        key = self.key_for(tourist_id, alert_type, lat, lng, zone_id)
+        in_flight = self.inserting.get(key)
+        if in_flight is not None:
+            # A concurrent occurrence is creating this alert; merge into it once it exists
+            await asyncio.wait({in_flight})
+        now = time.time()
+        merged = self.merge(key, severity, now)
+        if merged is not None:
+            return merged
+
+        insert = self.inserting[key] = asyncio.create_task(
+            self.insert_off_loop(key, tourist_id, alert_type, message, severity, lat, lng, metadata, now)
+        )
+        # Shielded so a caller that gives up waiting does not cancel the insert
+        return await asyncio.shield(insert), True
+
+    async def insert_off_loop(self, key: Tuple, tourist_id: Optional[int], alert_type: str, message: str,
+                              severity: str, lat: Optional[float], lng: Optional[float],
+                              metadata: Optional[Dict], now: float) -> AggregatedAlert:
+        try:
+            alert_id = await asyncio.to_thread(
+                self.insert_alert, None, tourist_id, alert_type, message, severity, lat, lng, metadata, now
+            )
+        finally:
+            self.inserting.pop(key, None)
+        self.opened(key, alert_id, severity, now)
+        return self.alerts[key]
+
+    def merge(self, key: Tuple, severity: str, now: float) -> Optional[Tuple[AggregatedAlert, bool]]:
+        """Merge an occurrence into the open alert for its key; None when there is none"""
+        aggregated = self.alerts.get(key)
+        if aggregated is None or now - aggregated.last_seen > self.window_seconds:
+            return None
+
+        escalated = SEVERITY_RANK.get(severity, 0) > SEVERITY_RANK.get(aggregated.severity, 0)
+        pending = self.pending.get(aggregated.alert_id)
+        if pending is None:
+            pending = self.pending[aggregated.alert_id] = PendingOccurrences()
+        pending.count += 1
+        pending.last_seen = now
+        if escalated:
+            pending.severity = severity
+        self.occurrences_merged += 1
+        self.websocket_manager.publish_event(ALERT_AGGREGATION_TOPIC, {
+            "key": list(key), "alert_id": aggregated.alert_id, "severity": severity, "ts": now, "new": False
+        })
+        return aggregated, escalated
+
+    def opened(self, key: Tuple, alert_id: int, severity: str, now: float):
+        self.alerts_created += 1
+        self.websocket_manager.publish_event(ALERT_AGGREGATION_TOPIC, {
+            "key": list(key), "alert_id": alert_id, "severity": severity, "ts": now, "new": True
+        })
+
+    def insert_alert(self, db: Optional[Session], tourist_id: Optional[int], alert_type: str, message: str,
+                     severity: str, lat: Optional[float], lng: Optional[float], metadata: Optional[Dict],
+                     now: float) -> int:
+        owns_session = db is None
+        db = db or SessionLocal()
+        try:
+            alert = Alert(
+                tourist_id=tourist_id,
+                alert_type=alert_type,
+                message=message,
+                severity=severity,
+                location_lat=lat,
+                location_lng=lng,
+                metadata_info=metadata,
+                occurrence_count=1,
+                last_seen_at=datetime.fromtimestamp(now, timezone.utc)
+            )
+            db.add(alert)
+            db.commit()
+            return alert.id
+        finally:
+            if owns_session:
+                db.close()
+
+    def apply_occurrence(self, occurrence: Dict):
+        """Track an occurrence recorded by any worker, this one included"""
+        key = tuple(occurrence["key"])
+        if occurrence["new"]:
+            self.alerts[key] = AggregatedAlert(occurrence["alert_id"], occurrence["ts"], occurrence["severity"])
+            return
+        aggregated = self.alerts.get(key)
+        if aggregated is None or aggregated.alert_id != occurrence["alert_id"]:
+            return
+        aggregated.occurrence_count += 1
+        aggregated.last_seen = max(aggregated.last_seen, occurrence["ts"])
+        if SEVERITY_RANK.get(occurrence["severity"], 0) > SEVERITY_RANK.get(aggregated.severity, 0):
+            aggregated.severity = occurrence["severity"]
+
+    def write_occurrences(self, batch: Dict[int, PendingOccurrences]):
+        """Add merged occurrences to their alert rows in one transaction"""
+        db = SessionLocal()
+        try:
+            for alert_id, pending in batch.items():
+                # UTC, like created_at, so the two are comparable on any host
+                last_seen = datetime.fromtimestamp(pending.last_seen, timezone.utc)
+                values = {
+                    Alert.occurrence_count: Alert.occurrence_count + pending.count,
+                    # Other workers write the same row, so last_seen_at only moves forward
+                    Alert.last_seen_at: case(
+                        (Alert.last_seen_at.is_(None), last_seen),
+                        (Alert.last_seen_at < last_seen, last_seen),
+                        else_=Alert.last_seen_at
+                    )
+                }
+                if pending.severity:
+                    values[Alert.severity] = pending.severity
+                db.query(Alert).filter(Alert.id == alert_id).update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def flush(self):
+        """Write pending occurrences and forget alerts whose window has passed"""
+        cutoff = time.time() - self.window_seconds
+        for key in [key for key, aggregated in self.alerts.items() if aggregated.last_seen < cutoff]:
+            del self.alerts[key]
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        try:
+            await asyncio.to_thread(self.write_occurrences, batch)
+        except Exception as e:
+            print(f"Error writing {len(batch)} aggregated alert updates: {e}")
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+    def start(self):
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush_loop())
+
+    async def stop(self):
+        """Stop the flush loop and write what is still pending"""
+        if self.flush_task:
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+            self.flush_task = None
+        await self.flush()
+
+    def get_stats(self) -> Dict:
+        return {
+            "open_alerts": len(self.alerts),
+            "pending_updates": len(self.pending),
+            "alerts_created": self.alerts_created,
+            "occurrences_merged": self.occurrences_merged
+        }
+
+# Global alert aggregator instance
+alert_aggregator = AlertAggregator(manager)
@@ -0,0 +1,45 @@
+"""Keyset pagination of the police alert feed
+
+Alerts are listed newest first by (created_at, id). A page cursor holds the
+sort key of the previous page's last alert and the next page seeks past it,
+so a page costs the same however deep the client has scrolled.
+
+The seek compares created_at values bound from Python with stored ones, so
+alerts get created_at from Python (models.utc_now) rather than the database
+clock: SQLite keeps timestamps as text and only compares them correctly when
+both sides have the same format.
+"""
+from typing import List, Optional, Tuple
+from datetime import datetime
+from sqlalchemy import tuple_
+import base64
+import binascii
+from models import Alert
+
+def encode_alert_cursor(created_at: datetime, alert_id: int) -> str:
+    """Opaque page cursor holding the sort key of a page's last alert"""
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{alert_id}".encode()).decode()
+
+def decode_alert_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, alert_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(alert_id)
+    except (TypeError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(str(e))
+
+def alert_page(query, cursor: Optional[str], limit: int) -> Tuple[List[Alert], Optional[str]]:
+    """One page of an Alert query, newest first, and the cursor of the next page (None on the last).
+
+    Raises ValueError for a cursor that cannot be decoded.
+    """
+    if cursor:
+        cursor_created_at, cursor_id = decode_alert_cursor(cursor)
+        # Seek past the last row of the previous page instead of OFFSET-scanning to it
+        query = query.filter(tuple_(Alert.created_at, Alert.id) < (cursor_created_at, cursor_id))
+
+    alerts = query.order_by(Alert.created_at.desc(), Alert.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(alerts) > limit:
+        alerts = alerts[:limit]
+        next_cursor = encode_alert_cursor(alerts[-1].created_at, alerts[-1].id)
+    return alerts, next_cursor
@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status, WebSocket
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status, WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
-from database import get_db, get_mongo_db
-from auth import get_current_user, require_role
-from models import User, TouristProfile, Alert
+from sqlalchemy import func, select
+from typing import List, Optional
+from database import SessionLocal, get_db, get_mongo_db
+from auth import get_current_user, require_role, get_user_from_token
+from models import User, TouristProfile, PoliceProfile, Alert
 from schemas import (
     TouristProfileCreate, TouristProfileResponse, LocationUpdate,
     ItineraryCreate, ItineraryResponse, AlertResponse,
@@ -12,13 +12,162 @@ from schemas import (
 )
 from ai_anomaly_detection import anomaly_model
 from blockchain_tourist_id import blockchain_service
-from geofencing_service import geofencing_service
-from websocket_manager import ConnectionManager
+from geofencing_service import geofencing_service, GEOFENCE_SIMPLIFY_TOLERANCE_M
+from geofence_sharding import GEOFENCE_SHARDS
+from websocket_manager import manager
+from websocket_backplane import create_backplane
+from live_map_feed import live_map_feed
+from tourist_clusters import tourist_cluster_index
+from heatmap_tiles import heatmap_tiles, HEATMAP_TILE_MAX_AGE
+from alert_aggregation import alert_aggregator
+from alert_feed import alert_page
+from tourism_stats import tourism_stats, profile_snapshot
+from data_export import export_response
+from tourist_proximity import tourist_proximity_index, TOURIST_PROXIMITY_DEFAULT_K, TOURIST_PROXIMITY_MAX_AGE
+from spatial_subscriptions import parse_area, parse_bbox
+import asyncio
 import json
+import uuid
 from datetime import datetime
 
 router = APIRouter()
-manager = ConnectionManager()
+
+@router.on_event("startup")
+async def start_background_services():
+    """Start per-worker background tasks"""
+    try:
+        await manager.start_backplane(create_backplane())
+    except Exception as e:
+        print(f"WebSocket backplane unavailable, delivering to local connections only: {e}")
+    manager.start_heartbeat()
+    geofencing_service.start_zone_watcher()
+    geofencing_service.start_violation_workers()
+    alert_aggregator.start()
+    await live_map_feed.start()
+    await heatmap_tiles.start()
+    await tourism_stats.start()
+    if GEOFENCE_SHARDS > 0:
+        await geofencing_service.enable_sharding(GEOFENCE_SHARDS)
+
+@router.on_event("shutdown")
+async def stop_background_services():
+    """Flush queued work before the worker exits"""
+    await geofencing_service.stop_violation_workers()
+    geofencing_service.disable_sharding()
+    await alert_aggregator.stop()
+    await tourism_stats.stop()
+    await heatmap_tiles.stop()
+    await live_map_feed.stop()
+    await manager.stop_heartbeat()
+    await manager.stop_backplane()
+
+# WebSocket Route
+@router.websocket("/ws/{user_id}")
+async def websocket_endpoint(
+    websocket: WebSocket,
+    user_id: str,
+    token: str,
+    encoding: str = "json",
+    bbox: Optional[str] = None,
+    last_seq: Optional[int] = None,
+    stream: Optional[str] = None
+):
+    """Real-time channel for alerts and notifications.
+    
+    encoding=msgpack selects compact binary frames; permessage-deflate is
+    negotiated by the server's WebSocket implementation when the client offers it.
+    Police connections receive located events inside their jurisdiction area, or
+    inside bbox=min_lng,min_lat,max_lng,max_lat when given. They can change area
+    later by sending {"type": "subscribe", "bbox": [...]}, {"type": "subscribe",
+    "area": "jurisdiction"} or {"type": "unsubscribe"} for the full feed.
+    Police connections also receive live map deltas ("map_delta") and can send
+    {"type": "map_resync"} for a full "map_snapshot".
+    
+    The server sends {"type": "ping"} periodically; a client that sends nothing
+    (not even {"type": "pong"}) within the heartbeat timeout is disconnected.
+    
+    Alerts and notifications carry a "seq"; the first message is a "session"
+    with the current stream and seq. A client reconnecting with last_seq and
+    stream gets what it missed, or "resync_required" if it must reload. The
+    stream belongs to one worker, so resuming needs the reconnect to reach the
+    same worker (sticky sessions); elsewhere the client reloads.
+    """
+    # Lookups use their own session, closed before the socket is accepted, so a
+    # long-lived connection does not hold a pooled database connection
+    connection_user_id = user_id
+    jurisdiction = None
+    jurisdiction_area = None
+    db = SessionLocal()
+    try:
+        user = get_user_from_token(token, db)
+        if user is None or str(user.id) != user_id:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        
+        role = user.role.value
+        if role == "tourist":
+            # Tourist notifications are addressed by tourist profile id
+            profile = db.query(TouristProfile).filter(TouristProfile.user_id == user.id).first()
+            if profile:
+                connection_user_id = str(profile.id)
+        elif role == "police":
+            police_profile = db.query(PoliceProfile).filter(PoliceProfile.user_id == user.id).first()
+            if police_profile:
+                jurisdiction = police_profile.department
+                try:
+                    jurisdiction_area = parse_area(police_profile.jurisdiction_area)
+                except (ValueError, TypeError, IndexError, KeyError) as e:
+                    print(f"Ignoring unreadable jurisdiction area for police profile {police_profile.id}: {e}")
+    finally:
+        db.close()
+    
+    client_id = str(uuid.uuid4())
+    await manager.connect(websocket, client_id, connection_user_id, role=role, jurisdiction=jurisdiction,
+                          encoding=encoding)
+    try:
+        if role == "police":
+            area = jurisdiction_area
+            if bbox:
+                try:
+                    area = parse_bbox(bbox)
+                except ValueError:
+                    pass
+            if area is not None:
+                manager.subscribe_area(client_id, area)
+        manager.resume(client_id, last_seq, stream)
+        
+        while True:
+            text = await websocket.receive_text()
+            manager.touch(client_id)
+            if role == "police":
+                await handle_police_message(client_id, text, jurisdiction_area)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(client_id)
+
+async def handle_police_message(client_id: str, text: str, jurisdiction_area):
+    """Apply a police client's subscription or map resync request; other messages are ignored"""
+    try:
+        request = json.loads(text)
+    except ValueError:
+        return
+    if not isinstance(request, dict):
+        return
+    
+    if request.get("type") == "map_resync":
+        # Sent to this connection only; the snapshot is not shared with other workers
+        await manager.send_to_clients(live_map_feed.snapshot(), [client_id])
+    elif request.get("type") == "unsubscribe":
+        manager.unsubscribe_area(client_id)
+    elif request.get("type") == "subscribe":
+        try:
+            if request.get("bbox") is not None:
+                manager.subscribe_area(client_id, parse_bbox(request["bbox"]))
+            elif request.get("area") == "jurisdiction" and jurisdiction_area is not None:
+                manager.subscribe_area(client_id, jurisdiction_area)
+        except (ValueError, TypeError):
+            pass
 
 # Tourist Profile Routes
 @router.post("/tourist/profile", response_model=TouristProfileResponse)
@@ -66,6 +215,7 @@ async def create_tourist_profile(
         db.add(new_profile)
         db.commit()
         db.refresh(new_profile)
+        tourism_stats.record_change(None, profile_snapshot(new_profile))
         
         return TouristProfileResponse(
             id=new_profile.id,
@@ -149,9 +299,37 @@ async def update_location(
         # Check for anomalies
         anomaly_result = anomaly_model.predict_anomaly(tourist_data)
         
+        if anomaly_result.get("anomaly_flag"):
+            # Repeats of an open anomaly alert only bump its occurrence count
+            aggregated, notify = alert_aggregator.record(
+                db, profile.id, "anomaly", f"Anomaly detected: {anomaly_result.get('reason')}", "medium",
+                location.latitude, location.longitude, {"risk_score": anomaly_result.get("risk_score")}
+            )
+            if aggregated.occurrence_count == 1:
+                heatmap_tiles.record_alert(location.latitude, location.longitude, "medium")
+            if notify:
+                await manager.broadcast_to_location({
+                    "type": "anomaly_detected",
+                    "alert_id": aggregated.alert_id,
+                    "tourist_id": profile.id,
+                    "location": {
+                        "lat": location.latitude,
+                        "lng": location.longitude
+                    },
+                    "reason": anomaly_result.get("reason"),
+                    "risk_score": anomaly_result.get("risk_score"),
+                    "occurrence_count": aggregated.occurrence_count,
+                    "timestamp": datetime.now().isoformat()
+                }, "police", location.latitude, location.longitude)
+        
         # Check for geofence violations
         geofence_violations = await geofencing_service.check_geofence_violations(tourist_data)
         
+        live_map_feed.record_location(
+            profile.id, location.latitude, location.longitude, profile.safety_score,
+            "alert" if anomaly_result.get("anomaly_flag") or geofence_violations else "active"
+        )
+        
         # Store location in MongoDB for tracking
         mongo_db = await get_mongo_db()
         await mongo_db.location_history.insert_one({
@@ -261,11 +439,12 @@ async def get_nearby_zones(
     lat: float,
     lng: float,
     radius: float = 5.0,
+    k: int = 10,
     current_user: User = Depends(get_current_user)
 ):
-    """Get geofence zones near a location"""
+    """Get the k geofence zones nearest to a location"""
     try:
-        zones = geofencing_service.get_zones_near_location(lat, lng, radius)
+        zones = await geofencing_service.nearest_zones(lat, lng, k=k, radius_km=radius)
         return {"nearby_zones": zones}
     except Exception as e:
         raise HTTPException(
@@ -280,7 +459,7 @@ async def create_geofence_zone(
 ):
     """Create a new geofence zone"""
     try:
-        result = geofencing_service.add_geofence_zone(zone_data)
+        result = await geofencing_service.add_geofence_zone(zone_data)
         return result
     except Exception as e:
         raise HTTPException(
@@ -288,6 +467,29 @@ async def create_geofence_zone(
             detail=f"Error creating geofence zone: {str(e)}"
         )
 
+@router.post("/geofence/zones/import")
+async def import_geofence_zones(
+    feature_collection: dict,
+    tolerance_m: float = GEOFENCE_SIMPLIFY_TOLERANCE_M,
+    replace: bool = False,
+    current_user: User = Depends(require_role("tourism_authority"))
+):
+    """Bulk import geofence zones from a GeoJSON FeatureCollection"""
+    try:
+        # Parsing, repair and simplification are CPU-bound; keep them off the event loop
+        result = await asyncio.to_thread(
+            geofencing_service.import_geojson_zones,
+            feature_collection,
+            simplify_tolerance_m=tolerance_m,
+            replace_existing=replace
+        )
+        return result
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error importing geofence zones: {str(e)}"
+        )
+
 # Panic Button Route
 @router.post("/emergency/panic")
 async def trigger_panic_button(
@@ -307,22 +509,19 @@ async def trigger_panic_button(
                 detail="Tourist profile not found"
             )
         
-        # Create emergency alert
-        emergency_alert = Alert(
-            tourist_id=profile.id,
-            alert_type="panic",
-            message=f"EMERGENCY: Panic button activated by {current_user.full_name}",
-            severity="critical",
-            location_lat=profile.current_location_lat,
-            location_lng=profile.current_location_lng
+        # Create emergency alert; repeated presses at the same place are merged into it
+        emergency_alert, _ = alert_aggregator.record(
+            db, profile.id, "panic", f"EMERGENCY: Panic button activated by {current_user.full_name}", "critical",
+            profile.current_location_lat, profile.current_location_lng
         )
+        if emergency_alert.occurrence_count == 1:
+            heatmap_tiles.record_alert(profile.current_location_lat, profile.current_location_lng, "critical")
         
-        db.add(emergency_alert)
-        db.commit()
-        
-        # Send real-time alert to police
+        # Send real-time alert to police, on every press
         alert_data = {
             "type": "emergency_panic",
+            "alert_id": emergency_alert.alert_id,
+            "occurrence_count": emergency_alert.occurrence_count,
             "tourist_id": profile.id,
             "tourist_name": current_user.full_name,
             "location": {
@@ -334,12 +533,24 @@ async def trigger_panic_button(
             "contact": profile.emergency_contact
         }
         
-        # Broadcast to all police
-        await manager.broadcast_to_role(json.dumps(alert_data), "police")
+        if profile.current_location_lat is not None and profile.current_location_lng is not None:
+            # Possible witnesses, or others at risk
+            alert_data["nearby_tourists"] = tourist_proximity_index.nearest_tourists(
+                profile.current_location_lat, profile.current_location_lng, exclude=profile.id
+            )
+            live_map_feed.record_location(
+                profile.id, profile.current_location_lat, profile.current_location_lng,
+                profile.safety_score, "emergency"
+            )
+        
+        # Broadcast to police covering the tourist's location
+        await manager.broadcast_to_location(
+            alert_data, "police", profile.current_location_lat, profile.current_location_lng
+        )
         
         return {
             "message": "Emergency alert sent successfully",
-            "alert_id": emergency_alert.id,
+            "alert_id": emergency_alert.alert_id,
             "emergency_services_notified": True
         }
         
@@ -352,14 +563,33 @@ async def trigger_panic_button(
 # Police Dashboard Routes
 @router.get("/police/dashboard/alerts")
 async def get_police_alerts(
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    severity: Optional[str] = None,
+    alert_type: Optional[str] = None,
+    bbox: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    resolved: bool = False,
     current_user: User = Depends(require_role("police")),
     db: Session = Depends(get_db)
 ):
-    """Get all active alerts for police dashboard"""
+    """Get active alerts for police dashboard, newest first.
+    
+    Keyset-paginated: pass the previous page's next_cursor to get the next one.
+    severity and alert_type take comma-separated values, bbox is
+    min_lng,min_lat,max_lng,max_lat and since/until bound created_at.
+    """
+    limit = max(1, min(limit, 200))
     try:
-        alerts = db.query(Alert).filter(
-            Alert.is_resolved == False
-        ).order_by(Alert.created_at.desc()).limit(50).all()
+        query = filter_alerts(db.query(Alert), severity, alert_type, bbox, since, until, resolved)
+        try:
+            alerts, next_cursor = alert_page(query, cursor, limit)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
         
         alert_list = []
         for alert in alerts:
@@ -374,23 +604,100 @@ async def get_police_alerts(
                     "lng": alert.location_lng
                 },
                 "created_at": alert.created_at,
-                "is_resolved": alert.is_resolved
+                "is_resolved": alert.is_resolved,
+                "occurrence_count": alert.occurrence_count,
+                "last_seen_at": alert.last_seen_at
             })
         
-        return {"alerts": alert_list}
+        return {"alerts": alert_list, "next_cursor": next_cursor}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error retrieving police alerts: {str(e)}"
         )
 
+def filter_alerts(query, severity: Optional[str], alert_type: Optional[str], bbox: Optional[str],
+                  since: Optional[datetime], until: Optional[datetime], resolved: bool):
+    """Apply the alert feed filters to a Query or select()"""
+    query = query.filter(Alert.is_resolved == resolved)
+    if severity:
+        query = query.filter(Alert.severity.in_(severity.split(",")))
+    if alert_type:
+        query = query.filter(Alert.alert_type.in_(alert_type.split(",")))
+    if since:
+        query = query.filter(Alert.created_at >= since)
+    if until:
+        query = query.filter(Alert.created_at < until)
+    if bbox:
+        try:
+            min_lng, min_lat, max_lng, max_lat = (float(value) for value in bbox.split(","))
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="bbox must be min_lng,min_lat,max_lng,max_lat"
+            )
+        query = query.filter(
+            Alert.location_lat.between(min_lat, max_lat),
+            Alert.location_lng.between(min_lng, max_lng)
+        )
+    return query
+
+@router.get("/police/exports/alerts")
+async def export_police_alerts(
+    format: str = "ndjson",
+    severity: Optional[str] = None,
+    alert_type: Optional[str] = None,
+    bbox: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    resolved: bool = False,
+    current_user: User = Depends(require_role("police"))
+):
+    """Stream every alert matching the feed filters as NDJSON or CSV, oldest first"""
+    statement = filter_alerts(
+        select(
+            Alert.id, Alert.tourist_id, Alert.alert_type, Alert.message, Alert.severity,
+            Alert.location_lat, Alert.location_lng, Alert.created_at, Alert.is_resolved,
+            Alert.resolved_at, Alert.occurrence_count, Alert.last_seen_at
+        ),
+        severity, alert_type, bbox, since, until, resolved
+    ).order_by(Alert.created_at, Alert.id)
+    try:
+        return export_response(statement, format, "alerts")
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
 @router.get("/police/dashboard/tourist-clusters")
 async def get_tourist_clusters(
+    bbox: Optional[str] = None,
+    zoom: Optional[int] = None,
     current_user: User = Depends(require_role("police")),
     db: Session = Depends(get_db)
 ):
-    """Get real-time tourist location clusters for police dashboard"""
+    """Get real-time tourist location clusters for police dashboard.
+    
+    With bbox=min_lng,min_lat,max_lng,max_lat and zoom, returns only the
+    clusters and single tourists visible in that viewport, from the in-memory
+    cluster index. Without them, returns every recent raw position.
+    """
+    if bbox is not None and zoom is not None:
+        try:
+            viewport = tuple(float(value) for value in bbox.split(","))
+            if len(viewport) != 4:
+                raise ValueError
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="bbox must be min_lng,min_lat,max_lng,max_lat"
+            )
+        return tourist_cluster_index.query(viewport, zoom)
+    
     try:
         # Get all active tourists with recent locations
         from datetime import datetime, timedelta
@@ -422,60 +729,110 @@ async def get_tourist_clusters(
             detail=f"Error retrieving tourist clusters: {str(e)}"
         )
 
+@router.get("/police/dashboard/live-map")
+async def get_live_map_snapshot(
+    current_user: User = Depends(require_role("police"))
+):
+    """Full live map state; later changes arrive as map_delta messages on the WebSocket"""
+    return live_map_feed.snapshot()
+
+@router.get("/police/dashboard/websocket-telemetry")
+async def get_websocket_telemetry(
+    current_user: User = Depends(require_role("police"))
+):
+    """Connection counts, throughput, send latency and reaping for this worker's sockets"""
+    return manager.get_telemetry()
+
+@router.get("/police/incidents/nearby-tourists")
+async def get_nearby_tourists(
+    lat: float,
+    lng: float,
+    k: int = TOURIST_PROXIMITY_DEFAULT_K,
+    max_age: int = TOURIST_PROXIMITY_MAX_AGE,
+    max_distance_m: Optional[float] = None,
+    exclude_tourist_id: Optional[int] = None,
+    current_user: User = Depends(require_role("police"))
+):
+    """Tourists nearest to an incident location, nearest first; max_age is in seconds"""
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="lat/lng out of range"
+        )
+    return {
+        "location": {"lat": lat, "lng": lng},
+        "tourists": tourist_proximity_index.nearest_tourists(
+            lat, lng, max(0, min(k, 100)), max_age, max_distance_m, exclude_tourist_id
+        )
+    }
+
+@router.get("/police/dashboard/heatmap")
+async def get_heatmap_metadata(
+    current_user: User = Depends(require_role("police"))
+):
+    """Heatmap layers, time windows, zoom range and tile formats"""
+    return heatmap_tiles.get_metadata()
+
+@router.get("/police/dashboard/heatmap/{layer}/{window}/{z}/{x}/{y}")
+async def get_heatmap_tile(
+    layer: str,
+    window: str,
+    z: int,
+    x: int,
+    y: int,
+    format: str = "png",
+    scale: Optional[float] = None,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(require_role("police"))
+):
+    """Pre-aggregated density tile.
+    
+    format=png returns a coloured 256 px tile; scale is the bin weight shown at
+    full intensity and defaults to the heaviest bin of the zoom level, so
+    neighbouring tiles match. format=bin returns the raw bin weights as
+    little-endian float32, row-major from the tile's north-west corner.
+    Empty tiles are 204 No Content.
+    """
+    if format not in ("png", "bin"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="format must be png or bin"
+        )
+    try:
+        grid = heatmap_tiles.grid(layer, window, z, x, y)
+        if grid is None:
+            return Response(status_code=status.HTTP_204_NO_CONTENT,
+                            headers={"Cache-Control": f"private, max-age={HEATMAP_TILE_MAX_AGE}"})
+        if format == "png":
+            body = heatmap_tiles.render_png(grid, scale or heatmap_tiles.scale(layer, window, z))
+            media_type = "image/png"
+        else:
+            body = grid.astype("<f4").tobytes()
+            media_type = "application/octet-stream"
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    headers = {
+        "Cache-Control": f"private, max-age={HEATMAP_TILE_MAX_AGE}",
+        "ETag": f'"{heatmap_tiles.etag(body)}"',
+        "X-Heatmap-Bins": str(grid.shape[0])
+    }
+    if if_none_match == headers["ETag"]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
 # Tourism Department Dashboard Routes
 @router.get("/tourism/dashboard/stats")
 async def get_tourism_stats(
-    current_user: User = Depends(require_role("tourism_authority")),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(require_role("tourism_authority"))
 ):
     """Get comprehensive tourism statistics for department dashboard"""
     try:
-        from datetime import datetime, timedelta
-        
-        # Calculate various statistics
-        total_tourists = db.query(TouristProfile).count()
-        
-        # Active tourists (updated within last 24 hours)
-        recent_time = datetime.now() - timedelta(hours=24)
-        active_tourists = db.query(TouristProfile).filter(
-            TouristProfile.last_location_update >= recent_time
-        ).count()
-        
-        # High risk tourists (safety score < 70)
-        high_risk_tourists = db.query(TouristProfile).filter(
-            TouristProfile.safety_score < 70
-        ).count()
-        
-        # Safe tourists (safety score >= 80)
-        safe_tourists = db.query(TouristProfile).filter(
-            TouristProfile.safety_score >= 80
-        ).count()
-        
-        # Today's arrivals and departures (mock data for now)
-        today = datetime.now().date()
-        new_arrivals_today = db.query(TouristProfile).filter(
-            TouristProfile.created_at >= today
-        ).count()
-        
-        # KYC pending count
-        kyc_pending = db.query(TouristProfile).filter(
-            TouristProfile.kyc_status == "pending"
-        ).count()
-        
-        # Calculate average safety score
-        avg_safety_result = db.query(func.avg(TouristProfile.safety_score)).scalar()
-        avg_safety_score = float(avg_safety_result) if avg_safety_result else 0.0
-        
-        return {
-            "total_tourists": total_tourists,
-            "active_tourists": active_tourists,
-            "high_risk_tourists": high_risk_tourists,
-            "safe_tourists": safe_tourists,
-            "new_arrivals_today": new_arrivals_today,
-            "departures_today": 0,  # Mock data
-            "avg_safety_score": avg_safety_score,
-            "kyc_pending": kyc_pending
-        }
+        # Counters are kept current from profile changes and location pings
+        return await tourism_stats.get_stats()
         
     except Exception as e:
         raise HTTPException(
@@ -602,6 +959,13 @@ async def generate_efir(
         
         report_id = f"EFIR{datetime.now().strftime('%Y%m%d%H%M%S')}"
         
+        last_known_location = efir_data.get("last_known_location") or {}
+        nearby_tourists = []
+        if last_known_location.get("lat") is not None and last_known_location.get("lng") is not None:
+            nearby_tourists = tourist_proximity_index.nearest_tourists(
+                last_known_location["lat"], last_known_location["lng"], exclude=efir_data.get("tourist_id")
+            )
+        
         # Create alert for missing person
         missing_person_alert = Alert(
             tourist_id=efir_data.get("tourist_id"),
@@ -614,12 +978,14 @@ async def generate_efir(
                 "efir_id": report_id,
                 "reported_by": efir_data.get("reported_by"),
                 "reporter_contact": efir_data.get("reporter_contact"),
-                "priority_level": efir_data.get("priority_level", "high")
+                "priority_level": efir_data.get("priority_level", "high"),
+                "nearby_tourist_ids": [tourist["tourist_id"] for tourist in nearby_tourists]
             }
         )
         
         db.add(missing_person_alert)
         db.commit()
+        heatmap_tiles.record_alert(missing_person_alert.location_lat, missing_person_alert.location_lng, "critical")
         
         # In real implementation, would also:
         # - Generate PDF report
@@ -632,6 +998,7 @@ async def generate_efir(
             "report_id": report_id,
             "message": "E-FIR generated successfully",
             "alert_id": missing_person_alert.id,
+            "nearby_tourists": nearby_tourists,
             "next_steps": [
                 "Investigation team has been notified",
                 "Search and rescue operations initiated",
@@ -646,6 +1013,34 @@ async def generate_efir(
             detail=f"Error generating E-FIR: {str(e)}"
         )
 
+@router.get("/tourism/exports/digital-id-records")
+async def export_digital_id_records(
+    format: str = "ndjson",
+    current_user: User = Depends(require_role("tourism_authority"))
+):
+    """Stream every digital ID record as NDJSON or CSV"""
+    statement = select(
+        TouristProfile.id.label("tourist_id"),
+        func.coalesce(User.full_name, "Unknown").label("name"),
+        TouristProfile.passport_number,
+        TouristProfile.nationality,
+        TouristProfile.blockchain_id,
+        func.coalesce(TouristProfile.kyc_status, "PENDING").label("kyc_status"),
+        TouristProfile.safety_score,
+        TouristProfile.digital_id_status,
+        TouristProfile.created_at,
+        TouristProfile.last_location_update
+    ).outerjoin(User, User.id == TouristProfile.user_id).filter(
+        TouristProfile.blockchain_id.isnot(None)
+    ).order_by(TouristProfile.id)
+    try:
+        return export_response(statement, format, "digital_id_records")
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
 @router.get("/tourism/dashboard/digital-id-records")
 async def get_digital_id_records(
     current_user: User = Depends(require_role("tourism_authority")),
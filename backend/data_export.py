@@ -0,0 +1,68 @@
+"""Streaming NDJSON/CSV exports
+
+An export statement is executed with a server-side cursor (yield_per) and its
+rows are serialized and sent EXPORT_CHUNK_ROWS at a time, so memory stays
+flat however many rows the export returns. The generator is synchronous;
+StreamingResponse iterates it in the threadpool, off the event loop.
+"""
+from typing import Any, Iterator, List
+from datetime import date, datetime
+from fastapi.responses import StreamingResponse
+from sqlalchemy.sql import Select
+from decouple import config
+import csv
+import enum
+import io
+import json
+from database import SessionLocal
+
+# Rows fetched from the cursor and sent per chunk
+EXPORT_CHUNK_ROWS = config("EXPORT_CHUNK_ROWS", default=1000, cast=int)
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def export_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+def iter_export(statement: Select, export_format: str, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """Encoded chunks of an export; the statement's column labels become the field names"""
+    db = SessionLocal()
+    try:
+        result = db.execute(statement.execution_options(yield_per=chunk_rows))
+        fields: List[str] = list(result.keys())
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if export_format == "csv" else None
+        if writer:
+            writer.writerow(fields)
+
+        for rows in result.partitions():
+            for row in rows:
+                values = [export_value(value) for value in row]
+                if writer:
+                    writer.writerow(values)
+                else:
+                    buffer.write(json.dumps(dict(zip(fields, values)), default=str))
+                    buffer.write("\n")
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+        # Header only, for an empty CSV export
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+    finally:
+        db.close()
+
+def export_response(statement: Select, export_format: str, filename: str) -> StreamingResponse:
+    """Stream an export as NDJSON or CSV"""
+    if export_format not in EXPORT_MEDIA_TYPES:
+        raise ValueError(f"Export format must be one of: {', '.join(EXPORT_MEDIA_TYPES)}")
+    return StreamingResponse(
+        iter_export(statement, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    )
@@ -15,6 +15,10 @@ engine = create_engine(
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# MongoDB settings, used by init_database
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+MONGODB_DATABASE = os.getenv("MONGODB_DATABASE", "securesafar")
+
 # Create Base class
 Base = declarative_base()
 
@@ -30,6 +34,7 @@ def get_db():
 class FakeMongoDB:
     def __init__(self):
         self.location_history = self
+        self.geofence_events = self
         
     async def insert_one(self, document):
         print(f"Mock MongoDB insert: {document}")
@@ -0,0 +1,249 @@
+"""Geofence engine benchmark and scaling harness
+
+Generates synthetic zone catalogues and point clouds and measures, for each
+containment strategy, index build time, Python-heap memory (peak and
+retained) and per-point / bulk throughput. Used to size nodes before loading a new state's zone catalogue.
+
+Usage:
+    python geofence_benchmark.py
+    python geofence_benchmark.py --zones 1000,10000,100000 --vertices 16,64 --points 50000
+    python geofence_benchmark.py --strategies strtree,grid --json results.json
+"""
+import argparse
+import gc
+import json
+import math
+import random
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+import numpy as np
+from shapely import contains_xy, points, prepare
+from shapely.geometry import Point, Polygon
+
+from geofence_index import EARTH_RADIUS_KM, ZoneSnapshot, build_zone
+
+# Rajasthan-sized bounding box (min_lng, min_lat, max_lng, max_lat)
+DEFAULT_BBOX = (69.5, 23.0, 78.3, 30.2)
+
+def format_optional(value, spec: str) -> str:
+    """Format a measurement that may be missing (e.g. no per-point samples)"""
+    return "-" if value is None else format(value, spec)
+
+def generate_zones(count: int, vertices: int, bbox: Tuple[float, float, float, float],
+                   min_radius_m: float, max_radius_m: float, seed: int) -> List[List[List[float]]]:
+    """Random star-shaped polygons (as [lng, lat] rings) scattered over the bbox"""
+    rng = random.Random(seed)
+    min_lng, min_lat, max_lng, max_lat = bbox
+    metres_per_degree = math.radians(1) * EARTH_RADIUS_KM * 1000
+    rings = []
+    for _ in range(count):
+        centre_lng = rng.uniform(min_lng, max_lng)
+        centre_lat = rng.uniform(min_lat, max_lat)
+        radius_m = rng.uniform(min_radius_m, max_radius_m)
+        cos_lat = math.cos(math.radians(centre_lat))
+        ring = []
+        for step in range(vertices):
+            angle = 2 * math.pi * step / vertices
+            reach = radius_m * rng.uniform(0.5, 1.0)
+            ring.append([
+                centre_lng + reach * math.cos(angle) / (metres_per_degree * cos_lat),
+                centre_lat + reach * math.sin(angle) / metres_per_degree
+            ])
+        ring.append(ring[0])
+        rings.append(ring)
+    return rings
+
+def generate_points(count: int, bbox: Tuple[float, float, float, float], seed: int) -> np.ndarray:
+    """Uniform random (lng, lat) points over the bbox"""
+    rng = np.random.default_rng(seed)
+    min_lng, min_lat, max_lng, max_lat = bbox
+    return np.column_stack([
+        rng.uniform(min_lng, max_lng, count),
+        rng.uniform(min_lat, max_lat, count)
+    ])
+
+class LinearScanStrategy:
+    """Test every polygon for every point (the original service behaviour)"""
+    name = "linear"
+
+    def __init__(self, rings: List[List[List[float]]]):
+        self.polygons = [Polygon(ring) for ring in rings]
+        for polygon in self.polygons:
+            prepare(polygon)
+
+    def locate(self, lng: float, lat: float) -> List[int]:
+        point = Point(lng, lat)
+        return [index for index, polygon in enumerate(self.polygons) if polygon.contains(point)]
+
+    def locate_bulk(self, coords: np.ndarray) -> int:
+        hits = 0
+        for polygon in self.polygons:
+            hits += int(contains_xy(polygon, coords[:, 0], coords[:, 1]).sum())
+        return hits
+
+class STRtreeStrategy:
+    """The service's own ZoneSnapshot: STRtree candidates, prepared polygon test"""
+    name = "strtree"
+
+    def __init__(self, rings: List[List[List[float]]]):
+        zones = {
+            f"zone_{index}": build_zone(index, f"Zone {index}", "monitored", ring)
+            for index, ring in enumerate(rings)
+        }
+        self.snapshot = ZoneSnapshot(zones, warning_distance_m=0)
+        self.view = self.snapshot.active_view()
+
+    def locate(self, lng: float, lat: float) -> List[int]:
+        return [zone["id"] for zone in self.snapshot.containing_zones(Point(lng, lat))]
+
+    def locate_bulk(self, coords: np.ndarray) -> int:
+        if self.view.index is None:
+            return 0
+        pairs = self.view.index.query(points(coords), predicate="within")
+        return int(pairs.shape[1])
+
+class GridStrategy:
+    """Uniform grid: each cell lists the polygons whose bounds overlap it"""
+    name = "grid"
+
+    def __init__(self, rings: List[List[List[float]]], cell_deg: float = 0.05):
+        self.cell_deg = cell_deg
+        self.polygons = [Polygon(ring) for ring in rings]
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for index, polygon in enumerate(self.polygons):
+            prepare(polygon)
+            min_x, min_y, max_x, max_y = polygon.bounds
+            for cell_x in range(int(math.floor(min_x / cell_deg)), int(math.floor(max_x / cell_deg)) + 1):
+                for cell_y in range(int(math.floor(min_y / cell_deg)), int(math.floor(max_y / cell_deg)) + 1):
+                    self.cells.setdefault((cell_x, cell_y), []).append(index)
+
+    def locate(self, lng: float, lat: float) -> List[int]:
+        candidates = self.cells.get((int(math.floor(lng / self.cell_deg)), int(math.floor(lat / self.cell_deg))), [])
+        point = Point(lng, lat)
+        return [index for index in candidates if self.polygons[index].contains(point)]
+
+    def locate_bulk(self, coords: np.ndarray) -> int:
+        cell_x = np.floor(coords[:, 0] / self.cell_deg).astype(np.int64)
+        cell_y = np.floor(coords[:, 1] / self.cell_deg).astype(np.int64)
+        order = np.lexsort((cell_y, cell_x))
+        keys = np.column_stack([cell_x[order], cell_y[order]])
+        starts = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+        hits = 0
+        for group in np.split(order, starts):
+            if not len(group):
+                continue
+            candidates = self.cells.get((int(cell_x[group[0]]), int(cell_y[group[0]])))
+            if not candidates:
+                continue
+            group_coords = coords[group]
+            for index in candidates:
+                hits += int(contains_xy(self.polygons[index], group_coords[:, 0], group_coords[:, 1]).sum())
+        return hits
+
+STRATEGIES = {
+    LinearScanStrategy.name: LinearScanStrategy,
+    STRtreeStrategy.name: STRtreeStrategy,
+    GridStrategy.name: GridStrategy
+}
+
+def run_case(strategy_name: str, rings: List[List[List[float]]], coords: np.ndarray,
+             per_point_samples: int) -> Dict:
+    """Build one strategy over one zone set and time its queries"""
+    gc.collect()
+    # Python-heap allocations made by the build (GEOS geometry memory is not
+    # traced): the peak while building and what the built index still holds.
+    # Tracing slows the build, so it is timed in a separate, untraced build.
+    tracemalloc.start()
+    strategy = STRATEGIES[strategy_name](rings)
+    retained_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del strategy
+    gc.collect()
+
+    started = time.perf_counter()
+    strategy = STRATEGIES[strategy_name](rings)
+    build_seconds = time.perf_counter() - started
+
+    sample = coords[:per_point_samples]
+    started = time.perf_counter()
+    for lng, lat in sample:
+        strategy.locate(lng, lat)
+    per_point_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    hits = strategy.locate_bulk(coords)
+    bulk_seconds = time.perf_counter() - started
+
+    return {
+        "strategy": strategy_name,
+        "build_seconds": round(build_seconds, 4),
+        "peak_memory_mb": round(peak_bytes / (1024 * 1024), 1),
+        "retained_memory_mb": round(retained_bytes / (1024 * 1024), 1),
+        "per_point_per_second": round(len(sample) / per_point_seconds) if len(sample) and per_point_seconds else None,
+        "per_point_us": round(per_point_seconds / len(sample) * 1e6, 2) if len(sample) else None,
+        "bulk_per_second": round(len(coords) / bulk_seconds) if bulk_seconds else None,
+        "bulk_hits": hits
+    }
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark geofence containment strategies")
+    parser.add_argument("--zones", type=parse_int_list, default=[10, 100, 1000, 10000, 100000],
+                        help="Comma-separated zone counts")
+    parser.add_argument("--vertices", type=parse_int_list, default=[8, 64],
+                        help="Comma-separated vertex counts per polygon")
+    parser.add_argument("--points", type=int, default=20000, help="Points in the cloud for bulk runs")
+    parser.add_argument("--per-point-samples", type=int, default=2000,
+                        help="Points used for the per-point (one call per ping) timing")
+    parser.add_argument("--strategies", default="linear,strtree,grid",
+                        help="Comma-separated strategies: " + ",".join(STRATEGIES))
+    parser.add_argument("--linear-limit", type=int, default=10000,
+                        help="Skip the linear scan above this many zones")
+    parser.add_argument("--bbox", default=",".join(str(value) for value in DEFAULT_BBOX),
+                        help="min_lng,min_lat,max_lng,max_lat of the synthetic region")
+    parser.add_argument("--min-radius-m", type=float, default=50.0)
+    parser.add_argument("--max-radius-m", type=float, default=1500.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    bbox = tuple(float(value) for value in args.bbox.split(","))
+    strategies = [name for name in args.strategies.split(",") if name]
+    for name in strategies:
+        if name not in STRATEGIES:
+            parser.error(f"Unknown strategy: {name}")
+
+    coords = generate_points(args.points, bbox, args.seed)
+    results = []
+    header = f"{'zones':>8} {'verts':>6} {'strategy':>9} {'build s':>9} {'peak MB':>8} {'kept MB':>8} {'us/point':>10} {'points/s':>11} {'bulk pts/s':>12} {'hits':>8}"
+    print(header)
+    print("-" * len(header))
+    for zone_count in args.zones:
+        for vertex_count in args.vertices:
+            rings = generate_zones(zone_count, vertex_count, bbox, args.min_radius_m,
+                                   args.max_radius_m, args.seed)
+            for name in strategies:
+                if name == LinearScanStrategy.name and zone_count > args.linear_limit:
+                    continue
+                result = run_case(name, rings, coords, args.per_point_samples)
+                result.update({"zones": zone_count, "vertices": vertex_count, "points": args.points})
+                results.append(result)
+                print(f"{zone_count:>8} {vertex_count:>6} {name:>9} {result['build_seconds']:>9.3f} "
+                      f"{result['peak_memory_mb']:>8.1f} {result['retained_memory_mb']:>8.1f} "
+                      f"{format_optional(result['per_point_us'], '>10.2f'):>10} "
+                      f"{format_optional(result['per_point_per_second'], '>11'):>11} "
+                      f"{format_optional(result['bulk_per_second'], '>12'):>12} "
+                      f"{result['bulk_hits']:>8}")
+            del rings
+
+    if args.json_path:
+        with open(args.json_path, "w") as output:
+            json.dump(results, output, indent=2)
+        print(f"Wrote {len(results)} results to {args.json_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""Geofence geometry and index primitives
+
+Zone construction, local metric projections, the weekly schedule index and the
+immutable ZoneSnapshot used for containment checks. This module has no
+database or service side effects, so shard worker processes can import it.
+"""
+from typing import List, Dict, Tuple, Optional, Callable
+from shapely import STRtree, transform, prepare, simplify
+from shapely.geometry import Point, Polygon, MultiPolygon, GeometryCollection, box
+from decouple import config
+import numpy as np
+import bisect
+import heapq
+import math
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+EARTH_RADIUS_KM = 6371
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+# Distance in metres from a restricted zone's boundary at which tourists are warned
+GEOFENCE_PROXIMITY_WARNING_M = config("GEOFENCE_PROXIMITY_WARNING_M", default=100.0, cast=float)
+
+# Time zone in which zone schedule windows are written
+GEOFENCE_SCHEDULE_TZ = ZoneInfo(config("GEOFENCE_SCHEDULE_TZ", default="Asia/Kolkata"))
+
+def local_metric_projection(lat: float, lng: float) -> Callable[[np.ndarray], np.ndarray]:
+    """Build an equirectangular lng/lat -> metres projection centred on a location"""
+    metres_per_degree = math.radians(1) * EARTH_RADIUS_KM * 1000
+    cos_lat = math.cos(math.radians(lat))
+
+    def to_metres(coords: np.ndarray) -> np.ndarray:
+        projected = np.empty_like(coords)
+        projected[:, 0] = (coords[:, 0] - lng) * metres_per_degree * cos_lat
+        projected[:, 1] = (coords[:, 1] - lat) * metres_per_degree
+        return projected
+
+    return to_metres
+
+def local_degrees_projection(lat: float, lng: float) -> Callable[[np.ndarray], np.ndarray]:
+    """Inverse of local_metric_projection: metres around a location back to lng/lat"""
+    metres_per_degree = math.radians(1) * EARTH_RADIUS_KM * 1000
+    cos_lat = math.cos(math.radians(lat))
+
+    def to_degrees(coords: np.ndarray) -> np.ndarray:
+        unprojected = np.empty_like(coords)
+        unprojected[:, 0] = coords[:, 0] / (metres_per_degree * cos_lat) + lng
+        unprojected[:, 1] = coords[:, 1] / metres_per_degree + lat
+        return unprojected
+
+    return to_degrees
+
+def buffer_in_metres(polygon: Polygon, distance_m: float) -> Polygon:
+    """Buffer a lng/lat polygon by a distance in metres, using a projection centred on it"""
+    centre = polygon.centroid
+    to_metres = local_metric_projection(centre.y, centre.x)
+    to_degrees = local_degrees_projection(centre.y, centre.x)
+    return transform(transform(polygon, to_metres).buffer(distance_m), to_degrees)
+
+def simplify_in_metres(polygon: Polygon, tolerance_m: float):
+    """Simplify a lng/lat polygon to a tolerance in metres, using a projection centred on it"""
+    centre = polygon.centroid
+    to_metres = local_metric_projection(centre.y, centre.x)
+    to_degrees = local_degrees_projection(centre.y, centre.x)
+    return transform(simplify(transform(polygon, to_metres), tolerance_m, preserve_topology=True), to_degrees)
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in metres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * 1000 * math.asin(min(1.0, math.sqrt(a)))
+
+def boundary_distance_m(polygon: Polygon, lat: float, lng: float) -> float:
+    """Distance in metres from a location to a polygon (0 inside it)"""
+    return transform(polygon, local_metric_projection(lat, lng)).distance(Point(0, 0))
+
+def search_box_around(lat: float, lng: float, radius_km: float) -> Polygon:
+    """Lng/lat bounding box that encloses a circle of radius_km around a location"""
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    lng_delta = lat_delta / max(math.cos(math.radians(lat)), 1e-6)
+    return box(lng - lng_delta, lat - lat_delta, lng + lng_delta, lat + lat_delta)
+
+def build_zone(zone_id: int, name: str, zone_type: str, coordinates: List,
+               schedule: Optional[List[Dict]] = None) -> Dict:
+    """Build an in-memory zone entry with its Shapely polygon.
+    
+    coordinates is either a single [lng, lat] ring or a list of rings
+    (exterior first, then holes) as produced by bulk imports. schedule is an
+    optional list of recurring windows (see schedule_intervals); None means
+    the zone is always in force.
+    """
+    if coordinates and isinstance(coordinates[0][0], (list, tuple)):
+        exterior, holes = coordinates[0], coordinates[1:]
+    else:
+        exterior, holes = coordinates, []
+    coords = [(lng, lat) for lng, lat in exterior]
+    interiors = [[(lng, lat) for lng, lat in hole] for hole in holes]
+    return {
+        "id": zone_id,
+        "name": name,
+        "type": zone_type,
+        "coordinates": coordinates,
+        "schedule": schedule,
+        "intervals": schedule_intervals(schedule) if schedule else None,
+        "polygon": Polygon(coords, interiors)
+    }
+
+def zone_record(zone: Dict) -> Dict:
+    """A zone entry without its geometry, for processes that only report zones"""
+    return {
+        "id": zone["id"],
+        "name": zone["name"],
+        "type": zone["type"],
+        "coordinates": zone["coordinates"],
+        "schedule": zone["schedule"],
+        "intervals": zone["intervals"],
+        "polygon": None
+    }
+
+def parse_clock(value: str) -> int:
+    """Minutes since midnight for an "HH:MM" string"""
+    hours, minutes = value.split(":")
+    total = int(hours) * 60 + int(minutes)
+    if not 0 <= total <= MINUTES_PER_DAY:
+        raise ValueError(f"Invalid time of day: {value}")
+    return total
+
+def minute_of_week(moment: datetime) -> int:
+    """Minutes since Monday 00:00 for a datetime"""
+    return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+def schedule_intervals(schedule: List[Dict]) -> List[Tuple[int, int]]:
+    """Minute-of-week [start, end) intervals for a zone's recurring windows.
+    
+    Each window is {"days": [0-6, Monday = 0], "start": "HH:MM", "end": "HH:MM"};
+    days defaults to every day, and an end at or before the start runs past
+    midnight into the next day (e.g. a 22:00-05:00 curfew). Times are
+    GEOFENCE_SCHEDULE_TZ wall-clock times.
+    """
+    intervals = []
+    for window in schedule:
+        start = parse_clock(window["start"])
+        end = parse_clock(window["end"])
+        duration = (end - start) % MINUTES_PER_DAY or MINUTES_PER_DAY
+        for day in window.get("days", range(7)):
+            begin = int(day) % 7 * MINUTES_PER_DAY + start
+            finish = begin + duration
+            if finish <= MINUTES_PER_WEEK:
+                intervals.append((begin, finish))
+            else:
+                # Wraps from Sunday night into Monday morning
+                intervals.append((begin, MINUTES_PER_WEEK))
+                intervals.append((0, finish - MINUTES_PER_WEEK))
+    return intervals
+
+class ScheduleIndex:
+    """Elementary-interval index over the week for scheduled zones.
+    
+    The week is cut at every window start and end; each segment between two
+    consecutive cuts stores the set of scheduled zones in force throughout it,
+    so the active set for a minute is one binary search away.
+    """
+    
+    def __init__(self, zone_intervals: Dict[str, List[Tuple[int, int]]]):
+        events: Dict[int, List[Tuple[str, int]]] = {0: []}
+        for key, intervals in zone_intervals.items():
+            for start, end in intervals:
+                events.setdefault(start, []).append((key, 1))
+                events.setdefault(end, []).append((key, -1))
+        
+        self.boundaries = sorted(events)
+        self.segments: List[frozenset] = []
+        counts: Dict[str, int] = {}
+        active = set()
+        for boundary in self.boundaries:
+            for key, delta in events[boundary]:
+                counts[key] = counts.get(key, 0) + delta
+                if counts[key] > 0:
+                    active.add(key)
+                else:
+                    active.discard(key)
+            self.segments.append(frozenset(active))
+    
+    def segment_at(self, minute: int) -> int:
+        """Index of the segment containing a minute of the week"""
+        return bisect.bisect_right(self.boundaries, minute) - 1
+
+class ZoneIndexView:
+    """Spatial indexes over the zones in force during a schedule segment.
+    
+    Besides the zone polygons, the view indexes the precomputed warning buffers
+    of restricted zones, so proximity checks are one extra index lookup.
+    """
+    
+    def __init__(self, zones: Dict[str, Dict], buffers: Dict[str, Polygon], keys: List[str]):
+        self.keys = keys
+        self.index = STRtree([zones[key]["polygon"] for key in keys]) if keys else None
+        self.buffer_keys = [key for key in keys if key in buffers]
+        self.buffer_index = (
+            STRtree([buffers[key] for key in self.buffer_keys]) if self.buffer_keys else None
+        )
+
+def polygon_rings(polygon: Polygon) -> List:
+    """Zone coordinates for a polygon: its exterior ring alone, or followed by its holes"""
+    exterior = [[x, y] for x, y in polygon.exterior.coords]
+    if not polygon.interiors:
+        return exterior
+    return [exterior] + [[[x, y] for x, y in ring.coords] for ring in polygon.interiors]
+
+def polygonal_parts(geometry) -> List[Polygon]:
+    """Non-empty polygons contained in a (possibly repaired) geometry"""
+    if isinstance(geometry, Polygon):
+        return [] if geometry.is_empty else [geometry]
+    if isinstance(geometry, (MultiPolygon, GeometryCollection)):
+        parts = []
+        for part in geometry.geoms:
+            parts.extend(polygonal_parts(part))
+        return parts
+    return []
+
+class ZoneSnapshot:
+    """Immutable zone set with its schedule index and prepared polygons.
+    
+    A snapshot is never modified after construction; reloads build a new one and
+    swap the service's reference, so readers holding the old one stay consistent.
+    The spatial index of every schedule segment is built with the snapshot (off
+    the event loop, where reloads run), segments with the same zones in force
+    sharing one, so crossing a schedule boundary only selects another index.
+    """
+    
+    def __init__(self, zones: Dict[str, Dict], version: Optional[Tuple] = None,
+                 warning_distance_m: float = GEOFENCE_PROXIMITY_WARNING_M):
+        self.zones = zones
+        self.version = version
+        self.always_keys = []
+        # Zone key -> warning buffer of a restricted zone. Kept here rather than on the
+        # zone entries, which may be shared with the snapshot being replaced.
+        self.buffers: Dict[str, Polygon] = {}
+        scheduled = {}
+        for zone_id, zone in zones.items():
+            if zone["polygon"] is None:
+                continue
+            prepare(zone["polygon"])
+            if zone["type"] == "restricted" and warning_distance_m > 0:
+                buffer = buffer_in_metres(zone["polygon"], warning_distance_m)
+                prepare(buffer)
+                self.buffers[zone_id] = buffer
+            if zone.get("intervals"):
+                scheduled[zone_id] = zone["intervals"]
+            else:
+                self.always_keys.append(zone_id)
+        self.schedule = ScheduleIndex(scheduled)
+        views: Dict[frozenset, ZoneIndexView] = {}
+        self.views: List[ZoneIndexView] = []  # By schedule segment
+        for active in self.schedule.segments:
+            if active not in views:
+                views[active] = ZoneIndexView(zones, self.buffers, self.always_keys + sorted(active))
+            self.views.append(views[active])
+    
+    def active_view(self, moment: Optional[datetime] = None) -> ZoneIndexView:
+        """Spatial index over the zones in force at a moment (default: now).
+
+        Naive moments are taken as GEOFENCE_SCHEDULE_TZ wall-clock time.
+        """
+        local = datetime.now(GEOFENCE_SCHEDULE_TZ) if moment is None else moment
+        if local.tzinfo is not None:
+            local = local.astimezone(GEOFENCE_SCHEDULE_TZ)
+        return self.views[self.schedule.segment_at(minute_of_week(local))]
+    
+    def containing_zones(self, point: Point, moment: Optional[datetime] = None) -> List[Dict]:
+        """Zones in force whose polygon contains the point"""
+        view = self.active_view(moment)
+        if view.index is None:
+            return []
+        zones = []
+        for position in view.index.query(point):
+            zone = self.zones[view.keys[position]]
+            if zone["polygon"].contains(point):
+                zones.append(zone)
+        return zones
+    
+    def buffered_zones(self, point: Point, moment: Optional[datetime] = None) -> List[Dict]:
+        """Restricted zones in force whose warning buffer contains the point"""
+        view = self.active_view(moment)
+        if view.buffer_index is None:
+            return []
+        zones = []
+        for position in view.buffer_index.query(point):
+            zone_key = view.buffer_keys[position]
+            if self.buffers[zone_key].contains(point):
+                zones.append(self.zones[zone_key])
+        return zones
+    
+    def nearest(self, lat: float, lng: float, k: int, radius_km: float) -> List[Tuple[float, str]]:
+        """(distance in km, zone key) of the k zones in force whose boundary is nearest, within radius_km.
+        
+        Candidates come from the spatial index; distances are measured to the polygon
+        itself (0 when the location is inside) in a metric projection around the location.
+        """
+        view = self.active_view()
+        if view.index is None or k <= 0:
+            return []
+        
+        to_metres = local_metric_projection(lat, lng)
+        origin = Point(0, 0)
+        scored = []
+        for position in view.index.query(search_box_around(lat, lng, radius_km)):
+            zone_key = view.keys[position]
+            distance_km = transform(self.zones[zone_key]["polygon"], to_metres).distance(origin) / 1000
+            if distance_km <= radius_km:
+                scored.append((distance_km, zone_key))
+        return heapq.nsmallest(k, scored)
@@ -0,0 +1,212 @@
+"""Region-sharded geofence evaluation across worker processes
+
+The zone set is cut into square lng/lat tiles and every tile is owned by one
+shard process, which holds only the zones overlapping its tiles. Pings are
+routed to the shard owning their tile and the results are mapped back to the
+caller's zone entries. The shards hold all zone geometry: the routing process
+keeps only geometry-free zone records.
+"""
+from typing import List, Dict, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor
+import heapq
+from shapely.geometry import Point
+from decouple import config
+import asyncio
+import math
+import multiprocessing
+from geofence_index import (
+    ZoneSnapshot, boundary_distance_m, build_zone, zone_record, GEOFENCE_PROXIMITY_WARNING_M
+)
+
+# Number of shard worker processes; 0 evaluates geofences in the request process
+GEOFENCE_SHARDS = config("GEOFENCE_SHARDS", default=0, cast=int)
+
+# Tile edge in degrees used to route pings and assign zones to shards
+GEOFENCE_TILE_DEG = config("GEOFENCE_TILE_DEG", default=1.0, cast=float)
+
+def tile_key(lat: float, lng: float, tile_deg: float = GEOFENCE_TILE_DEG) -> Tuple[int, int]:
+    """Tile containing a location"""
+    return (math.floor(lng / tile_deg), math.floor(lat / tile_deg))
+
+def shard_for_tile(tile: Tuple[int, int], shard_count: int) -> int:
+    """Stable tile -> shard assignment (independent of Python's hash seed)"""
+    x, y = tile
+    return ((x * 73856093) ^ (y * 19349663)) % shard_count
+
+# State of a shard worker process, set by init_shard
+shard_snapshot: Optional[ZoneSnapshot] = None
+
+def init_shard(records: List[Dict], warning_distance_m: float):
+    """Build the shard's own snapshot from the zone records it owns"""
+    global shard_snapshot
+    zones = {
+        f"zone_{record['id']}": build_zone(
+            record["id"], record["name"], record["type"], record["coordinates"], record["schedule"]
+        )
+        for record in records
+    }
+    shard_snapshot = ZoneSnapshot(zones, warning_distance_m=warning_distance_m)
+
+def shard_zone_count() -> int:
+    """Number of zones held by this shard (also used to warm the process up)"""
+    return len(shard_snapshot.zones) if shard_snapshot else 0
+
+def locate_batch(pings: List[Tuple[float, float]]) -> List[Tuple[List[int], List[Tuple[int, float]]]]:
+    """Ids of the containing zones, and (id, distance in metres) of the warning-buffer
+    zones, for each (lat, lng) ping"""
+    results = []
+    for lat, lng in pings:
+        point = Point(lng, lat)
+        results.append((
+            [zone["id"] for zone in shard_snapshot.containing_zones(point)],
+            [(zone["id"], boundary_distance_m(zone["polygon"], lat, lng))
+             for zone in shard_snapshot.buffered_zones(point)]
+        ))
+    return results
+
+def nearest_in_shard(lat: float, lng: float, k: int, radius_km: float) -> List[Tuple[float, int]]:
+    """(distance in km, id) of this shard's k nearest zones within radius_km"""
+    return [
+        (distance_km, shard_snapshot.zones[zone_key]["id"])
+        for distance_km, zone_key in shard_snapshot.nearest(lat, lng, k, radius_km)
+    ]
+
+class ShardGeneration:
+    """Shard processes built from one snapshot, plus that snapshot's zone records by id"""
+
+    def __init__(self, executors: List[ProcessPoolExecutor], zones_by_id: Dict[int, Dict]):
+        self.executors = executors
+        self.zones_by_id = zones_by_id
+
+    def shutdown(self):
+        # Calls already submitted still complete before the processes exit
+        for executor in self.executors:
+            executor.shutdown(wait=False)
+
+class ShardedGeofenceRouter:
+    """Routes containment checks to per-region shard processes"""
+
+    def __init__(self, shard_count: int = GEOFENCE_SHARDS, tile_deg: float = GEOFENCE_TILE_DEG,
+                 warning_distance_m: float = GEOFENCE_PROXIMITY_WARNING_M):
+        self.shard_count = shard_count
+        self.tile_deg = tile_deg
+        self.warning_distance_m = warning_distance_m
+        # Spawned (not forked) so shards do not inherit the parent's zones and sockets
+        self.mp_context = multiprocessing.get_context("spawn")
+        self.generation: Optional[ShardGeneration] = None
+
+    def shards_for_zone(self, geometry) -> List[int]:
+        """Shards owning a tile overlapped by a zone's geometry (its warning buffer, if it has one)"""
+        min_x, min_y, max_x, max_y = geometry.bounds
+        shards = set()
+        for x in range(math.floor(min_x / self.tile_deg), math.floor(max_x / self.tile_deg) + 1):
+            for y in range(math.floor(min_y / self.tile_deg), math.floor(max_y / self.tile_deg) + 1):
+                shards.add(shard_for_tile((x, y), self.shard_count))
+                if len(shards) == self.shard_count:
+                    return list(shards)
+        return list(shards)
+
+    def rebuild(self, snapshot: ZoneSnapshot) -> ZoneSnapshot:
+        """Start a new generation of shard processes for a snapshot and retire the old one.
+        
+        Blocks until the new shards have built their indexes, so call it off the
+        event loop; pings keep going to the old generation until the swap. Returns
+        the geometry-free snapshot for the routing process to keep.
+        """
+        records: List[List[Dict]] = [[] for _ in range(self.shard_count)]
+        zones_by_id = {}
+        record_zones = {}
+        for zone_key, zone in snapshot.zones.items():
+            record = zone_record(zone)
+            record_zones[zone_key] = record
+            if zone["polygon"] is None:
+                continue
+            zones_by_id[zone["id"]] = record
+            for shard in self.shards_for_zone(snapshot.buffers.get(zone_key) or zone["polygon"]):
+                records[shard].append(record)
+
+        executors = []
+        try:
+            for shard_records in records:
+                executors.append(ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=self.mp_context,
+                    initializer=init_shard,
+                    initargs=(shard_records, self.warning_distance_m)
+                ))
+            # Start the processes and build their indexes before any ping is routed to them
+            warm_up = [executor.submit(shard_zone_count) for executor in executors]
+            for future in warm_up:
+                future.result()
+        except Exception:
+            for executor in executors:
+                executor.shutdown(wait=False)
+            raise
+
+        previous = self.generation
+        self.generation = ShardGeneration(executors, zones_by_id)
+        if previous:
+            previous.shutdown()
+        print(f"Sharded {len(zones_by_id)} geofence zones across {self.shard_count} processes")
+        return ZoneSnapshot(record_zones, snapshot.version)
+
+    async def locate_many(self, pings: List[Tuple[float, float]]) -> List[Tuple[List[Dict], List[Dict]]]:
+        """Containing and warning-buffer zones for each (lat, lng) ping.
+
+        Pings are grouped by owning shard and each group is sent as one batch;
+        the shards run in parallel and results come back in ping order.
+        """
+        generation = self.generation
+        positions_by_shard: Dict[int, List[int]] = {}
+        for position, (lat, lng) in enumerate(pings):
+            shard = shard_for_tile(tile_key(lat, lng, self.tile_deg), self.shard_count)
+            positions_by_shard.setdefault(shard, []).append(position)
+
+        loop = asyncio.get_running_loop()
+        shards = list(positions_by_shard)
+        batches = await asyncio.gather(*[
+            loop.run_in_executor(
+                generation.executors[shard],
+                locate_batch,
+                [pings[position] for position in positions_by_shard[shard]]
+            )
+            for shard in shards
+        ])
+
+        results: List[Tuple[List[Dict], List[Dict]]] = [([], []) for _ in pings]
+        for shard, batch in zip(shards, batches):
+            for position, (inside_ids, buffered) in zip(positions_by_shard[shard], batch):
+                results[position] = (
+                    [generation.zones_by_id[zone_id] for zone_id in inside_ids],
+                    # Buffered zones carry the distance the shard measured to them
+                    [dict(generation.zones_by_id[zone_id], distance_m=distance_m) for zone_id, distance_m in buffered]
+                )
+        return results
+
+    async def locate(self, lat: float, lng: float) -> Tuple[List[Dict], List[Dict]]:
+        """Containing and warning-buffer zones for a single ping"""
+        return (await self.locate_many([(lat, lng)]))[0]
+
+    async def nearest(self, lat: float, lng: float, k: int, radius_km: float) -> List[Tuple[float, Dict]]:
+        """(distance in km, zone record) of the k nearest zones within radius_km, across all shards"""
+        generation = self.generation
+        loop = asyncio.get_running_loop()
+        per_shard = await asyncio.gather(*[
+            loop.run_in_executor(executor, nearest_in_shard, lat, lng, k, radius_km)
+            for executor in generation.executors
+        ])
+        # A zone spanning several shards' tiles is reported by each of them
+        distances: Dict[int, float] = {}
+        for scored in per_shard:
+            for distance_km, zone_id in scored:
+                distances[zone_id] = distance_km
+        return [
+            (distance_km, generation.zones_by_id[zone_id])
+            for distance_km, zone_id in heapq.nsmallest(k, ((d, zone_id) for zone_id, d in distances.items()))
+        ]
+
+    def close(self):
+        """Stop all shard processes"""
+        if self.generation:
+            self.generation.shutdown()
+            self.generation = None
@@ -1,88 +1,242 @@
 from typing import List, Dict, Tuple, Optional
-from shapely.geometry import Point, Polygon
+from shapely import make_valid, get_num_coordinates
+from shapely.geometry import Point, shape
+from sqlalchemy import func, insert
+from decouple import config
+import numpy as np
+import asyncio
 import json
-import math
+import logging
 from datetime import datetime
-from database import async_mongo_db, sync_mongo_db
-from websocket_manager import ConnectionManager
+from database import SessionLocal, get_mongo_db
+from websocket_manager import ConnectionManager, manager
 from models import GeofenceZone, Alert
+from geofence_index import (
+    ZoneSnapshot, boundary_distance_m, build_zone, haversine_m, polygon_rings, polygonal_parts,
+    schedule_intervals, simplify_in_metres
+)
+from geofence_sharding import ShardedGeofenceRouter, GEOFENCE_SHARDS, GEOFENCE_TILE_DEG
+from heatmap_tiles import heatmap_tiles
+from alert_aggregation import alert_aggregator
+
+# Seconds between zone-set version checks against the database
+GEOFENCE_UPDATE_INTERVAL = config("GEOFENCE_UPDATE_INTERVAL", default=30, cast=int)
+
+# Bounded violation queue drained by background workers
+GEOFENCE_QUEUE_SIZE = config("GEOFENCE_QUEUE_SIZE", default=10000, cast=int)
+GEOFENCE_QUEUE_WORKERS = config("GEOFENCE_QUEUE_WORKERS", default=4, cast=int)
+
+# Per-sink timeouts in seconds for violation processing
+GEOFENCE_SINK_TIMEOUTS = {
+    "alert_record": 2.0,
+    "audit_store": 2.0,
+    "notifications": 1.0
+}
+
+# Default simplification tolerance in metres for bulk zone imports
+GEOFENCE_SIMPLIFY_TOLERANCE_M = config("GEOFENCE_SIMPLIFY_TOLERANCE_M", default=5.0, cast=float)
+
+PROXIMITY_VIOLATION_TYPE = "restricted_zone_proximity"
+
+logger = logging.getLogger(__name__)
 
 # Simple distance calculation function
 def calculate_distance_km(point1: Tuple[float, float], point2: Tuple[float, float]) -> float:
     """Calculate distance between two points using haversine formula"""
     lat1, lon1 = point1
     lat2, lon2 = point2
-    R = 6371  # Earth's radius in km
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    distance = R * c
-    return distance
+    return haversine_m(lat1, lon1, lat2, lon2) / 1000
+
+# Demo zones used when the geofence_zones table is empty or unreachable
+SAMPLE_GEOFENCE_ZONES = [
+    {
+        "id": 1,
+        "name": "Government District",
+        "type": "restricted",
+        "coordinates": [
+            [77.2090, 28.6139],  # Delhi coordinates example
+            [77.2100, 28.6139],
+            [77.2100, 28.6149],
+            [77.2090, 28.6149],
+            [77.2090, 28.6139]
+        ]
+    },
+    {
+        "id": 2,
+        "name": "Tourist Hub",
+        "type": "safe",
+        "coordinates": [
+            [77.2000, 28.6100],
+            [77.2050, 28.6100],
+            [77.2050, 28.6150],
+            [77.2000, 28.6150],
+            [77.2000, 28.6100]
+        ]
+    },
+    {
+        "id": 3,
+        "name": "Hospital District",
+        "type": "emergency",
+        "coordinates": [
+            [77.1950, 28.6050],
+            [77.1980, 28.6050],
+            [77.1980, 28.6080],
+            [77.1950, 28.6080],
+            [77.1950, 28.6050]
+        ]
+    }
+]
 
 class GeofencingService:
     def __init__(self, websocket_manager: Optional[ConnectionManager] = None):
         self.websocket_manager = websocket_manager
-        self.active_zones = {}  # Cache for active geofence zones
+        self.snapshot = ZoneSnapshot({})  # Swapped as a whole on reload
+        self.zone_watcher_task: Optional[asyncio.Task] = None
+        self.violation_queue: Optional[asyncio.Queue] = None
+        self.violation_workers: List[asyncio.Task] = []
+        self.dropped_violations = 0
+        self.proximity_state: Dict[int, frozenset] = {}  # tourist_id -> zone ids whose buffer they are in
+        self.shard_router: Optional[ShardedGeofenceRouter] = None
         self.load_geofence_zones()
     
+    @property
+    def active_zones(self) -> Dict[str, Dict]:
+        """Zones of the current snapshot (read-only)"""
+        return self.snapshot.zones
+    
+    def get_zone_set_version(self) -> Optional[Tuple]:
+        """Version of the zone set the current snapshot was built from"""
+        return self.snapshot.version
+    
+    def fetch_zone_set_version(self) -> Tuple:
+        """Read the zone-set version from the database.
+        
+        The version is (row count, max id, last update), which changes whenever a
+        zone is inserted, deleted or updated, and costs one aggregate query.
+        """
+        db = SessionLocal()
+        try:
+            count, max_id, last_update = db.query(
+                func.count(GeofenceZone.id),
+                func.max(GeofenceZone.id),
+                func.max(func.coalesce(GeofenceZone.updated_at, GeofenceZone.created_at))
+            ).one()
+            return (count, max_id, str(last_update))
+        finally:
+            db.close()
+    
+    def build_snapshot_from_database(self) -> ZoneSnapshot:
+        """Read active zones from the database and build a new snapshot"""
+        db = SessionLocal()
+        try:
+            version = self.fetch_zone_set_version()
+            records = db.query(GeofenceZone).filter(GeofenceZone.is_active == True).all()
+        finally:
+            db.close()
+        
+        zones = {}
+        for record in records:
+            try:
+                zones[f"zone_{record.id}"] = build_zone(
+                    record.id, record.name, record.zone_type, json.loads(record.coordinates),
+                    record.schedule
+                )
+            except Exception as e:
+                print(f"Skipping invalid geofence zone {record.id}: {e}")
+        return ZoneSnapshot(zones, version)
+    
+    def load_snapshot(self) -> ZoneSnapshot:
+        """Build a snapshot from the database, or of the demo zones if none were ever defined"""
+        snapshot = self.build_snapshot_from_database()
+        if snapshot.version[0] == 0:
+            return self.build_sample_snapshot(snapshot.version)
+        return snapshot
+    
     def load_geofence_zones(self):
         """Load all active geofence zones from database"""
         try:
-            # In a real implementation, load from PostgreSQL
-            # For now, create some sample zones
-            self.active_zones = {
-                "restricted_zone_1": {
-                    "id": 1,
-                    "name": "Government District",
-                    "type": "restricted",
-                    "coordinates": [
-                        [77.2090, 28.6139],  # Delhi coordinates example
-                        [77.2100, 28.6139],
-                        [77.2100, 28.6149],
-                        [77.2090, 28.6149],
-                        [77.2090, 28.6139]
-                    ],
-                    "polygon": None
-                },
-                "safe_zone_1": {
-                    "id": 2,
-                    "name": "Tourist Hub",
-                    "type": "safe",
-                    "coordinates": [
-                        [77.2000, 28.6100],
-                        [77.2050, 28.6100],
-                        [77.2050, 28.6150],
-                        [77.2000, 28.6150],
-                        [77.2000, 28.6100]
-                    ],
-                    "polygon": None
-                },
-                "emergency_zone_1": {
-                    "id": 3,
-                    "name": "Hospital District",
-                    "type": "emergency",
-                    "coordinates": [
-                        [77.1950, 28.6050],
-                        [77.1980, 28.6050],
-                        [77.1980, 28.6080],
-                        [77.1950, 28.6080],
-                        [77.1950, 28.6050]
-                    ],
-                    "polygon": None
-                }
-            }
-            
-            # Create Shapely polygons for efficient point-in-polygon testing
-            for zone_id, zone in self.active_zones.items():
-                coords = [(lng, lat) for lng, lat in zone["coordinates"]]
-                zone["polygon"] = Polygon(coords)
-            
-            print(f"Loaded {len(self.active_zones)} geofence zones")
-            
-        except Exception as e:
-            print(f"Error loading geofence zones: {e}")
-            self.active_zones = {}
+            snapshot = self.load_snapshot()
+        except Exception:
+            # Most often a database older than the models: init_database.py adds the missing columns.
+            # The demo zones are served until the zone watcher manages a reload.
+            logger.exception("Could not load geofence zones from the database; serving the sample zones instead")
+            snapshot = self.build_sample_snapshot()
+        
+        self.set_snapshot(snapshot)
+        print(f"Loaded {len(snapshot.zones)} geofence zones")
+    
+    def build_sample_snapshot(self, version: Optional[Tuple] = None) -> ZoneSnapshot:
+        """Build a snapshot of the demo zones"""
+        zones = {}
+        for sample in SAMPLE_GEOFENCE_ZONES:
+            zones[f"{sample['type']}_zone_{sample['id']}"] = build_zone(
+                sample["id"], sample["name"], sample["type"], sample["coordinates"]
+            )
+        return ZoneSnapshot(zones, version)
+    
+    async def reload_if_changed(self) -> bool:
+        """Rebuild the snapshot off the event loop if the zone-set version moved"""
+        version = await asyncio.to_thread(self.fetch_zone_set_version)
+        if version == self.snapshot.version:
+            return False
+        
+        await self.reload()
+        return True
+    
+    async def reload(self):
+        """Rebuild the snapshot from the database off the event loop"""
+        snapshot = await asyncio.to_thread(self.load_snapshot)
+        await asyncio.to_thread(self.set_snapshot, snapshot)
+        print(f"Reloaded {len(snapshot.zones)} geofence zones (version {snapshot.version})")
+    
+    def set_snapshot(self, snapshot: ZoneSnapshot):
+        """Swap in a new snapshot. With sharding enabled it is re-sharded first (blocking),
+        and only its geometry-free records are kept in this process."""
+        if self.shard_router is not None:
+            snapshot = self.shard_router.rebuild(snapshot)
+        self.snapshot = snapshot
+    
+    async def enable_sharding(self, shard_count: int = GEOFENCE_SHARDS, tile_deg: float = GEOFENCE_TILE_DEG):
+        """Evaluate containment in region-sharded worker processes"""
+        router = ShardedGeofenceRouter(shard_count, tile_deg)
+        snapshot = await asyncio.to_thread(router.rebuild, self.snapshot)
+        self.shard_router = router
+        self.snapshot = snapshot
+    
+    def disable_sharding(self):
+        """Stop the shard processes; the zone watcher then reloads the zones in-process"""
+        router, self.shard_router = self.shard_router, None
+        if router is not None:
+            router.close()
+            # The records kept while sharded have no geometry to evaluate
+            self.snapshot = ZoneSnapshot({})
+    
+    async def locate_zones(self, lat: float, lng: float) -> Tuple[List[Dict], List[Dict]]:
+        """Zones containing a location and restricted zones whose warning buffer contains it"""
+        if self.shard_router is not None:
+            try:
+                return await self.shard_router.locate(lat, lng)
+            except Exception:
+                logger.exception("Error in geofence shard; location not checked")
+                return [], []
+        
+        tourist_point = Point(lng, lat)
+        snapshot = self.snapshot
+        return snapshot.containing_zones(tourist_point), snapshot.buffered_zones(tourist_point)
+    
+    async def watch_zone_versions(self, interval: int = GEOFENCE_UPDATE_INTERVAL):
+        """Poll the zone-set version and reload in the background when it changes"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload_if_changed()
+            except Exception:
+                logger.exception("Could not reload geofence zones from the database")
+    
+    def start_zone_watcher(self):
+        """Start the background zone watcher in this worker process"""
+        if self.zone_watcher_task is None or self.zone_watcher_task.done():
+            self.zone_watcher_task = asyncio.create_task(self.watch_zone_versions())
     
     async def check_geofence_violations(self, tourist_data: Dict) -> List[Dict]:
         """Check if tourist location violates any geofence zones"""
@@ -96,30 +250,67 @@ class GeofencingService:
             if not lat or not lng or not tourist_id:
                 return violations
             
-            tourist_point = Point(lng, lat)
+            inside_zones, buffered_zones = await self.locate_zones(lat, lng)
+            for zone in inside_zones:
+                violation = {
+                    "tourist_id": tourist_id,
+                    "zone_id": zone["id"],
+                    "zone_name": zone["name"],
+                    "zone_type": zone["type"],
+                    "location": {"lat": lat, "lng": lng},
+                    "timestamp": datetime.now().isoformat(),
+                    "violation_type": self.get_violation_type(zone["type"])
+                }
+                violations.append(violation)
             
-            for zone_id, zone in self.active_zones.items():
-                if zone["polygon"] and zone["polygon"].contains(tourist_point):
-                    violation = {
-                        "tourist_id": tourist_id,
-                        "zone_id": zone["id"],
-                        "zone_name": zone["name"],
-                        "zone_type": zone["type"],
-                        "location": {"lat": lat, "lng": lng},
-                        "timestamp": datetime.now().isoformat(),
-                        "violation_type": self.get_violation_type(zone["type"])
-                    }
-                    violations.append(violation)
+            violations.extend(self.check_proximity_warnings(
+                tourist_id, lat, lng, buffered_zones, inside_zones
+            ))
             
-            # Process violations
+            # Hand violations to the background workers; the request does not wait on sinks
             for violation in violations:
-                await self.process_geofence_violation(violation)
+                self.enqueue_violation(violation)
             
         except Exception as e:
             print(f"Error checking geofence violations: {e}")
         
         return violations
     
+    def check_proximity_warnings(self, tourist_id: int, lat: float, lng: float,
+                                 buffered_zones: List[Dict], inside_zones: List[Dict]) -> List[Dict]:
+        """Warn when a tourist enters the buffer around a restricted zone.
+        
+        Only buffers the tourist was not already in on the previous ping produce a
+        warning; entering the zone itself is reported as a violation instead.
+        """
+        current = frozenset(zone["id"] for zone in buffered_zones)
+        previous = self.proximity_state.get(tourist_id, frozenset())
+        if current:
+            self.proximity_state[tourist_id] = current
+        else:
+            self.proximity_state.pop(tourist_id, None)
+        
+        inside_ids = {zone["id"] for zone in inside_zones}
+        warnings = []
+        for zone in buffered_zones:
+            if zone["id"] in previous or zone["id"] in inside_ids:
+                continue
+            # Shards measure the distance themselves, since this process has no zone geometry
+            distance_m = zone.get("distance_m")
+            if distance_m is None:
+                distance_m = boundary_distance_m(zone["polygon"], lat, lng)
+            warnings.append({
+                "tourist_id": tourist_id,
+                "zone_id": zone["id"],
+                "zone_name": zone["name"],
+                "zone_type": zone["type"],
+                "location": {"lat": lat, "lng": lng},
+                "distance_m": round(distance_m, 1),
+                "timestamp": datetime.now().isoformat(),
+                "violation_type": PROXIMITY_VIOLATION_TYPE
+            })
+        return warnings
+    
     def get_violation_type(self, zone_type: str) -> str:
         """Determine violation type based on zone type"""
         if zone_type == "restricted":
@@ -131,15 +322,65 @@ class GeofencingService:
         else:
             return "unknown_zone_entry"
     
+    def start_violation_workers(self, worker_count: int = GEOFENCE_QUEUE_WORKERS):
+        """Create the violation queue and its worker tasks in the running event loop"""
+        if self.violation_queue is None:
+            self.violation_queue = asyncio.Queue(maxsize=GEOFENCE_QUEUE_SIZE)
+        self.violation_workers = [task for task in self.violation_workers if not task.done()]
+        while len(self.violation_workers) < worker_count:
+            self.violation_workers.append(asyncio.create_task(self.violation_worker()))
+    
+    async def stop_violation_workers(self, drain: bool = True):
+        """Optionally wait for queued violations, then cancel the workers"""
+        if drain and self.violation_queue is not None:
+            await self.violation_queue.join()
+        for task in self.violation_workers:
+            task.cancel()
+        await asyncio.gather(*self.violation_workers, return_exceptions=True)
+        self.violation_workers = []
+    
+    def enqueue_violation(self, violation: Dict) -> bool:
+        """Queue a violation for processing, dropping it if the queue is full"""
+        if not self.violation_workers:
+            self.start_violation_workers()
+        try:
+            self.violation_queue.put_nowait(violation)
+            return True
+        except asyncio.QueueFull:
+            self.dropped_violations += 1
+            print(f"Geofence violation queue full, dropped violation for tourist {violation['tourist_id']}")
+            return False
+    
+    async def violation_worker(self):
+        """Drain the violation queue"""
+        while True:
+            violation = await self.violation_queue.get()
+            try:
+                await self.process_geofence_violation(violation)
+            finally:
+                self.violation_queue.task_done()
+    
+    async def run_sink(self, sink_name: str, sink):
+        """Await one violation sink, bounded by its timeout; its result, or None if it failed"""
+        try:
+            return await asyncio.wait_for(sink, timeout=GEOFENCE_SINK_TIMEOUTS[sink_name])
+        except asyncio.TimeoutError:
+            print(f"Geofence sink '{sink_name}' timed out")
+        except Exception as e:
+            print(f"Error in geofence sink '{sink_name}': {e}")
+    
     async def process_geofence_violation(self, violation: Dict):
-        """Process a geofence violation"""
+        """Process a geofence violation, running the independent sinks concurrently"""
         try:
             # Create alert record
             alert_data = {
                 "tourist_id": violation["tourist_id"],
                 "alert_type": "geofence",
                 "message": self.generate_violation_message(violation),
-                "severity": self.get_violation_severity(violation["zone_type"]),
+                "severity": (
+                    "medium" if violation["violation_type"] == PROXIMITY_VIOLATION_TYPE
+                    else self.get_violation_severity(violation["zone_type"])
+                ),
                 "location_lat": violation["location"]["lat"],
                 "location_lng": violation["location"]["lng"],
                 "zone_info": {
@@ -147,27 +388,35 @@ class GeofencingService:
                     "zone_name": violation["zone_name"],
                     "zone_type": violation["zone_type"]
                 },
+                "violation_type": violation["violation_type"],
                 "timestamp": violation["timestamp"]
             }
             
-            # Store in MongoDB for audit
-            await self.store_geofence_event(alert_data)
-            
-            # Send real-time notifications
-            await self.send_geofence_notifications(alert_data)
-            
-            # Store alert in PostgreSQL
-            await self.create_alert_record(alert_data)
+            await asyncio.gather(
+                # Store in MongoDB for audit
+                self.run_sink("audit_store", self.store_geofence_event(alert_data)),
+                # Store alert in PostgreSQL, then send real-time notifications
+                self.record_and_notify(alert_data)
+            )
             
         except Exception as e:
             print(f"Error processing geofence violation: {e}")
     
+    async def record_and_notify(self, alert_data: Dict):
+        """Record the alert, then notify unless it merged into an alert already announced"""
+        notify = await self.run_sink("alert_record", self.create_alert_record(alert_data))
+        # A failed or slow record still notifies rather than drop the alert
+        if notify is not False:
+            await self.run_sink("notifications", self.send_geofence_notifications(alert_data))
+    
     def generate_violation_message(self, violation: Dict) -> str:
         """Generate human-readable violation message"""
         zone_name = violation["zone_name"]
         zone_type = violation["zone_type"]
         
-        if zone_type == "restricted":
+        if violation["violation_type"] == PROXIMITY_VIOLATION_TYPE:
+            return f"Tourist is {violation['distance_m']:.0f} m from restricted area: {zone_name}."
+        elif zone_type == "restricted":
             return f"Tourist has entered restricted area: {zone_name}. Immediate attention required."
         elif zone_type == "safe":
             return f"Tourist has entered safe zone: {zone_name}."
@@ -189,7 +438,8 @@ class GeofencingService:
     async def store_geofence_event(self, event_data: Dict):
         """Store geofence event in MongoDB for audit trail"""
         try:
-            collection = async_mongo_db.geofence_events
+            mongo_db = await get_mongo_db()
+            collection = mongo_db.geofence_events
             await collection.insert_one({
                 **event_data,
                 "created_at": datetime.now()
@@ -214,7 +464,7 @@ class GeofencingService:
             
             # Send to tourist
             await self.websocket_manager.send_user_message(
-                json.dumps(tourist_notification),
+                tourist_notification,
                 str(alert_data["tourist_id"])
             )
             
@@ -222,6 +472,8 @@ class GeofencingService:
             if alert_data["severity"] in ["high", "critical"]:
                 police_notification = {
                     "type": "geofence_violation",
+                    "alert_id": alert_data.get("alert_id"),
+                    "occurrence_count": alert_data.get("occurrence_count", 1),
                     "tourist_id": alert_data["tourist_id"],
                     "message": alert_data["message"],
                     "location": {
@@ -233,10 +485,12 @@ class GeofencingService:
                     "timestamp": alert_data["timestamp"]
                 }
                 
-                # Broadcast to police dashboard
-                await self.websocket_manager.broadcast_to_role(
-                    json.dumps(police_notification),
-                    "police"
+                # Broadcast to police dashboards covering the location
+                await self.websocket_manager.broadcast_to_location(
+                    police_notification,
+                    "police",
+                    alert_data["location_lat"],
+                    alert_data["location_lng"]
                 )
             
         except Exception as e:
@@ -247,7 +501,9 @@ class GeofencingService:
         zone_type = alert_data["zone_info"]["zone_type"]
         zone_name = alert_data["zone_info"]["zone_name"]
         
-        if zone_type == "restricted":
+        if alert_data.get("violation_type") == PROXIMITY_VIOLATION_TYPE:
+            return f"⚠️ CAUTION: You are approaching a restricted area ({zone_name}). Please do not proceed further."
+        elif zone_type == "restricted":
             return f"⚠️ WARNING: You have entered a restricted area ({zone_name}). Please exit immediately for your safety."
         elif zone_type == "safe":
             return f"✅ You have entered a safe zone ({zone_name}). Enjoy your visit!"
@@ -256,38 +512,152 @@ class GeofencingService:
         else:
             return f"📍 You have entered a monitored area ({zone_name})."
     
-    async def create_alert_record(self, alert_data: Dict):
-        """Create alert record in PostgreSQL"""
-        try:
-            # This would be implemented with actual database session
-            # For now, just log the alert
-            print(f"Alert created: {alert_data['message']}")
-        except Exception as e:
-            print(f"Error creating alert record: {e}")
+    async def create_alert_record(self, alert_data: Dict) -> bool:
+        """Create or update the alert record in PostgreSQL; whether to notify about it"""
+        aggregated, notify = await alert_aggregator.record_async(
+            alert_data["tourist_id"], alert_data["alert_type"], alert_data["message"],
+            alert_data["severity"], alert_data["location_lat"], alert_data["location_lng"],
+            {"zone_info": alert_data["zone_info"], "violation_type": alert_data["violation_type"]},
+            zone_id=alert_data["zone_info"]["zone_id"]
+        )
+        alert_data["alert_id"] = aggregated.alert_id
+        alert_data["occurrence_count"] = aggregated.occurrence_count
+        if aggregated.occurrence_count == 1:
+            heatmap_tiles.record_alert(alert_data["location_lat"], alert_data["location_lng"], alert_data["severity"])
+        return notify
     
-    def add_geofence_zone(self, zone_data: Dict) -> Dict:
+    async def add_geofence_zone(self, zone_data: Dict) -> Dict:
         """Add a new geofence zone"""
         try:
-            zone_id = f"zone_{len(self.active_zones) + 1}"
+            zone_id = await asyncio.to_thread(self.insert_zone, zone_data)
+            
+            # Other workers pick the change up through the version watcher
+            await self.reload()
             
-            # Create polygon from coordinates
-            coords = [(lng, lat) for lng, lat in zone_data["coordinates"]]
-            polygon = Polygon(coords)
+            return {
+                "success": True,
+                "zone_id": zone_id,
+                "message": f"Geofence zone '{zone_data['name']}' added successfully"
+            }
             
-            zone = {
-                "id": len(self.active_zones) + 1,
-                "name": zone_data["name"],
-                "type": zone_data["type"],
-                "coordinates": zone_data["coordinates"],
-                "polygon": polygon
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
             }
+    
+    def insert_zone(self, zone_data: Dict) -> str:
+        """Validate and persist a zone; its snapshot key"""
+        # Validate the polygon before persisting it
+        build_zone(0, zone_data["name"], zone_data["type"], zone_data["coordinates"],
+                   zone_data.get("schedule"))
+        
+        db = SessionLocal()
+        try:
+            record = GeofenceZone(
+                name=zone_data["name"],
+                zone_type=zone_data["type"],
+                coordinates=json.dumps(zone_data["coordinates"]),
+                schedule=zone_data.get("schedule"),
+                is_active=True
+            )
+            db.add(record)
+            db.commit()
+            return f"zone_{record.id}"
+        finally:
+            db.close()
+    
+    def import_geojson_zones(
+        self,
+        feature_collection: Dict,
+        simplify_tolerance_m: float = GEOFENCE_SIMPLIFY_TOLERANCE_M,
+        default_type: str = "restricted",
+        replace_existing: bool = False
+    ) -> Dict:
+        """Bulk import zones from a GeoJSON FeatureCollection.
+        
+        Invalid geometries are repaired with make_valid, multi-part geometries become
+        one zone per polygon, and every polygon is simplified to simplify_tolerance_m.
+        All rows are inserted in one statement and the index is rebuilt once.
+        """
+        try:
+            if feature_collection.get("type") != "FeatureCollection":
+                return {"success": False, "error": "Expected a GeoJSON FeatureCollection"}
+            
+            names, zone_types, schedules, polygons = [], [], [], []
+            skipped, repaired = 0, 0
+            for number, feature in enumerate(feature_collection.get("features", []), start=1):
+                try:
+                    geometry = shape(feature["geometry"])
+                except Exception:
+                    skipped += 1
+                    continue
+                if not geometry.is_valid:
+                    geometry = make_valid(geometry)
+                    repaired += 1
+                parts = polygonal_parts(geometry)
+                if not parts:
+                    skipped += 1
+                    continue
+                
+                properties = feature.get("properties") or {}
+                name = properties.get("name") or f"Imported zone {number}"
+                zone_type = properties.get("type") or properties.get("zone_type") or default_type
+                schedule = properties.get("schedule")
+                if schedule:
+                    try:
+                        schedule_intervals(schedule)
+                    except Exception:
+                        skipped += 1
+                        continue
+                for part_number, part in enumerate(parts, start=1):
+                    names.append(name if len(parts) == 1 else f"{name} ({part_number})")
+                    zone_types.append(zone_type)
+                    schedules.append(schedule)
+                    polygons.append(part)
+            
+            polygons = np.array(polygons, dtype=object)
+            vertices_before = int(get_num_coordinates(polygons).sum()) if len(polygons) else 0
+            if len(polygons) and simplify_tolerance_m > 0:
+                # Each polygon is simplified in metres around its own centroid, so the
+                # tolerance means the same on the ground in both axes at any latitude
+                polygons = np.array([simplify_in_metres(polygon, simplify_tolerance_m) for polygon in polygons],
+                                    dtype=object)
+            vertices_after = int(get_num_coordinates(polygons).sum()) if len(polygons) else 0
+            
+            rows = []
+            for name, zone_type, schedule, polygon in zip(names, zone_types, schedules, polygons):
+                for part in polygonal_parts(polygon):
+                    rows.append({
+                        "name": name,
+                        "zone_type": zone_type,
+                        "coordinates": json.dumps(polygon_rings(part)),
+                        "schedule": schedule,
+                        "is_active": True
+                    })
+            
+            db = SessionLocal()
+            try:
+                if replace_existing:
+                    db.query(GeofenceZone).filter(GeofenceZone.is_active == True).update(
+                        {GeofenceZone.is_active: False}
+                    )
+                if rows:
+                    db.execute(insert(GeofenceZone), rows)
+                db.commit()
+            finally:
+                db.close()
             
-            self.active_zones[zone_id] = zone
+            self.set_snapshot(self.load_snapshot())
             
             return {
                 "success": True,
-                "zone_id": zone_id,
-                "message": f"Geofence zone '{zone_data['name']}' added successfully"
+                "imported": len(rows),
+                "skipped": skipped,
+                "repaired": repaired,
+                "vertices_before": vertices_before,
+                "vertices_after": vertices_after,
+                "message": f"Imported {len(rows)} geofence zones"
             }
             
         except Exception as e:
@@ -296,15 +666,16 @@ class GeofencingService:
                 "error": str(e)
             }
     
-    def remove_geofence_zone(self, zone_id: str) -> Dict:
+    async def remove_geofence_zone(self, zone_id: str) -> Dict:
         """Remove a geofence zone"""
         try:
-            if zone_id in self.active_zones:
-                zone_name = self.active_zones[zone_id]["name"]
-                del self.active_zones[zone_id]
+            zone = self.active_zones.get(zone_id)
+            if zone:
+                await asyncio.to_thread(self.deactivate_zone, zone["id"])
+                await self.reload()
                 return {
                     "success": True,
-                    "message": f"Geofence zone '{zone_name}' removed successfully"
+                    "message": f"Geofence zone '{zone['name']}' removed successfully"
                 }
             else:
                 return {
@@ -318,6 +689,16 @@ class GeofencingService:
                 "error": str(e)
             }
     
+    def deactivate_zone(self, record_id: int):
+        db = SessionLocal()
+        try:
+            db.query(GeofenceZone).filter(GeofenceZone.id == record_id).update(
+                {GeofenceZone.is_active: False}
+            )
+            db.commit()
+        finally:
+            db.close()
+    
     def get_all_zones(self) -> List[Dict]:
         """Get all active geofence zones"""
         zones = []
@@ -326,32 +707,36 @@ class GeofencingService:
                 "id": zone["id"],
                 "name": zone["name"],
                 "type": zone["type"],
-                "coordinates": zone["coordinates"]
+                "coordinates": zone["coordinates"],
+                "schedule": zone["schedule"]
             })
         return zones
     
-    def get_zones_near_location(self, lat: float, lng: float, radius_km: float = 5) -> List[Dict]:
-        """Get geofence zones near a specific location"""
-        nearby_zones = []
-        tourist_point = Point(lng, lat)
-        
-        for zone_id, zone in self.active_zones.items():
-            # Calculate distance to zone boundary
-            zone_center = zone["polygon"].centroid
-            distance = calculate_distance_km((lat, lng), (zone_center.y, zone_center.x))
-            
-            if distance <= radius_km:
-                nearby_zones.append({
-                    "id": zone["id"],
-                    "name": zone["name"],
-                    "type": zone["type"],
-                    "distance_km": round(distance, 2),
-                    "coordinates": zone["coordinates"]
-                })
+    async def nearest_zones(self, lat: float, lng: float, k: int = 5, radius_km: float = 5) -> List[Dict]:
+        """Get the k zones whose boundary is nearest to a location, within radius_km"""
+        if self.shard_router is not None:
+            nearest = await self.shard_router.nearest(lat, lng, k, radius_km)
+        else:
+            snapshot = self.snapshot
+            nearest = [
+                (distance_km, snapshot.zones[zone_key])
+                for distance_km, zone_key in snapshot.nearest(lat, lng, k, radius_km)
+            ]
         
-        # Sort by distance
-        nearby_zones.sort(key=lambda x: x["distance_km"])
+        nearby_zones = []
+        for distance_km, zone in nearest:
+            nearby_zones.append({
+                "id": zone["id"],
+                "name": zone["name"],
+                "type": zone["type"],
+                "distance_km": round(distance_km, 2),
+                "coordinates": zone["coordinates"]
+            })
         return nearby_zones
+    
+    async def get_zones_near_location(self, lat: float, lng: float, radius_km: float = 5) -> List[Dict]:
+        """Get geofence zones near a specific location, nearest first"""
+        return await self.nearest_zones(lat, lng, k=len(self.snapshot.zones), radius_km=radius_km)
 
 # Global geofencing service instance
-geofencing_service = GeofencingService()
\ No newline at end of file
+geofencing_service = GeofencingService(manager)
\ No newline at end of file
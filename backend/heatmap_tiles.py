@@ -0,0 +1,394 @@
+"""Pre-aggregated heatmap density tiles for the police dashboard
+
+Tourist positions and alert locations are binned into web-mercator tiles of
+HEATMAP_TILE_BINS x HEATMAP_TILE_BINS cells at every zoom level from
+HEATMAP_MIN_ZOOM to HEATMAP_MAX_ZOOM, once per time window. A sample adds its
+weight to one bin per level as it arrives; each window is cut into
+HEATMAP_WINDOW_BUCKETS buckets, and a bucket's weights are subtracted again
+when it ages out, so serving a tile only reads that tile's bins.
+
+Layers:
+    tourist_density  live map tourists, each counted once per bucket at its
+                     last position in that bucket
+    incidents        alerts, one per alert
+    risk             alerts weighted by severity
+"""
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from decouple import config
+import numpy as np
+import asyncio
+import hashlib
+import struct
+import time
+import zlib
+from database import SessionLocal
+from models import Alert
+from live_map_feed import LiveMapFeed, live_map_feed
+from tourist_clusters import mercator_fraction
+from websocket_manager import ConnectionManager
+
+HEATMAP_MIN_ZOOM = config("HEATMAP_MIN_ZOOM", default=3, cast=int)
+HEATMAP_MAX_ZOOM = config("HEATMAP_MAX_ZOOM", default=12, cast=int)
+
+# Bins across a tile edge; a power of two up to 256 (one bin per pixel)
+HEATMAP_TILE_BINS = config("HEATMAP_TILE_BINS", default=64, cast=int)
+
+# Buckets per time window; a window spans between this many and one more bucket
+HEATMAP_WINDOW_BUCKETS = config("HEATMAP_WINDOW_BUCKETS", default=12, cast=int)
+
+# Seconds between checks for new tourist density buckets, and tourists carried into
+# a new bucket per step before yielding to the event loop
+HEATMAP_CARRY_SECONDS = config("HEATMAP_CARRY_SECONDS", default=1.0, cast=float)
+HEATMAP_CARRY_BATCH = config("HEATMAP_CARRY_BATCH", default=1000, cast=int)
+
+# Seconds clients may reuse a tile before asking again
+HEATMAP_TILE_MAX_AGE = config("HEATMAP_TILE_MAX_AGE", default=30, cast=int)
+
+HEATMAP_WINDOWS = {"1h": 3600, "24h": 86400, "7d": 604800, "30d": 2592000}
+HEATMAP_LAYERS = ("tourist_density", "incidents", "risk")
+SEVERITY_WEIGHTS = {"low": 1.0, "medium": 2.0, "high": 3.0, "critical": 5.0}
+HEATMAP_ALERT_TOPIC = "heatmap_alert"
+TILE_PX = 256
+
+# Colour ramp for PNG tiles: (intensity, r, g, b, a)
+COLOUR_STOPS = (
+    (0.0, 0, 0, 255, 0),
+    (0.01, 0, 0, 255, 90),
+    (0.35, 0, 255, 255, 140),
+    (0.6, 255, 255, 0, 180),
+    (1.0, 255, 0, 0, 220)
+)
+
+def colour_lut() -> np.ndarray:
+    """256-entry RGBA lookup table over COLOUR_STOPS"""
+    positions = np.linspace(0.0, 1.0, 256)
+    stops = np.array(COLOUR_STOPS, dtype=np.float64)
+    return np.stack([
+        np.interp(positions, stops[:, 0], stops[:, channel]) for channel in range(1, 5)
+    ], axis=1).astype(np.uint8)
+
+COLOUR_LUT = colour_lut()
+
+def encode_png(rgba: np.ndarray) -> bytes:
+    """Encode an (height, width, 4) uint8 array as a PNG"""
+    height, width = rgba.shape[:2]
+    # Each scanline is prefixed with filter type 0 (none)
+    raw = np.concatenate([np.zeros((height, 1), np.uint8), rgba.reshape(height, width * 4)], axis=1)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
+
+class HeatmapWindow:
+    """Bin weights of one layer over one sliding time window, at every zoom level"""
+
+    def __init__(self, seconds: int, min_zoom: int, max_zoom: int, bin_shift: int,
+                 buckets: int = HEATMAP_WINDOW_BUCKETS):
+        self.bucket_seconds = seconds / buckets
+        self.buckets_kept = buckets
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.bin_shift = bin_shift
+        self.bin_mask = (1 << bin_shift) - 1
+        # bucket index -> finest bin key -> weight; kept to subtract the bucket when it expires
+        self.buckets: Dict[int, Dict[int, float]] = {}
+        self.current_bucket: Optional[int] = None
+        # For presence layers: tourist_id -> finest bin key it was last placed at in the
+        # current bucket; closed buckets keep only their bin weights
+        self.presence: Dict[int, int] = {}
+        # Set when a new bucket starts after an earlier one; the tourists still present
+        # are then carried into it in the background (HeatmapTiles.carry_loop)
+        self.carry_pending = False
+        # Per zoom from min_zoom: tile key -> bin index within the tile -> weight
+        self.levels: List[Dict[int, Dict[int, float]]] = [{} for _ in range(min_zoom, max_zoom + 1)]
+        self.level_max_cache: Dict[int, Tuple[float, float]] = {}  # zoom -> (computed at, max)
+
+    def advance(self, now: float):
+        """Move to the bucket containing now, subtracting the buckets that left the window"""
+        current = int(now // self.bucket_seconds)
+        if current == self.current_bucket:
+            return
+        previous, self.current_bucket = self.current_bucket, current
+        for index in [index for index in self.buckets if index < current - self.buckets_kept]:
+            for key, weight in self.buckets.pop(index).items():
+                self.accumulate(key >> 32, key & 0xFFFFFFFF, -weight)
+        self.presence = {}
+        self.carry_pending = previous is not None
+
+    def add(self, fx: int, fy: int, weight: float, ts: float, now: float):
+        self.advance(now)
+        index = min(int(ts // self.bucket_seconds), self.current_bucket)
+        if index < self.current_bucket - self.buckets_kept:
+            return
+        self.add_to_bucket(index, (fx << 32) | fy, weight)
+
+    def place(self, tourist_id: int, fx: int, fy: int, now: float):
+        """Count a tourist once in the current bucket, at its latest position"""
+        self.advance(now)
+        key = (fx << 32) | fy
+        previous = self.presence.get(tourist_id)
+        if previous == key:
+            return
+        if previous is not None:
+            self.add_to_bucket(self.current_bucket, previous, -1.0)
+        self.presence[tourist_id] = key
+        self.add_to_bucket(self.current_bucket, key, 1.0)
+
+    def carry_present(self, tourist_id: int, fx: int, fy: int):
+        """Count a tourist still present in the current bucket unless it has been placed there already"""
+        if tourist_id in self.presence:
+            return
+        key = (fx << 32) | fy
+        self.presence[tourist_id] = key
+        self.add_to_bucket(self.current_bucket, key, 1.0)
+
+    def add_to_bucket(self, index: int, key: int, weight: float):
+        bucket = self.buckets.setdefault(index, {})
+        bucket[key] = bucket.get(key, 0.0) + weight
+        self.accumulate(key >> 32, key & 0xFFFFFFFF, weight)
+
+    def accumulate(self, fx: int, fy: int, weight: float):
+        """Add weight to the bin containing a finest-level bin, at every zoom level"""
+        bin_shift, bin_mask = self.bin_shift, self.bin_mask
+        for zoom in range(self.max_zoom, self.min_zoom - 1, -1):
+            shift = self.max_zoom - zoom
+            bx, by = fx >> shift, fy >> shift
+            tiles = self.levels[zoom - self.min_zoom]
+            tile_key = ((bx >> bin_shift) << 32) | (by >> bin_shift)
+            index = ((by & bin_mask) << bin_shift) | (bx & bin_mask)
+            tile = tiles.get(tile_key)
+            if tile is None:
+                tile = tiles[tile_key] = {}
+            value = tile.get(index, 0.0) + weight
+            # Subtracting a bucket can leave float residue instead of an exact zero
+            if value > 1e-9:
+                tile[index] = value
+            else:
+                tile.pop(index, None)
+                if not tile:
+                    del tiles[tile_key]
+
+    def tile(self, zoom: int, x: int, y: int) -> Optional[Dict[int, float]]:
+        return self.levels[zoom - self.min_zoom].get((x << 32) | y)
+
+    def level_max(self, zoom: int) -> float:
+        """Heaviest bin of a zoom level, the default scale for PNG tiles; refreshed once per tile max age"""
+        now = time.time()
+        cached = self.level_max_cache.get(zoom)
+        if cached is not None and now - cached[0] < HEATMAP_TILE_MAX_AGE:
+            return cached[1]
+        level_max = max(
+            (max(tile.values()) for tile in self.levels[zoom - self.min_zoom].values()), default=0.0
+        )
+        self.level_max_cache[zoom] = (now, level_max)
+        return level_max
+
+class HeatmapTiles:
+    """Heatmap layers, each kept for every time window"""
+
+    def __init__(self, websocket_manager: ConnectionManager, feed: Optional[LiveMapFeed] = None,
+                 min_zoom: int = HEATMAP_MIN_ZOOM, max_zoom: int = HEATMAP_MAX_ZOOM, bins: int = HEATMAP_TILE_BINS):
+        if bins & (bins - 1) or not 1 <= bins <= TILE_PX:
+            raise ValueError("HEATMAP_TILE_BINS must be a power of two up to 256")
+        self.websocket_manager = websocket_manager
+        self.feed = feed
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.bins = bins
+        self.bin_shift = bins.bit_length() - 1
+        self.finest_bins = bins << max_zoom
+        self.layers: Dict[str, Dict[str, HeatmapWindow]] = {
+            layer: {
+                window: HeatmapWindow(seconds, min_zoom, max_zoom, self.bin_shift)
+                for window, seconds in HEATMAP_WINDOWS.items()
+            }
+            for layer in HEATMAP_LAYERS
+        }
+        self.carry_task: Optional[asyncio.Task] = None
+        websocket_manager.on_event(HEATMAP_ALERT_TOPIC, self.apply_alert)
+
+    def finest_bin(self, lat: float, lng: float) -> Tuple[int, int]:
+        x, y = mercator_fraction(lat, lng)
+        return int(x * self.finest_bins), int(y * self.finest_bins)
+
+    def add(self, layer: str, lat: float, lng: float, weight: float = 1.0, ts: Optional[float] = None):
+        now = time.time()
+        fx, fy = self.finest_bin(lat, lng)
+        for window in self.layers[layer].values():
+            window.add(fx, fy, weight, ts if ts is not None else now, now)
+
+    async def carry_loop(self):
+        """Carry the tourists on the live map into each new tourist density bucket.
+
+        Stationary tourists send nothing, so a bucket starts with everyone present.
+        Only the current bucket is filled (buckets skipped while nothing advanced a
+        window stay empty), in batches so the event loop is not held for a whole pass.
+        """
+        while True:
+            await asyncio.sleep(HEATMAP_CARRY_SECONDS)
+            for window in self.layers["tourist_density"].values():
+                window.advance(time.time())
+                if window.carry_pending:
+                    try:
+                        await self.carry_into(window)
+                    except Exception as e:
+                        print(f"Error carrying tourists into a heatmap bucket: {e}")
+
+    async def carry_into(self, window: HeatmapWindow):
+        window.carry_pending = False
+        bucket = window.current_bucket
+        entries = list(self.feed.state.items())
+        for start in range(0, len(entries), HEATMAP_CARRY_BATCH):
+            if window.current_bucket != bucket:
+                return  # A newer bucket started; it is carried on the next pass
+            for tourist_id, entry in entries[start:start + HEATMAP_CARRY_BATCH]:
+                if entry["status"] != "offline":
+                    fx, fy = self.finest_bin(entry["location"]["lat"], entry["location"]["lng"])
+                    window.carry_present(tourist_id, fx, fy)
+            await asyncio.sleep(0)
+
+    def apply_delta(self, delta: Dict):
+        """Place the tourists appearing or moving in a live map delta for tourist density"""
+        now = time.time()
+        for entry in delta["appeared"] + delta["moved"]:
+            fx, fy = self.finest_bin(entry["location"]["lat"], entry["location"]["lng"])
+            for window in self.layers["tourist_density"].values():
+                window.place(entry["tourist_id"], fx, fy, now)
+
+    def record_alert(self, lat: Optional[float], lng: Optional[float], severity: str = "medium",
+                     ts: Optional[float] = None):
+        """Count an alert's location towards the incident and risk layers, in every worker"""
+        if lat is None or lng is None:
+            return
+        self.websocket_manager.publish_event(HEATMAP_ALERT_TOPIC, {
+            "lat": lat,
+            "lng": lng,
+            "severity": severity,
+            "ts": ts if ts is not None else time.time()
+        })
+
+    def apply_alert(self, alert: Dict):
+        self.add("incidents", alert["lat"], alert["lng"], 1.0, alert["ts"])
+        self.add("risk", alert["lat"], alert["lng"], SEVERITY_WEIGHTS.get(alert["severity"], 1.0), alert["ts"])
+
+    def window(self, layer: str, window: str) -> HeatmapWindow:
+        if layer not in self.layers:
+            raise ValueError(f"Unknown heatmap layer: {layer}")
+        if window not in HEATMAP_WINDOWS:
+            raise ValueError(f"Unknown heatmap window: {window}")
+        heatmap_window = self.layers[layer][window]
+        heatmap_window.advance(time.time())
+        return heatmap_window
+
+    def grid(self, layer: str, window: str, zoom: int, x: int, y: int) -> Optional[np.ndarray]:
+        """A tile's (bins, bins) weight grid, or None if it is empty.
+
+        Beyond the maximum zoom the grid is cut from the ancestor tile at the
+        maximum zoom and upsampled; at most one bin per tile is left.
+        """
+        if zoom < self.min_zoom or zoom > self.max_zoom + self.bin_shift:
+            raise ValueError(f"Heatmap tiles are served for zoom {self.min_zoom} to {self.max_zoom + self.bin_shift}")
+        if not (0 <= x < (1 << zoom) and 0 <= y < (1 << zoom)):
+            raise ValueError("Tile coordinates are outside the world")
+
+        depth = max(0, zoom - self.max_zoom)
+        tile = self.window(layer, window).tile(zoom - depth, x >> depth, y >> depth)
+        if not tile:
+            return None
+        grid = np.zeros(self.bins * self.bins, dtype=np.float32)
+        grid[np.fromiter(tile.keys(), dtype=np.int64, count=len(tile))] = np.fromiter(
+            tile.values(), dtype=np.float32, count=len(tile)
+        )
+        grid = grid.reshape(self.bins, self.bins)
+        if depth:
+            span = self.bins >> depth
+            left, top = (x & ((1 << depth) - 1)) * span, (y & ((1 << depth) - 1)) * span
+            grid = grid[top:top + span, left:left + span]
+            if not grid.any():
+                return None
+            grid = np.repeat(np.repeat(grid, 1 << depth, axis=0), 1 << depth, axis=1)
+        return grid
+
+    def render_png(self, grid: np.ndarray, scale: float) -> bytes:
+        """Colour a grid on a log scale where scale maps to full intensity, as a 256 px PNG"""
+        intensity = np.log1p(grid) / np.log1p(max(scale, 1e-9))
+        levels = np.clip(intensity * 255, 0, 255).astype(np.uint8)
+        # Keep any non-empty bin visible
+        levels[(grid > 0) & (levels == 0)] = 1
+        rgba = COLOUR_LUT[levels]
+        factor = TILE_PX // self.bins
+        if factor > 1:
+            rgba = np.repeat(np.repeat(rgba, factor, axis=0), factor, axis=1)
+        return encode_png(rgba)
+
+    @staticmethod
+    def etag(body: bytes) -> str:
+        return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+    def scale(self, layer: str, window: str, zoom: int) -> float:
+        return self.window(layer, window).level_max(min(zoom, self.max_zoom))
+
+    def get_metadata(self) -> Dict:
+        return {
+            "layers": list(HEATMAP_LAYERS),
+            "windows": list(HEATMAP_WINDOWS),
+            "min_zoom": self.min_zoom,
+            "max_zoom": self.max_zoom + self.bin_shift,
+            "bins": self.bins,
+            "formats": ["png", "bin"]
+        }
+
+    def load_from_database(self) -> List[Dict]:
+        """Alerts with a location within the longest window"""
+        db = SessionLocal()
+        try:
+            since = datetime.now() - timedelta(seconds=max(HEATMAP_WINDOWS.values()))
+            rows = db.query(
+                Alert.location_lat, Alert.location_lng, Alert.severity, Alert.created_at
+            ).filter(
+                Alert.created_at >= since,
+                Alert.location_lat.isnot(None),
+                Alert.location_lng.isnot(None)
+            ).all()
+        finally:
+            db.close()
+        return [
+            {"lat": lat, "lng": lng, "severity": severity, "ts": created_at.timestamp()}
+            for lat, lng, severity, created_at in rows
+        ]
+
+    async def start(self):
+        """Seed the alert layers from the database; density follows the live map feed"""
+        try:
+            alerts = await asyncio.to_thread(self.load_from_database)
+            for alert in alerts:
+                self.apply_alert(alert)
+            print(f"Heatmap seeded with {len(alerts)} alerts")
+        except Exception as e:
+            print(f"Error seeding heatmap: {e}")
+        if self.feed is not None and (self.carry_task is None or self.carry_task.done()):
+            self.carry_task = asyncio.create_task(self.carry_loop())
+
+    async def stop(self):
+        if self.carry_task:
+            self.carry_task.cancel()
+            try:
+                await self.carry_task
+            except asyncio.CancelledError:
+                pass
+            self.carry_task = None
+
+def attach_heatmap_tiles(feed: LiveMapFeed) -> HeatmapTiles:
+    tiles = HeatmapTiles(feed.websocket_manager, feed)
+    feed.add_listener(tiles.apply_delta)
+    return tiles
+
+# Global heatmap tiles, kept current by the live map feed and recorded alerts
+heatmap_tiles = attach_heatmap_tiles(live_map_feed)
@@ -1,7 +1,6 @@
 """Database initialization script"""
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from database import DATABASE_URL, MONGODB_URL, MONGODB_DATABASE
+from sqlalchemy import inspect, text
+from database import engine, SessionLocal, MONGODB_URL, MONGODB_DATABASE
 from models import Base
 import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -10,8 +9,24 @@ import pymongo
 def create_postgresql_tables():
     """Create all PostgreSQL tables"""
     try:
-        engine = create_engine(DATABASE_URL)
         Base.metadata.create_all(bind=engine)
+        # create_all skips tables that already exist, so add any columns declared since
+        # (existing rows take the column's server default)...
+        inspector = inspect(engine)
+        with engine.begin() as connection:
+            for table in Base.metadata.sorted_tables:
+                existing = {column["name"] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing:
+                        continue
+                    ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+                    if column.server_default is not None:
+                        ddl += f" DEFAULT {column.server_default.arg}"
+                    connection.execute(text(ddl))
+        # ...and any indexes, which may cover those columns
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
         print("✅ PostgreSQL tables created successfully")
         return True
     except Exception as e:
@@ -60,8 +75,6 @@ async def setup_mongodb_collections():
 def seed_sample_data():
     """Seed database with sample data for testing"""
     try:
-        engine = create_engine(DATABASE_URL)
-        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
         db = SessionLocal()
         
         from models import User, UserRole, TouristProfile, PoliceProfile, GeofenceZone
@@ -11,6 +11,7 @@ from database import get_db
 from auth import get_current_user, require_role
 from models import User, TouristProfile, KYCDocument, DigitalIDRecord, KYCStatus, DocumentType
 from blockchain_tourist_id import blockchain_service
+from tourism_stats import tourism_stats, profile_snapshot
 
 # Enhanced schemas (inline for now)
 from pydantic import BaseModel, Field, validator
@@ -122,6 +123,7 @@ async def register_tourist_kyc(
                 itinerary_data = [{"description": kyc_data.planned_itinerary}]
         
         # Create or update tourist profile
+        stats_before = profile_snapshot(existing_profile)
         if existing_profile:
             profile = existing_profile
         else:
@@ -164,6 +166,7 @@ async def register_tourist_kyc(
         # Commit to get profile ID
         db.commit()
         db.refresh(profile)
+        tourism_stats.record_change(stats_before, profile_snapshot(profile))
         
         # Update document tourist_id if it was None
         if not passport_doc.tourist_id:
@@ -382,6 +385,7 @@ async def verify_tourist_kyc(
             )
         
         # Update profile
+        stats_before = profile_snapshot(profile)
         profile.kyc_status = new_status
         
         if new_status == KYCStatus.VERIFIED:
@@ -408,6 +412,7 @@ async def verify_tourist_kyc(
             doc.verification_notes = verification_notes
         
         db.commit()
+        tourism_stats.record_change(stats_before, profile_snapshot(profile))
         
         return {
             "success": True,
@@ -0,0 +1,287 @@
+"""Delta-push live map feed for police dashboards
+
+Location pings and status changes are coalesced per tourist and, once per
+tick, diffed against the last published map state. Police connections get
+only what changed - appeared, moved, status and disappeared tourists - and
+can ask for a full snapshot to resync.
+
+Every worker shares its pings with the others through the connection
+manager's backplane, so each worker holds the complete map state and pushes
+the deltas to its own sockets.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from sqlalchemy import case, func
+from decouple import config
+import asyncio
+import heapq
+import math
+import time
+from database import SessionLocal
+from models import TouristProfile, Alert
+from geofence_index import EARTH_RADIUS_KM
+from websocket_manager import ConnectionManager, OutboundFrame, manager
+
+# Seconds between published deltas; pings within one tick are coalesced
+LIVE_MAP_TICK_SECONDS = config("LIVE_MAP_TICK_SECONDS", default=1.0, cast=float)
+
+# Movement below this many metres is not pushed (GPS jitter)
+LIVE_MAP_MIN_MOVE_M = config("LIVE_MAP_MIN_MOVE_M", default=5.0, cast=float)
+
+# Silence after which a tourist is shown offline, and after which they leave the map
+LIVE_MAP_OFFLINE_SECONDS = config("LIVE_MAP_OFFLINE_SECONDS", default=1800, cast=int)
+LIVE_MAP_EXPIRE_SECONDS = config("LIVE_MAP_EXPIRE_SECONDS", default=3600, cast=int)
+
+LIVE_MAP_EVENT_TOPIC = "live_map"
+STATUS_PRIORITY = {"offline": 0, "active": 1, "alert": 2, "emergency": 3}
+
+def distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Equirectangular distance in metres; accurate at the scale of one tick's movement"""
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * EARTH_RADIUS_KM * 1000
+
+class LiveMapFeed:
+    """Per-worker live map state and the tick loop publishing its deltas"""
+
+    def __init__(self, websocket_manager: ConnectionManager, tick_seconds: float = LIVE_MAP_TICK_SECONDS):
+        self.websocket_manager = websocket_manager
+        self.tick_seconds = tick_seconds
+        self.state: Dict[int, Dict] = {}  # tourist_id -> last published entry
+        self.pending: Dict[int, Dict] = {}  # tourist_id -> latest ping since the last tick
+        self.expiries: List[Tuple[float, int, str]] = []  # (due, tourist_id, "offline" | "expire")
+        self.expiry_due: Dict[int, float] = {}  # tourist_id -> due time of its live expiries entry
+        self.tick = 0
+        self.tick_task: Optional[asyncio.Task] = None
+        self.listeners: List[Callable[[Dict], None]] = []
+        websocket_manager.on_event(LIVE_MAP_EVENT_TOPIC, self.apply_update)
+
+    def record_location(self, tourist_id: int, lat: float, lng: float,
+                        safety_score: Optional[float] = None, status: Optional[str] = None):
+        """Record a ping (and optionally a status) for the next tick, in every worker"""
+        self.websocket_manager.publish_event(LIVE_MAP_EVENT_TOPIC, {
+            "tourist_id": tourist_id,
+            "lat": lat,
+            "lng": lng,
+            "safety_score": safety_score,
+            "status": status,
+            "ts": time.time()
+        })
+
+    def apply_update(self, update: Dict):
+        """Coalesce an update into the pending set; the latest position wins, the worst status wins"""
+        previous = self.pending.get(update["tourist_id"])
+        if previous and previous.get("status") and update.get("status"):
+            if STATUS_PRIORITY[previous["status"]] > STATUS_PRIORITY[update["status"]]:
+                update = dict(update, status=previous["status"])
+        self.pending[update["tourist_id"]] = update
+
+    def entry_for(self, update: Dict, status: str) -> Dict:
+        return {
+            "tourist_id": update["tourist_id"],
+            "location": {"lat": update["lat"], "lng": update["lng"]},
+            "safety_score": update.get("safety_score"),
+            "status": status,
+            "last_update": datetime.fromtimestamp(update["ts"]).isoformat(),
+            "ts": update["ts"]
+        }
+
+    def schedule_expiry(self, entry: Dict):
+        """Make sure a tourist's next deadline is queued, keeping one live entry per tourist"""
+        due = entry["ts"] + LIVE_MAP_OFFLINE_SECONDS
+        # A queued offline deadline is pushed back when it comes due; only an
+        # earlier deadline than the one queued (a ping after going offline) needs a new entry
+        if due < self.expiry_due.get(entry["tourist_id"], math.inf):
+            self.push_expiry(entry["tourist_id"], due, "offline")
+
+    def push_expiry(self, tourist_id: int, due: float, stage: str):
+        self.expiry_due[tourist_id] = due
+        heapq.heappush(self.expiries, (due, tourist_id, stage))
+
+    def collect_delta(self, now: Optional[float] = None) -> Optional[Dict]:
+        """Apply pending updates and expiries to the state; the changes, or None if nothing changed"""
+        now = now if now is not None else time.time()
+        appeared, moved, status_changes, disappeared = [], [], [], []
+
+        pending, self.pending = self.pending, {}
+        for tourist_id, update in pending.items():
+            current = self.state.get(tourist_id)
+            if current is None:
+                entry = self.entry_for(update, update.get("status") or "active")
+                self.state[tourist_id] = entry
+                appeared.append(self.public(entry))
+                self.schedule_expiry(entry)
+                continue
+
+            # An emergency is only cleared by the tourist going offline
+            status = update.get("status")
+            if status is None:
+                status = current["status"] if current["status"] == "emergency" else "active"
+            elif current["status"] == "emergency" and status != "emergency":
+                status = "emergency"
+
+            if distance_m(current["location"]["lat"], current["location"]["lng"],
+                          update["lat"], update["lng"]) >= LIVE_MAP_MIN_MOVE_M:
+                current["location"] = {"lat": update["lat"], "lng": update["lng"]}
+                moved.append({"tourist_id": tourist_id, "location": current["location"]})
+
+            if status != current["status"] or (
+                update.get("safety_score") is not None and update["safety_score"] != current["safety_score"]
+            ):
+                current["status"] = status
+                if update.get("safety_score") is not None:
+                    current["safety_score"] = update["safety_score"]
+                status_changes.append({
+                    "tourist_id": tourist_id,
+                    "status": status,
+                    "safety_score": current["safety_score"]
+                })
+
+            current["ts"] = update["ts"]
+            current["last_update"] = datetime.fromtimestamp(update["ts"]).isoformat()
+            self.schedule_expiry(current)
+
+        while self.expiries and self.expiries[0][0] <= now:
+            due, tourist_id, stage = heapq.heappop(self.expiries)
+            if self.expiry_due.get(tourist_id) != due:
+                continue  # Replaced by an earlier deadline
+            entry = self.state.get(tourist_id)
+            if entry is None:
+                del self.expiry_due[tourist_id]
+                continue
+            if stage == "offline":
+                if entry["ts"] + LIVE_MAP_OFFLINE_SECONDS > due:
+                    # Pinged since it was queued: wait for the new deadline
+                    self.push_expiry(tourist_id, entry["ts"] + LIVE_MAP_OFFLINE_SECONDS, "offline")
+                    continue
+                if entry["status"] != "offline":
+                    entry["status"] = "offline"
+                    status_changes.append({
+                        "tourist_id": tourist_id,
+                        "status": "offline",
+                        "safety_score": entry["safety_score"]
+                    })
+                self.push_expiry(tourist_id, entry["ts"] + LIVE_MAP_EXPIRE_SECONDS, "expire")
+            elif entry["ts"] + LIVE_MAP_EXPIRE_SECONDS > due:
+                self.push_expiry(tourist_id, entry["ts"] + LIVE_MAP_OFFLINE_SECONDS, "offline")
+            else:
+                del self.state[tourist_id]
+                del self.expiry_due[tourist_id]
+                disappeared.append(tourist_id)
+
+        if not (appeared or moved or status_changes or disappeared):
+            return None
+        self.tick += 1
+        return {
+            "type": "map_delta",
+            "tick": self.tick,
+            "appeared": appeared,
+            "moved": moved,
+            "status": status_changes,
+            "disappeared": disappeared
+        }
+
+    @staticmethod
+    def public(entry: Dict) -> Dict:
+        return {key: value for key, value in entry.items() if key != "ts"}
+
+    def snapshot(self) -> Dict:
+        """The full map state, for first load and resync; later deltas follow from its tick"""
+        return {
+            "type": "map_snapshot",
+            "tick": self.tick,
+            "tourists": [self.public(entry) for entry in self.state.values()]
+        }
+
+    def add_listener(self, listener: Callable[[Dict], None]):
+        """Register a callback for every delta, e.g. a derived index; it first gets the current state"""
+        self.listeners.append(listener)
+        listener(self.full_delta())
+
+    def full_delta(self) -> Dict:
+        """The whole state expressed as a delta in which every tourist appears"""
+        return {
+            "type": "map_delta",
+            "tick": self.tick,
+            "appeared": [self.public(entry) for entry in self.state.values()],
+            "moved": [],
+            "status": [],
+            "disappeared": []
+        }
+
+    def notify(self, delta: Dict):
+        for listener in self.listeners:
+            try:
+                listener(delta)
+            except Exception as e:
+                print(f"Error applying live map delta to a listener: {e}")
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            try:
+                delta = self.collect_delta()
+                if delta:
+                    self.notify(delta)
+                    # Every worker builds the same delta, so each delivers it to its own sockets only
+                    self.websocket_manager.deliver({"kind": "role", "role": "police"}, OutboundFrame(payload=delta))
+            except Exception as e:
+                print(f"Error publishing live map delta: {e}")
+
+    def load_from_database(self):
+        """Seed the state with tourists seen within the expiry window"""
+        db = SessionLocal()
+        try:
+            since = datetime.now() - timedelta(seconds=LIVE_MAP_EXPIRE_SECONDS)
+            tourists = db.query(TouristProfile).filter(
+                TouristProfile.last_location_update >= since,
+                TouristProfile.current_location_lat.isnot(None),
+                TouristProfile.current_location_lng.isnot(None)
+            ).all()
+            # tourist_id -> 1 if an open alert is a panic, else 0
+            open_alerts = dict(db.query(
+                Alert.tourist_id,
+                func.max(case((Alert.alert_type == "panic", 1), else_=0))
+            ).filter(Alert.is_resolved == False).group_by(Alert.tourist_id).all())
+        finally:
+            db.close()
+
+        now = time.time()
+        for tourist in tourists:
+            ts = tourist.last_location_update.timestamp()
+            if tourist.id in open_alerts:
+                status = "emergency" if open_alerts[tourist.id] else "alert"
+            else:
+                status = "offline" if now - ts >= LIVE_MAP_OFFLINE_SECONDS else "active"
+            entry = self.entry_for({
+                "tourist_id": tourist.id,
+                "lat": tourist.current_location_lat,
+                "lng": tourist.current_location_lng,
+                "safety_score": tourist.safety_score,
+                "ts": ts
+            }, status)
+            self.state[tourist.id] = entry
+            self.schedule_expiry(entry)
+        print(f"Live map seeded with {len(tourists)} tourists")
+
+    async def start(self):
+        """Seed from the database and start publishing deltas in this worker"""
+        if self.tick_task is None or self.tick_task.done():
+            try:
+                await asyncio.to_thread(self.load_from_database)
+                self.notify(self.full_delta())
+            except Exception as e:
+                print(f"Error seeding live map: {e}")
+            self.tick_task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.tick_task:
+            self.tick_task.cancel()
+            try:
+                await self.tick_task
+            except asyncio.CancelledError:
+                pass
+            self.tick_task = None
+
+# Global live map feed instance
+live_map_feed = LiveMapFeed(manager)
@@ -4,6 +4,7 @@ from pydantic import BaseModel
 import uvicorn
 from typing import Optional
 from datetime import datetime
+from points_of_interest import points_of_interest
 
 # Create FastAPI app
 app = FastAPI(title="SecureSafar API", version="1.0.0")
@@ -243,11 +244,7 @@ async def update_location(location_data: dict):
             },
             "geofence_violations": [],
             "safety_score": 95.0,
-            "nearby_services": [
-                {"type": "police", "distance": 0.8, "name": "Local Police Station"},
-                {"type": "hospital", "distance": 1.2, "name": "City Hospital"},
-                {"type": "tourist_info", "distance": 0.3, "name": "Tourist Information Center"}
-            ],
+            "nearby_services": points_of_interest.nearest(latitude, longitude),
             "alerts": []
         }
         
@@ -1,14 +1,19 @@
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey, Enum, JSON
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey, Enum, JSON
+from sqlalchemy import Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from passlib.context import CryptContext
+from datetime import datetime, timezone
 import enum
 
 Base = declarative_base()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
 class UserRole(enum.Enum):
     TOURIST = "tourist"
     POLICE = "police"
@@ -139,9 +144,20 @@ class Alert(Base):
     location_lat = Column(Float, nullable=True)
     location_lng = Column(Float, nullable=True)
     is_resolved = Column(Boolean, default=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Set from Python so stored values match the cursors the feed binds (see alert_feed)
+    created_at = Column(DateTime(timezone=True), default=utc_now, server_default=func.now())
     resolved_at = Column(DateTime(timezone=True), nullable=True)
     metadata_info = Column(JSON, nullable=True)  # Additional alert data
+    occurrence_count = Column(Integer, nullable=False, default=1, server_default="1")  # Merged repeats of this alert
+    last_seen_at = Column(DateTime(timezone=True), nullable=True)  # Latest merged occurrence
+    
+    # Keyset pagination of the alert feed: newest first, optionally narrowed by severity or type
+    __table_args__ = (
+        Index("ix_alerts_feed", "is_resolved", "created_at", "id"),
+        Index("ix_alerts_feed_severity", "is_resolved", "severity", "created_at", "id"),
+        Index("ix_alerts_feed_type", "is_resolved", "alert_type", "created_at", "id"),
+        Index("ix_alerts_location", "location_lat", "location_lng"),
+    )
 
 class KYCDocument(Base):
     __tablename__ = "kyc_documents"
@@ -194,4 +210,6 @@ class GeofenceZone(Base):
     zone_type = Column(String, nullable=False)  # restricted, safe, emergency
     coordinates = Column(Text, nullable=False)  # JSON string of polygon coordinates
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    schedule = Column(JSON, nullable=True)  # Recurring active windows; null = always active
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
\ No newline at end of file
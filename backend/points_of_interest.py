@@ -0,0 +1,166 @@
+"""Nearby services for location fixes
+
+Police stations, hospitals and tourist help desks are loaded from a GeoJSON
+file of Point features (properties: type, name and optionally phone) into a
+uniform lng/lat grid per service type. For each small cache cell the services
+that can be among the k nearest of any fix inside it are found once and
+cached, so answering a ping only measures distances to that short list.
+"""
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+from decouple import config
+import json
+import math
+import os
+from geofence_index import haversine_m, search_box_around
+
+POI_FILE = config(
+    "POI_FILE", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "points_of_interest.geojson")
+)
+
+# Grid cell edge in degrees for the service index, and for cached candidate lists
+POI_CELL_DEG = config("POI_CELL_DEG", default=0.05, cast=float)
+POI_CACHE_CELL_DEG = config("POI_CACHE_CELL_DEG", default=0.005, cast=float)
+
+# Cached cells kept (least recently used are evicted)
+POI_CACHE_SIZE = config("POI_CACHE_SIZE", default=10000, cast=int)
+
+# Services of each type returned per fix, and the furthest considered nearby
+POI_DEFAULT_K = config("POI_DEFAULT_K", default=1, cast=int)
+POI_MAX_DISTANCE_KM = config("POI_MAX_DISTANCE_KM", default=50.0, cast=float)
+
+class PointOfInterest:
+    """A service location"""
+
+    __slots__ = ("poi_type", "name", "lat", "lng", "phone")
+
+    def __init__(self, poi_type: str, name: str, lat: float, lng: float, phone: Optional[str] = None):
+        self.poi_type = poi_type
+        self.name = name
+        self.lat = lat
+        self.lng = lng
+        self.phone = phone
+
+class PointsOfInterestIndex:
+    """Grid index of services per type with a cell-level cache of nearest candidates"""
+
+    def __init__(self, cell_deg: float = POI_CELL_DEG, cache_cell_deg: float = POI_CACHE_CELL_DEG,
+                 cache_size: int = POI_CACHE_SIZE, max_distance_km: float = POI_MAX_DISTANCE_KM):
+        self.cell_deg = cell_deg
+        self.cache_cell_deg = cache_cell_deg
+        self.cache_size = cache_size
+        self.max_distance_m = max_distance_km * 1000
+        self.cells: Dict[str, Dict[Tuple[int, int], List[PointOfInterest]]] = {}  # type -> cell -> services
+        # (cache cell, k) -> type -> services that can be among the k nearest within the cell
+        self.cache: "OrderedDict[Tuple[Tuple[int, int], int], Dict[str, List[PointOfInterest]]]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __len__(self) -> int:
+        return sum(len(services) for cells in self.cells.values() for services in cells.values())
+
+    def load(self, path: str = POI_FILE) -> int:
+        """Replace the services with those in a GeoJSON file; returns how many were loaded"""
+        with open(path) as poi_file:
+            return self.load_features(json.load(poi_file))
+
+    def load_features(self, feature_collection: Dict) -> int:
+        cells: Dict[str, Dict[Tuple[int, int], List[PointOfInterest]]] = {}
+        loaded = 0
+        for feature in feature_collection.get("features", []):
+            geometry = feature.get("geometry") or {}
+            properties = feature.get("properties") or {}
+            if geometry.get("type") != "Point" or not properties.get("type"):
+                continue
+            lng, lat = geometry["coordinates"][:2]
+            poi = PointOfInterest(
+                properties["type"], properties.get("name") or properties["type"], lat, lng, properties.get("phone")
+            )
+            cells.setdefault(poi.poi_type, {}).setdefault(self.cell_of(lat, lng, self.cell_deg), []).append(poi)
+            loaded += 1
+        self.cells = cells
+        self.cache.clear()
+        return loaded
+
+    @staticmethod
+    def cell_of(lat: float, lng: float, cell_deg: float) -> Tuple[int, int]:
+        return (math.floor(lng / cell_deg), math.floor(lat / cell_deg))
+
+    def within(self, poi_type: str, lat: float, lng: float, radius_m: float) -> List[Tuple[float, PointOfInterest]]:
+        """(distance, service) pairs of one type within radius_m of a location, nearest first"""
+        cells = self.cells.get(poi_type, {})
+        min_lng, min_lat, max_lng, max_lat = search_box_around(lat, lng, radius_m / 1000).bounds
+        found = []
+        for x in range(math.floor(min_lng / self.cell_deg), math.floor(max_lng / self.cell_deg) + 1):
+            for y in range(math.floor(min_lat / self.cell_deg), math.floor(max_lat / self.cell_deg) + 1):
+                for poi in cells.get((x, y), ()):
+                    distance = haversine_m(lat, lng, poi.lat, poi.lng)
+                    if distance <= radius_m:
+                        found.append((distance, poi))
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+    def candidates(self, cache_cell: Tuple[int, int], k: int) -> Dict[str, List[PointOfInterest]]:
+        """Per type, the services that can be among the k nearest to any point of a cache cell"""
+        key = (cache_cell, k)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cache.move_to_end(key)
+            self.cache_hits += 1
+            return cached
+        self.cache_misses += 1
+
+        x, y = cache_cell
+        centre_lat, centre_lng = (y + 0.5) * self.cache_cell_deg, (x + 0.5) * self.cache_cell_deg
+        half_diagonal = haversine_m(centre_lat, centre_lng, y * self.cache_cell_deg, x * self.cache_cell_deg)
+        candidates = {}
+        for poi_type in self.cells:
+            # A fix is at most half_diagonal from the centre, so its k nearest are all
+            # within the centre's k-th distance plus twice that
+            nearby = self.within(poi_type, centre_lat, centre_lng, self.max_distance_m + half_diagonal)
+            reach = (nearby[k - 1][0] if len(nearby) >= k else self.max_distance_m) + 2 * half_diagonal
+            candidates[poi_type] = [poi for distance, poi in nearby if distance <= reach]
+
+        self.cache[key] = candidates
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return candidates
+
+    def nearest(self, lat: float, lng: float, k: int = POI_DEFAULT_K,
+                types: Optional[List[str]] = None) -> List[Dict]:
+        """The k nearest services of each type within POI_MAX_DISTANCE_KM, distance in km"""
+        candidates = self.candidates(self.cell_of(lat, lng, self.cache_cell_deg), k)
+        services = []
+        for poi_type in types or candidates:
+            measured = sorted(
+                ((haversine_m(lat, lng, poi.lat, poi.lng), poi) for poi in candidates.get(poi_type, ())),
+                key=lambda pair: pair[0]
+            )
+            for distance, poi in measured[:k]:
+                if distance > self.max_distance_m:
+                    break
+                services.append({
+                    "type": poi.poi_type,
+                    "distance": round(distance / 1000, 2),
+                    "name": poi.name,
+                    "location": {"lat": poi.lat, "lng": poi.lng},
+                    "phone": poi.phone
+                })
+        return services
+
+    def get_stats(self) -> Dict:
+        return {
+            "services": len(self),
+            "types": {poi_type: sum(len(services) for services in cells.values())
+                      for poi_type, cells in self.cells.items()},
+            "cached_cells": len(self.cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses
+        }
+
+# Global points-of-interest index
+points_of_interest = PointsOfInterestIndex()
+try:
+    print(f"Loaded {points_of_interest.load()} points of interest")
+except Exception as e:
+    print(f"Warning: points of interest not available: {e}")
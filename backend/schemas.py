@@ -193,6 +193,8 @@ class AlertResponse(BaseModel):
     is_resolved: bool
     created_at: datetime
     resolved_at: Optional[datetime] = None
+    occurrence_count: int = 1
+    last_seen_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -201,12 +203,14 @@ class GeofenceZoneCreate(BaseModel):
     name: str
     zone_type: str
     coordinates: str
+    schedule: Optional[List[dict]] = None
 
 class GeofenceZoneResponse(BaseModel):
     id: int
     name: str
     zone_type: str
     coordinates: str
+    schedule: Optional[List[dict]] = None
     is_active: bool
     created_at: datetime
     
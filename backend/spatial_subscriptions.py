@@ -0,0 +1,116 @@
+"""Spatial subscriptions for WebSocket clients
+
+Police dashboards subscribe to an area - a bounding box or their jurisdiction
+polygon - and receive only the events located inside it. Subscriptions are
+indexed on a uniform lng/lat grid, so an event is tested only against the
+areas overlapping its cell, then confirmed with a prepared containment test.
+"""
+from typing import Dict, List, Optional, Set, Tuple, Union
+from shapely import intersects_xy, make_valid, prepare
+from shapely.geometry import Polygon, MultiPolygon, box, shape
+from shapely.geometry.base import BaseGeometry
+from decouple import config
+import json
+import math
+
+# Grid cell edge in degrees used to index subscription areas
+WEBSOCKET_SUBSCRIPTION_CELL_DEG = config("WEBSOCKET_SUBSCRIPTION_CELL_DEG", default=0.25, cast=float)
+
+# Areas covering more cells than this are kept out of the grid and tested on every event
+WEBSOCKET_SUBSCRIPTION_MAX_CELLS = config("WEBSOCKET_SUBSCRIPTION_MAX_CELLS", default=1024, cast=int)
+
+def parse_bbox(value: Union[str, List[float]]) -> Polygon:
+    """Polygon from "min_lng,min_lat,max_lng,max_lat" or the equivalent list"""
+    if isinstance(value, str):
+        value = [float(part) for part in value.split(",")]
+    min_lng, min_lat, max_lng, max_lat = (float(part) for part in value)
+    if min_lng >= max_lng or min_lat >= max_lat:
+        raise ValueError("Bounding box must be min_lng,min_lat,max_lng,max_lat")
+    return box(min_lng, min_lat, max_lng, max_lat)
+
+def parse_area(value: Union[str, Dict, List, None]) -> Optional[BaseGeometry]:
+    """Polygonal area from a stored jurisdiction.
+
+    Accepts a GeoJSON geometry or feature, a single [lng, lat] ring, or a list
+    of rings (exterior first, then holes), optionally as a JSON string.
+    Returns None when there is no usable polygon.
+    """
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+
+    if isinstance(value, dict):
+        geometry = shape(value.get("geometry", value))
+    elif value and isinstance(value[0][0], (list, tuple)):
+        geometry = Polygon(value[0], value[1:])
+    else:
+        geometry = Polygon(value)
+
+    if not geometry.is_valid:
+        geometry = make_valid(geometry)
+    if not isinstance(geometry, (Polygon, MultiPolygon)) or geometry.is_empty:
+        return None
+    return geometry
+
+class AreaSubscriptionIndex:
+    """Grid index from lng/lat cells to the client areas overlapping them"""
+
+    def __init__(self, cell_deg: float = WEBSOCKET_SUBSCRIPTION_CELL_DEG,
+                 max_cells: int = WEBSOCKET_SUBSCRIPTION_MAX_CELLS):
+        self.cell_deg = cell_deg
+        self.max_cells = max_cells
+        self.areas: Dict[str, BaseGeometry] = {}  # client_id -> area
+        self.area_cells: Dict[str, List[Tuple[int, int]]] = {}  # client_id -> cells it is filed under
+        self.cells: Dict[Tuple[int, int], Set[str]] = {}  # cell -> client_ids
+        self.wide_areas: Set[str] = set()  # client_ids tested on every lookup
+
+    def __len__(self) -> int:
+        return len(self.areas)
+
+    def __contains__(self, client_id: str) -> bool:
+        return client_id in self.areas
+
+    def cell_of(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lng / self.cell_deg), math.floor(lat / self.cell_deg))
+
+    def subscribe(self, client_id: str, area: BaseGeometry):
+        """Set (or replace) a client's area"""
+        self.unsubscribe(client_id)
+        prepare(area)
+        self.areas[client_id] = area
+
+        min_x, min_y, max_x, max_y = area.bounds
+        x_range = range(math.floor(min_x / self.cell_deg), math.floor(max_x / self.cell_deg) + 1)
+        y_range = range(math.floor(min_y / self.cell_deg), math.floor(max_y / self.cell_deg) + 1)
+        if len(x_range) * len(y_range) > self.max_cells:
+            self.wide_areas.add(client_id)
+            return
+
+        cells = [(x, y) for x in x_range for y in y_range]
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(client_id)
+        self.area_cells[client_id] = cells
+
+    def unsubscribe(self, client_id: str):
+        if self.areas.pop(client_id, None) is None:
+            return
+        self.wide_areas.discard(client_id)
+        for cell in self.area_cells.pop(client_id, ()):
+            client_ids = self.cells.get(cell)
+            if client_ids is not None:
+                client_ids.discard(client_id)
+                if not client_ids:
+                    del self.cells[cell]
+
+    def covers(self, client_id: str, lat: float, lng: float) -> bool:
+        """Whether a subscribed client's area contains a location"""
+        return bool(intersects_xy(self.areas[client_id], lng, lat))
+
+    def subscribers_at(self, lat: float, lng: float) -> Set[str]:
+        """Clients whose area contains a location"""
+        candidates = self.cells.get(self.cell_of(lat, lng), set()) | self.wide_areas
+        return {
+            client_id for client_id in candidates
+            if intersects_xy(self.areas[client_id], lng, lat)
+        }
@@ -0,0 +1,46 @@
+"""Alert rows written by the aggregator on a host outside UTC"""
+import os
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import alert_aggregation
+from alert_aggregation import AlertAggregator, PendingOccurrences
+from models import Alert, Base
+from websocket_manager import ConnectionManager
+
+@pytest.fixture
+def local_time_west_of_utc():
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = "America/New_York"
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = previous
+    time.tzset()
+
+@pytest.fixture
+def session_factory(monkeypatch):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(alert_aggregation, "SessionLocal", factory)
+    return factory
+
+def test_last_seen_is_on_the_created_at_clock(local_time_west_of_utc, session_factory):
+    aggregator = AlertAggregator(ConnectionManager())
+    now = time.time()
+    alert_id = aggregator.insert_alert(None, 1, "geofence", "entered", "high", 26.9, 75.8, None, now)
+
+    pending = PendingOccurrences()
+    pending.count, pending.last_seen = 2, now + 60
+    aggregator.write_occurrences({alert_id: pending})
+
+    db = session_factory()
+    alert = db.get(Alert, alert_id)
+    assert alert.occurrence_count == 3
+    assert 59 <= (alert.last_seen_at - alert.created_at).total_seconds() <= 61
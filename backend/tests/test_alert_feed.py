@@ -0,0 +1,49 @@
+"""Keyset pagination of the police alert feed on SQLite"""
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from alert_feed import alert_page, decode_alert_cursor
+from models import Alert, Base
+
+def make_session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)()
+
+def walk(db, limit, **filters):
+    """Follow next_cursor to the last page; the ids of every page"""
+    pages, cursor = [], None
+    while True:
+        query = db.query(Alert).filter_by(**filters)
+        alerts, cursor = alert_page(query, cursor, limit)
+        pages.append([alert.id for alert in alerts])
+        if cursor is None:
+            return pages
+        assert len(pages) <= 100, "cursor does not advance"
+
+def test_pages_cover_every_alert_once():
+    db = make_session()
+    # Inserted within the same second, as a burst of alerts would be
+    db.add_all([Alert(alert_type="panic", message=f"alert {number}", is_resolved=False) for number in range(7)])
+    db.commit()
+
+    pages = walk(db, 2, is_resolved=False)
+    ids = [alert_id for page in pages for alert_id in page]
+    assert pages == [[7, 6], [5, 4], [3, 2], [1]]
+    assert len(ids) == len(set(ids)) == 7
+
+def test_exact_multiple_of_the_page_size_ends_without_a_cursor():
+    db = make_session()
+    db.add_all([Alert(alert_type="geofence", message=f"alert {number}") for number in range(4)])
+    db.commit()
+
+    assert walk(db, 2) == [[4, 3], [2, 1]]
+
+def test_cursor_round_trips_the_sort_key():
+    db = make_session()
+    db.add(Alert(alert_type="panic", message="only"))
+    db.add(Alert(alert_type="panic", message="next"))
+    db.commit()
+
+    alerts, cursor = alert_page(db.query(Alert), None, 1)
+    assert decode_alert_cursor(cursor) == (alerts[0].created_at, alerts[0].id)
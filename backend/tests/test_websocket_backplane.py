@@ -0,0 +1,90 @@
+"""Fan-out between ConnectionManagers sharing an in-memory backplane hub"""
+import asyncio
+import json
+
+from websocket_backplane import InMemoryBackplane, InMemoryHub
+from websocket_manager import ConnectionManager
+
+class FakeWebSocket:
+    """Records the frames a manager writes to it"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000):
+        pass
+
+async def start_workers(count):
+    """Managers that behave like separate workers, each with one police socket"""
+    hub = InMemoryHub()
+    workers = []
+    for index in range(count):
+        manager = ConnectionManager()
+        await manager.start_backplane(InMemoryBackplane(hub, flush_ms=1))
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, f"police-{index}", user_id=str(index), role="police")
+        workers.append((manager, websocket))
+    return workers
+
+async def stop_workers(workers):
+    for manager, _ in workers:
+        for client_id in list(manager.active_connections):
+            manager.disconnect(client_id)
+        await manager.stop_backplane()
+
+async def settle():
+    # Let the batching publishers flush and the writers drain
+    await asyncio.sleep(0.05)
+
+def test_broadcast_reaches_every_worker_once():
+    async def scenario():
+        workers = await start_workers(2)
+        (first, first_socket), (second, second_socket) = workers
+        try:
+            await first.broadcast_to_role({"type": "alert", "alert_id": "a1"}, "police")
+            await settle()
+            assert [frame["alert_id"] for frame in first_socket.sent] == ["a1"]
+            assert [frame["alert_id"] for frame in second_socket.sent] == ["a1"]
+            assert first.backplane.received_messages == 0
+            assert second.backplane.received_messages == 1
+        finally:
+            await stop_workers(workers)
+
+    asyncio.run(scenario())
+
+def test_broadcasts_from_both_workers_are_not_echoed():
+    async def scenario():
+        workers = await start_workers(2)
+        (first, first_socket), (second, second_socket) = workers
+        try:
+            await first.broadcast({"type": "notice", "from": "first"})
+            await second.broadcast({"type": "notice", "from": "second"})
+            await settle()
+            for socket in (first_socket, second_socket):
+                assert sorted(frame["from"] for frame in socket.sent) == ["first", "second"]
+        finally:
+            await stop_workers(workers)
+
+    asyncio.run(scenario())
+
+def test_events_are_dispatched_once_per_worker():
+    async def scenario():
+        workers = await start_workers(2)
+        (first, _), (second, _) = workers
+        received = {"first": [], "second": []}
+        first.on_event("live_map", received["first"].append)
+        second.on_event("live_map", received["second"].append)
+        try:
+            first.publish_event("live_map", {"tourist_id": 7})
+            await settle()
+            assert received == {"first": [{"tourist_id": 7}], "second": [{"tourist_id": 7}]}
+        finally:
+            await stop_workers(workers)
+
+    asyncio.run(scenario())
@@ -0,0 +1,81 @@
+"""Replaying missed messages to a reconnecting client"""
+import asyncio
+import json
+
+from websocket_manager import ConnectionManager, EventLog
+
+class FakeWebSocket:
+    """Records the frames a manager writes to it"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000):
+        pass
+
+async def reconnect(manager, user_id, role, last_seq, stream):
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, f"{role}-{user_id}", user_id, role=role)
+    manager.resume(f"{role}-{user_id}", last_seq, stream)
+    await asyncio.sleep(0.01)
+    manager.disconnect(f"{role}-{user_id}")
+    return websocket.sent
+
+def test_tourist_traffic_does_not_evict_the_police_replay_window():
+    async def scenario():
+        manager = ConnectionManager(send_queue_size=64)
+        manager.event_log = EventLog(size=10, user_size=2, max_users=1000)
+        stream, last_seq = manager.event_log.stream, manager.event_log.last_seq
+        await manager.broadcast_to_role({"type": "alert", "alert_id": "a1"}, "police")
+        for tourist_id in range(500):
+            await manager.send_user_message({"type": "notice"}, str(tourist_id))
+        await manager.broadcast_to_role({"type": "alert", "alert_id": "a2"}, "police")
+
+        sent = await reconnect(manager, "officer", "police", last_seq, stream)
+        assert sent[0]["type"] == "session"
+        assert [frame["alert_id"] for frame in sent[1:]] == ["a1", "a2"]
+
+    asyncio.run(scenario())
+
+def test_user_messages_replay_until_their_log_is_dropped():
+    async def scenario():
+        manager = ConnectionManager(send_queue_size=64)
+        manager.event_log = EventLog(size=10, user_size=2, max_users=3)
+        stream, last_seq = manager.event_log.stream, manager.event_log.last_seq
+        await manager.send_user_message({"type": "notice", "n": 1}, "7")
+        await manager.broadcast({"type": "maintenance"})
+
+        sent = await reconnect(manager, "7", "tourist", last_seq, stream)
+        assert [frame["type"] for frame in sent] == ["session", "notice", "maintenance"]
+
+        # Enough other users that tourist 7's log is dropped as a whole
+        for user_id in ("1", "2", "3"):
+            await manager.send_user_message({"type": "notice"}, user_id)
+        sent = await reconnect(manager, "7", "tourist", last_seq, stream)
+        assert [frame["type"] for frame in sent] == ["resync_required"]
+
+    asyncio.run(scenario())
+
+def test_resuming_against_another_stream_requires_a_resync():
+    async def scenario():
+        first, second = ConnectionManager(), ConnectionManager()
+        await first.broadcast_to_role({"type": "alert"}, "police")
+        sent = await reconnect(second, "officer", "police", first.event_log.last_seq, first.event_log.stream)
+        assert [frame["type"] for frame in sent] == ["resync_required"]
+
+    asyncio.run(scenario())
+
+def test_a_recreated_user_log_still_reports_the_dropped_messages():
+    log = EventLog(size=10, user_size=5, max_users=1)
+    last_seq = log.last_seq
+    log.append({"kind": "user", "user_id": "7"}, {"type": "notice"})
+    log.append({"kind": "user", "user_id": "8"}, {"type": "notice"})  # Drops user 7's log
+    log.append({"kind": "user", "user_id": "7"}, {"type": "notice"})
+    assert log.since(last_seq, "tourist", "7") is None
+    assert [seq for seq, _, _ in log.since(log.last_seq - 1, "tourist", "7")] == [3]
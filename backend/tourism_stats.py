@@ -0,0 +1,207 @@
+"""Tourism dashboard statistics kept as live counters
+
+The statistics are seeded by one aggregate pass over tourist_profiles
+(conditional sums instead of a query per figure) and then kept current from
+events: profile changes published by the routes that create or update
+profiles, and location pings from the live map feed. Reading them is O(1).
+A periodic reseed corrects for writes made outside those routes.
+"""
+from typing import Dict, List, Optional, Tuple
+from datetime import date, datetime, timedelta
+from sqlalchemy import case, func
+from decouple import config
+import asyncio
+import heapq
+import time
+from database import SessionLocal
+from models import TouristProfile, KYCStatus
+from live_map_feed import LIVE_MAP_EVENT_TOPIC
+from websocket_manager import ConnectionManager, manager
+
+# Tourists with a location update this recent count as active
+TOURISM_STATS_ACTIVE_SECONDS = config("TOURISM_STATS_ACTIVE_SECONDS", default=86400, cast=int)
+
+# Seconds between full reseeds of the counters
+TOURISM_STATS_RESEED_SECONDS = config("TOURISM_STATS_RESEED_SECONDS", default=900, cast=int)
+
+HIGH_RISK_SAFETY_SCORE = 70  # below
+SAFE_SAFETY_SCORE = 80  # at or above
+TOURISM_STATS_TOPIC = "tourist_profile"
+
+def profile_snapshot(profile: Optional[TouristProfile]) -> Optional[Dict]:
+    """The fields of a profile the statistics depend on"""
+    if profile is None:
+        return None
+    return {
+        "safety_score": profile.safety_score,
+        "kyc_pending": profile.kyc_status == KYCStatus.PENDING,
+        "created_at": profile.created_at.isoformat() if profile.created_at else None
+    }
+
+class TourismStats:
+    """Dashboard counters, seeded in one query and maintained from events"""
+
+    def __init__(self, websocket_manager: ConnectionManager,
+                 active_seconds: int = TOURISM_STATS_ACTIVE_SECONDS,
+                 reseed_seconds: int = TOURISM_STATS_RESEED_SECONDS):
+        self.websocket_manager = websocket_manager
+        self.active_seconds = active_seconds
+        self.reseed_seconds = reseed_seconds
+        self.counters: Optional[Dict[str, float]] = None  # None until seeded
+        self.arrivals_day: Optional[date] = None
+        self.active: Dict[int, float] = {}  # tourist_id -> last location update, within the window
+        self.active_expiries: List[Tuple[float, int]] = []  # (due, tourist_id), one per active tourist
+        self.seeded_at: Optional[float] = None
+        self.reseed_task: Optional[asyncio.Task] = None
+        websocket_manager.on_event(TOURISM_STATS_TOPIC, self.apply_change)
+        websocket_manager.on_event(LIVE_MAP_EVENT_TOPIC, self.apply_ping)
+
+    def record_change(self, before: Optional[Dict], after: Optional[Dict]):
+        """Publish a profile change (snapshots from profile_snapshot; None when absent) to every worker"""
+        if before != after:
+            self.websocket_manager.publish_event(TOURISM_STATS_TOPIC, {"before": before, "after": after})
+
+    def contribute(self, snapshot: Optional[Dict], sign: int):
+        if snapshot is None:
+            return
+        counters = self.counters
+        counters["total_tourists"] += sign
+        score = snapshot["safety_score"]
+        if score is not None:
+            counters["high_risk_tourists"] += sign if score < HIGH_RISK_SAFETY_SCORE else 0
+            counters["safe_tourists"] += sign if score >= SAFE_SAFETY_SCORE else 0
+            counters["safety_score_sum"] += sign * score
+            counters["safety_score_count"] += sign
+        counters["kyc_pending"] += sign if snapshot["kyc_pending"] else 0
+
+    def apply_change(self, change: Dict):
+        if self.counters is None:
+            return
+        self.contribute(change["before"], -1)
+        self.contribute(change["after"], 1)
+        after = change["after"]
+        if change["before"] is None and after is not None and after["created_at"]:
+            self.roll_arrivals_day()
+            if datetime.fromisoformat(after["created_at"]).date() == self.arrivals_day:
+                self.counters["new_arrivals_today"] += 1
+
+    def apply_ping(self, update: Dict):
+        """A location update makes its tourist active for the next active_seconds"""
+        tourist_id = update["tourist_id"]
+        if tourist_id not in self.active:
+            heapq.heappush(self.active_expiries, (update["ts"] + self.active_seconds, tourist_id))
+        self.active[tourist_id] = max(update["ts"], self.active.get(tourist_id, 0.0))
+
+    def expire_active(self, now: float):
+        while self.active_expiries and self.active_expiries[0][0] <= now:
+            _, tourist_id = heapq.heappop(self.active_expiries)
+            last_update = self.active.get(tourist_id)
+            if last_update is None:
+                continue
+            if last_update + self.active_seconds > now:
+                # Updated since it was queued: wait for the new due time
+                heapq.heappush(self.active_expiries, (last_update + self.active_seconds, tourist_id))
+            else:
+                del self.active[tourist_id]
+
+    def roll_arrivals_day(self):
+        today = date.today()
+        if self.arrivals_day != today:
+            if self.arrivals_day is not None:
+                self.counters["new_arrivals_today"] = 0
+            self.arrivals_day = today
+
+    def load_from_database(self) -> Tuple[Dict[str, float], Dict[int, float], date]:
+        """All counters in one aggregate pass, plus the active tourists' last updates"""
+        today = date.today()
+        cutoff = datetime.now() - timedelta(seconds=self.active_seconds)
+        db = SessionLocal()
+        try:
+            row = db.query(
+                func.count(TouristProfile.id),
+                func.sum(case((TouristProfile.safety_score < HIGH_RISK_SAFETY_SCORE, 1), else_=0)),
+                func.sum(case((TouristProfile.safety_score >= SAFE_SAFETY_SCORE, 1), else_=0)),
+                func.sum(case((TouristProfile.created_at >= today, 1), else_=0)),
+                func.sum(case((TouristProfile.kyc_status == KYCStatus.PENDING, 1), else_=0)),
+                func.sum(TouristProfile.safety_score),
+                func.count(TouristProfile.safety_score)
+            ).one()
+            # Active tourists are tracked individually so each one expires on time
+            active = {
+                tourist_id: last_update.timestamp()
+                for tourist_id, last_update in db.query(
+                    TouristProfile.id, TouristProfile.last_location_update
+                ).filter(TouristProfile.last_location_update >= cutoff)
+            }
+        finally:
+            db.close()
+
+        total, high_risk, safe, arrivals, kyc_pending, score_sum, score_count = row
+        counters = {
+            "total_tourists": total or 0,
+            "high_risk_tourists": high_risk or 0,
+            "safe_tourists": safe or 0,
+            "new_arrivals_today": arrivals or 0,
+            "kyc_pending": kyc_pending or 0,
+            "safety_score_sum": float(score_sum or 0.0),
+            "safety_score_count": score_count or 0
+        }
+        return counters, active, today
+
+    async def reseed(self):
+        try:
+            counters, active, today = await asyncio.to_thread(self.load_from_database)
+        except Exception as e:
+            print(f"Error seeding tourism statistics: {e}")
+            return
+        self.counters, self.arrivals_day = counters, today
+        # Keep pings that arrived while the query ran
+        for tourist_id, last_update in active.items():
+            self.active[tourist_id] = max(last_update, self.active.get(tourist_id, 0.0))
+        self.active_expiries = [(last_update + self.active_seconds, tourist_id)
+                                for tourist_id, last_update in self.active.items()]
+        heapq.heapify(self.active_expiries)
+        self.seeded_at = time.time()
+
+    async def reseed_loop(self):
+        while True:
+            await asyncio.sleep(self.reseed_seconds)
+            await self.reseed()
+
+    async def start(self):
+        await self.reseed()
+        if self.reseed_task is None or self.reseed_task.done():
+            self.reseed_task = asyncio.create_task(self.reseed_loop())
+
+    async def stop(self):
+        if self.reseed_task:
+            self.reseed_task.cancel()
+            try:
+                await self.reseed_task
+            except asyncio.CancelledError:
+                pass
+            self.reseed_task = None
+
+    async def get_stats(self) -> Dict:
+        if self.counters is None:
+            await self.reseed()
+            if self.counters is None:
+                raise RuntimeError("Tourism statistics are unavailable")
+        self.expire_active(time.time())
+        self.roll_arrivals_day()
+        counters = self.counters
+        return {
+            "total_tourists": counters["total_tourists"],
+            "active_tourists": len(self.active),
+            "high_risk_tourists": counters["high_risk_tourists"],
+            "safe_tourists": counters["safe_tourists"],
+            "new_arrivals_today": counters["new_arrivals_today"],
+            "departures_today": 0,  # Mock data
+            "avg_safety_score": (
+                counters["safety_score_sum"] / counters["safety_score_count"] if counters["safety_score_count"] else 0.0
+            ),
+            "kyc_pending": counters["kyc_pending"]
+        }
+
+# Global tourism statistics instance
+tourism_stats = TourismStats(manager)
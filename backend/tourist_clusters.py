@@ -0,0 +1,271 @@
+"""Multi-resolution tourist clusters for the police map
+
+Tourists are bucketed into square web-mercator grid cells at every zoom level
+from TOURIST_CLUSTER_MIN_ZOOM to TOURIST_CLUSTER_MAX_ZOOM. Each cell keeps a
+running aggregate (count, coordinate sums, status counts), so a ping moves a
+tourist between at most one cell per level and a viewport query only reads the
+cells it covers - the cost follows movement and screen size, not population.
+Beyond the maximum zoom, individual tourists are returned.
+The index is fed by the live map feed's deltas.
+"""
+from typing import Dict, List, Optional, Tuple
+from decouple import config
+import math
+from live_map_feed import LiveMapFeed, live_map_feed
+
+TOURIST_CLUSTER_MIN_ZOOM = config("TOURIST_CLUSTER_MIN_ZOOM", default=3, cast=int)
+TOURIST_CLUSTER_MAX_ZOOM = config("TOURIST_CLUSTER_MAX_ZOOM", default=14, cast=int)
+
+# Cluster cell edge in screen pixels (256 px map tiles)
+TOURIST_CLUSTER_CELL_PX = config("TOURIST_CLUSTER_CELL_PX", default=64, cast=int)
+
+# Statuses counted per cell; every other status counts as "active"
+COUNTED_STATUSES = ("alert", "emergency", "offline")
+MAX_MERCATOR_LAT = 85.05112878
+
+def mercator_fraction(lat: float, lng: float) -> Tuple[float, float]:
+    """Web-mercator position as fractions of the world (0..1, y growing southwards)"""
+    lat = max(-MAX_MERCATOR_LAT, min(MAX_MERCATOR_LAT, lat))
+    sin_lat = math.sin(math.radians(lat))
+    x = (lng + 180.0) / 360.0
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1.0 - 1e-12), min(max(y, 0.0), 1.0 - 1e-12)
+
+def cell_key(x: int, y: int) -> int:
+    """Pack a cell's grid coordinates into one int (cheaper to hold than a tuple)"""
+    return (x << 32) | y
+
+class ClusterCell:
+    """Running aggregate of the tourists in one grid cell"""
+
+    # One counter per status except "active", which is the remainder of count
+    __slots__ = ("count", "sum_lat", "sum_lng", "id_xor", "alert", "emergency", "offline")
+
+    def __init__(self):
+        self.count = 0
+        self.sum_lat = 0.0
+        self.sum_lng = 0.0
+        # XOR of member ids: when count is 1 it is the single member's id
+        self.id_xor = 0
+        self.alert = 0
+        self.emergency = 0
+        self.offline = 0
+
+    def add(self, tourist_id: int, lat: float, lng: float, status: str, sign: int = 1):
+        self.count += sign
+        self.sum_lat += sign * lat
+        self.sum_lng += sign * lng
+        self.id_xor ^= tourist_id
+        if status in COUNTED_STATUSES:
+            setattr(self, status, getattr(self, status) + sign)
+
+    def status_counts(self) -> Dict[str, int]:
+        return {
+            "active": self.count - self.alert - self.emergency - self.offline,
+            "alert": self.alert,
+            "emergency": self.emergency,
+            "offline": self.offline
+        }
+
+    def risk_level(self) -> str:
+        if self.emergency:
+            return "critical"
+        if self.alert:
+            return "medium"
+        return "low"
+
+class ClusteredTourist:
+    """A tourist's last known position and status, and its cell at max zoom"""
+
+    __slots__ = ("tourist_id", "lat", "lng", "status", "safety_score", "cell")
+
+    def __init__(self, tourist_id: int, lat: float, lng: float, status: str,
+                 safety_score: Optional[float], cell: Tuple[int, int]):
+        self.tourist_id = tourist_id
+        self.lat = lat
+        self.lng = lng
+        self.status = status
+        self.safety_score = safety_score
+        self.cell = cell
+
+class TouristClusterIndex:
+    """Grid cells per zoom level, updated incrementally as tourists move"""
+
+    def __init__(self, min_zoom: int = TOURIST_CLUSTER_MIN_ZOOM, max_zoom: int = TOURIST_CLUSTER_MAX_ZOOM,
+                 cell_px: int = TOURIST_CLUSTER_CELL_PX):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        # Cells across the world at max_zoom; each coarser level halves it
+        self.finest_cells = (256 // cell_px) * (1 << max_zoom)
+        self.levels: List[Dict[int, ClusterCell]] = [{} for _ in range(min_zoom, max_zoom + 1)]
+        # (cells, shift from the finest cell) from the finest level to the coarsest
+        self.levels_fine_to_coarse = [
+            (self.levels[zoom - min_zoom], max_zoom - zoom) for zoom in range(max_zoom, min_zoom - 1, -1)
+        ]
+        # Members are listed only at max_zoom, to return individual points beyond it
+        self.finest_members: Dict[int, set] = {}
+        self.tourists: Dict[int, ClusteredTourist] = {}
+
+    def __len__(self) -> int:
+        return len(self.tourists)
+
+    def finest_cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        x, y = mercator_fraction(lat, lng)
+        return int(x * self.finest_cells), int(y * self.finest_cells)
+
+    def apply(self, tourist: ClusteredTourist, sign: int):
+        """Add (sign=1) or remove (sign=-1) a tourist's contribution at every level"""
+        fx, fy = tourist.cell
+        for cells, shift in self.levels_fine_to_coarse:
+            key = cell_key(fx >> shift, fy >> shift)
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = ClusterCell()
+            cell.add(tourist.tourist_id, tourist.lat, tourist.lng, tourist.status, sign)
+            if cell.count == 0:
+                del cells[key]
+
+        key = cell_key(fx, fy)
+        if sign > 0:
+            self.finest_members.setdefault(key, set()).add(tourist.tourist_id)
+        else:
+            self.discard_member(key, tourist.tourist_id)
+
+    def discard_member(self, key: int, tourist_id: int):
+        members = self.finest_members.get(key)
+        if members is not None:
+            members.discard(tourist_id)
+            if not members:
+                del self.finest_members[key]
+
+    def move(self, tourist: ClusteredTourist, lat: float, lng: float):
+        """Move a tourist, touching cell membership only at the levels where its cell changes"""
+        old_x, old_y = tourist.cell
+        new_x, new_y = new_cell = self.finest_cell(lat, lng)
+        d_lat, d_lng = lat - tourist.lat, lng - tourist.lng
+
+        for cells, shift in self.levels_fine_to_coarse:
+            old_key = cell_key(old_x >> shift, old_y >> shift)
+            new_key = cell_key(new_x >> shift, new_y >> shift)
+            if old_key == new_key:
+                # Same cell: only the centroid moves
+                cell = cells[old_key]
+                cell.sum_lat += d_lat
+                cell.sum_lng += d_lng
+                continue
+            cell = cells[old_key]
+            cell.add(tourist.tourist_id, tourist.lat, tourist.lng, tourist.status, -1)
+            if cell.count == 0:
+                del cells[old_key]
+            cell = cells.get(new_key)
+            if cell is None:
+                cell = cells[new_key] = ClusterCell()
+            cell.add(tourist.tourist_id, lat, lng, tourist.status)
+
+        if new_cell != tourist.cell:
+            self.discard_member(cell_key(old_x, old_y), tourist.tourist_id)
+            self.finest_members.setdefault(cell_key(new_x, new_y), set()).add(tourist.tourist_id)
+        tourist.lat, tourist.lng, tourist.cell = lat, lng, new_cell
+
+    def upsert(self, tourist_id: int, lat: float, lng: float, status: str, safety_score: Optional[float] = None):
+        previous = self.tourists.get(tourist_id)
+        if previous is not None:
+            self.apply(previous, -1)
+            if safety_score is None:
+                safety_score = previous.safety_score
+        tourist = ClusteredTourist(tourist_id, lat, lng, status, safety_score, self.finest_cell(lat, lng))
+        self.tourists[tourist_id] = tourist
+        self.apply(tourist, 1)
+
+    def remove(self, tourist_id: int):
+        tourist = self.tourists.pop(tourist_id, None)
+        if tourist is not None:
+            self.apply(tourist, -1)
+
+    def apply_delta(self, delta: Dict):
+        """Apply a live map delta"""
+        for entry in delta["appeared"]:
+            self.upsert(entry["tourist_id"], entry["location"]["lat"], entry["location"]["lng"],
+                        entry["status"], entry.get("safety_score"))
+        for entry in delta["moved"]:
+            tourist = self.tourists.get(entry["tourist_id"])
+            if tourist is not None:
+                self.move(tourist, entry["location"]["lat"], entry["location"]["lng"])
+        for entry in delta["status"]:
+            tourist = self.tourists.get(entry["tourist_id"])
+            if tourist is not None:
+                self.upsert(tourist.tourist_id, tourist.lat, tourist.lng,
+                            entry["status"], entry.get("safety_score"))
+        for tourist_id in delta["disappeared"]:
+            self.remove(tourist_id)
+
+    def point(self, tourist_id: int) -> Dict:
+        tourist = self.tourists[tourist_id]
+        return {
+            "tourist_id": tourist_id,
+            "location": {"lat": tourist.lat, "lng": tourist.lng},
+            "status": tourist.status,
+            "safety_score": tourist.safety_score
+        }
+
+    def cells_in_view(self, cells: Dict[int, object], zoom: int,
+                      bbox: Tuple[float, float, float, float]):
+        """(key, cell) pairs of one level inside a lng/lat bounding box"""
+        min_lng, min_lat, max_lng, max_lat = bbox
+        shift = self.max_zoom - zoom
+        left, top = self.finest_cell(max_lat, min_lng)
+        right, bottom = self.finest_cell(min_lat, max_lng)
+        x_range = range(left >> shift, (right >> shift) + 1)
+        y_range = range(top >> shift, (bottom >> shift) + 1)
+        if len(x_range) * len(y_range) <= len(cells):
+            for x in x_range:
+                for y in y_range:
+                    cell = cells.get(cell_key(x, y))
+                    if cell is not None:
+                        yield (x, y), cell
+        else:
+            # Sparse level: scanning its occupied cells is cheaper than probing the viewport
+            for key, cell in cells.items():
+                x, y = key >> 32, key & 0xFFFFFFFF
+                if x in x_range and y in y_range:
+                    yield (x, y), cell
+
+    def query(self, bbox: Tuple[float, float, float, float], zoom: int) -> Dict:
+        """Clusters and single tourists visible in a viewport at a zoom level"""
+        zoom = max(self.min_zoom, zoom)
+        clusters, points = [], []
+        min_lng, min_lat, max_lng, max_lat = bbox
+
+        if zoom > self.max_zoom:
+            for _, members in self.cells_in_view(self.finest_members, self.max_zoom, bbox):
+                for tourist_id in members:
+                    tourist = self.tourists[tourist_id]
+                    if min_lat <= tourist.lat <= max_lat and min_lng <= tourist.lng <= max_lng:
+                        points.append(self.point(tourist_id))
+        else:
+            for (x, y), cell in self.cells_in_view(self.levels[zoom - self.min_zoom], zoom, bbox):
+                if cell.count == 1:
+                    points.append(self.point(cell.id_xor))
+                    continue
+                clusters.append({
+                    "id": f"{zoom}/{x}/{y}",
+                    "center": {"lat": cell.sum_lat / cell.count, "lng": cell.sum_lng / cell.count},
+                    "tourist_count": cell.count,
+                    "status_counts": cell.status_counts(),
+                    "risk_level": cell.risk_level()
+                })
+
+        return {
+            "zoom": zoom,
+            "clusters": clusters,
+            "points": points,
+            "total_tourists": len(self.tourists)
+        }
+
+def attach_cluster_index(feed: LiveMapFeed) -> TouristClusterIndex:
+    index = TouristClusterIndex()
+    feed.add_listener(index.apply_delta)
+    return index
+
+# Global cluster index, kept current by the live map feed
+tourist_cluster_index = attach_cluster_index(live_map_feed)
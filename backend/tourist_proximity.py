@@ -0,0 +1,224 @@
+"""Nearest-tourist search around an incident location
+
+Current tourist positions are kept in a pyramid of uniform lng/lat grids:
+tourists are filed under fine cells, and each coarser level lists the
+occupied cells of the level below it. Every ping updates at most one cell per
+level. A k-nearest query is a best-first search over that pyramid - ring by
+ring around the incident at the top level, then down into the cells whose
+distance bound could still beat the k-th best tourist found - so its cost
+follows the local density, not the number of tourists.
+"""
+from typing import Dict, List, Optional, Set, Tuple
+from datetime import datetime
+from decouple import config
+import heapq
+import math
+import time
+from geofence_index import EARTH_RADIUS_KM, haversine_m
+from live_map_feed import LIVE_MAP_EVENT_TOPIC, LIVE_MAP_OFFLINE_SECONDS, LiveMapFeed, live_map_feed
+
+# Finest grid cell edge in degrees (about 220 m of latitude); each level above is
+# TOURIST_PROXIMITY_LEVEL_FACTOR times coarser
+TOURIST_PROXIMITY_CELL_DEG = config("TOURIST_PROXIMITY_CELL_DEG", default=0.002, cast=float)
+TOURIST_PROXIMITY_LEVEL_FACTOR = config("TOURIST_PROXIMITY_LEVEL_FACTOR", default=8, cast=int)
+TOURIST_PROXIMITY_LEVELS = config("TOURIST_PROXIMITY_LEVELS", default=3, cast=int)
+
+# Defaults for incident lookups: tourists returned, and the oldest position considered
+TOURIST_PROXIMITY_DEFAULT_K = config("TOURIST_PROXIMITY_DEFAULT_K", default=10, cast=int)
+TOURIST_PROXIMITY_MAX_AGE = config("TOURIST_PROXIMITY_MAX_AGE", default=LIVE_MAP_OFFLINE_SECONDS, cast=int)
+
+EARTH_RADIUS_M = EARTH_RADIUS_KM * 1000
+RING_SEARCH = -1  # Queue entry level for the next ring of top-level cells
+
+def bound_m(lat: float, d_lat: float, d_lng: float) -> float:
+    """Lower bound on the distance from latitude lat to a point d_lat degrees of
+    latitude and d_lng degrees of longitude away"""
+    # Nearest point of a meridian d_lng away, wherever the other point lies on it
+    across = math.asin(min(1.0, math.cos(math.radians(lat)) * math.sin(min(math.radians(d_lng), math.pi / 2))))
+    return EARTH_RADIUS_M * max(math.radians(d_lat), across)
+
+class TouristPosition:
+    """A tourist's last reported position"""
+
+    __slots__ = ("lat", "lng", "ts", "cell")
+
+    def __init__(self, lat: float, lng: float, ts: float, cell: Tuple[int, int]):
+        self.lat = lat
+        self.lng = lng
+        self.ts = ts
+        self.cell = cell
+
+class TouristProximityIndex:
+    """Grid pyramid of current tourist positions for k-nearest queries"""
+
+    def __init__(self, feed: LiveMapFeed, cell_deg: float = TOURIST_PROXIMITY_CELL_DEG,
+                 factor: int = TOURIST_PROXIMITY_LEVEL_FACTOR, levels: int = TOURIST_PROXIMITY_LEVELS):
+        self.feed = feed
+        self.cell_deg = cell_deg
+        self.factor = factor
+        self.level_deg = [cell_deg * factor ** level for level in range(levels)]
+        self.tourists: Dict[int, TouristPosition] = {}
+        # Level 0: cell -> tourist ids; level n: cell -> occupied cells of level n - 1
+        self.cells: List[Dict[Tuple[int, int], Set]] = [{} for _ in range(levels)]
+        feed.websocket_manager.on_event(LIVE_MAP_EVENT_TOPIC, self.apply_ping)
+        feed.add_listener(self.apply_delta)
+
+    def __len__(self) -> int:
+        return len(self.tourists)
+
+    def cell_of(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lng / self.cell_deg), math.floor(lat / self.cell_deg))
+
+    def file(self, cell: Tuple[int, int], tourist_id: int):
+        member = tourist_id
+        for cells in self.cells:
+            members = cells.get(cell)
+            if members is None:
+                members = cells[cell] = set()
+            elif member in members:
+                return
+            members.add(member)
+            member, cell = cell, (cell[0] // self.factor, cell[1] // self.factor)
+
+    def unfile(self, cell: Tuple[int, int], tourist_id: int):
+        member = tourist_id
+        for cells in self.cells:
+            members = cells.get(cell)
+            if members is None:
+                return
+            members.discard(member)
+            if members:
+                return
+            del cells[cell]
+            member, cell = cell, (cell[0] // self.factor, cell[1] // self.factor)
+
+    def upsert(self, tourist_id: int, lat: float, lng: float, ts: float):
+        cell = self.cell_of(lat, lng)
+        tourist = self.tourists.get(tourist_id)
+        if tourist is None:
+            self.tourists[tourist_id] = TouristPosition(lat, lng, ts, cell)
+            self.file(cell, tourist_id)
+            return
+        if ts < tourist.ts:
+            return  # An older position arriving late
+        if cell != tourist.cell:
+            self.unfile(tourist.cell, tourist_id)
+            self.file(cell, tourist_id)
+        tourist.lat, tourist.lng, tourist.ts, tourist.cell = lat, lng, ts, cell
+
+    def remove(self, tourist_id: int):
+        tourist = self.tourists.pop(tourist_id, None)
+        if tourist is not None:
+            self.unfile(tourist.cell, tourist_id)
+
+    def apply_ping(self, update: Dict):
+        """Track every ping as it is recorded, ahead of the live map's tick"""
+        self.upsert(update["tourist_id"], update["lat"], update["lng"], update["ts"])
+
+    def apply_delta(self, delta: Dict):
+        """Seed from tourists appearing on the live map and drop those leaving it"""
+        for entry in delta["appeared"]:
+            self.upsert(entry["tourist_id"], entry["location"]["lat"], entry["location"]["lng"],
+                        datetime.fromisoformat(entry["last_update"]).timestamp())
+        for tourist_id in delta["disappeared"]:
+            self.remove(tourist_id)
+
+    def nearest_tourists(self, lat: float, lng: float, k: int = TOURIST_PROXIMITY_DEFAULT_K,
+                         max_age: Optional[float] = TOURIST_PROXIMITY_MAX_AGE,
+                         max_distance_m: Optional[float] = None,
+                         exclude: Optional[int] = None) -> List[Dict]:
+        """The k tourists closest to a location, nearest first.
+
+        max_age skips positions older than that many seconds, max_distance_m
+        limits the search radius and exclude leaves out one tourist (e.g. the
+        one raising the incident).
+        """
+        if k <= 0:
+            return []
+        min_ts = time.time() - max_age if max_age is not None else None
+        limit = max_distance_m if max_distance_m is not None else math.inf
+        best: List[Tuple[float, int]] = []  # max-heap on distance: (-distance, tourist_id)
+
+        def kth_distance() -> float:
+            return -best[0][0] if len(best) >= k else limit
+
+        top = len(self.cells) - 1
+        top_cells = self.cells[top]
+        scale = self.factor ** top
+        fx, fy = self.cell_of(lat, lng)
+        tx, ty = fx // scale, fy // scale
+
+        # (distance bound, level, cell); entries are expanded nearest bound first
+        queue = [(0.0, RING_SEARCH, (0, 0))]
+        while queue and queue[0][0] <= kth_distance():
+            _, level, cell = heapq.heappop(queue)
+            if level == 0:
+                for tourist_id in self.cells[0].get(cell, ()):
+                    tourist = self.tourists[tourist_id]
+                    if tourist_id == exclude or (min_ts is not None and tourist.ts < min_ts):
+                        continue
+                    distance = haversine_m(lat, lng, tourist.lat, tourist.lng)
+                    if distance > limit:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, tourist_id))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, tourist_id))
+            elif level > 0:
+                for child in self.cells[level].get(cell, ()):
+                    heapq.heappush(queue, (self.cell_bound_m(lat, lng, level - 1, child), level - 1, child))
+            else:
+                radius = cell[0]
+                if (2 * radius + 1) ** 2 > len(top_cells):
+                    # Sparse: queue every remaining occupied cell rather than probe ever wider empty rings
+                    for other in top_cells:
+                        if abs(other[0] - tx) >= radius or abs(other[1] - ty) >= radius:
+                            heapq.heappush(queue, (self.cell_bound_m(lat, lng, top, other), top, other))
+                    continue
+                for other in self.ring(tx, ty, radius):
+                    if other in top_cells:
+                        heapq.heappush(queue, (self.cell_bound_m(lat, lng, top, other), top, other))
+                heapq.heappush(queue, (self.ring_bound_m(lat, lng, tx, ty, radius), RING_SEARCH, (radius + 1, 0)))
+
+        return [self.result(tourist_id, -negative_distance) for negative_distance, tourist_id in sorted(best, reverse=True)]
+
+    @staticmethod
+    def ring(cx: int, cy: int, radius: int):
+        if radius == 0:
+            yield (cx, cy)
+            return
+        for x in range(cx - radius, cx + radius + 1):
+            yield (x, cy - radius)
+            yield (x, cy + radius)
+        for y in range(cy - radius + 1, cy + radius):
+            yield (cx - radius, y)
+            yield (cx + radius, y)
+
+    def cell_bound_m(self, lat: float, lng: float, level: int, cell: Tuple[int, int]) -> float:
+        """Lower bound on the distance to any point of a cell"""
+        size = self.level_deg[level]
+        x, y = cell
+        d_lat = max(0.0, y * size - lat, lat - (y + 1) * size)
+        d_lng = max(0.0, x * size - lng, lng - (x + 1) * size)
+        return bound_m(lat, d_lat, d_lng)
+
+    def ring_bound_m(self, lat: float, lng: float, tx: int, ty: int, radius: int) -> float:
+        """Lower bound on the distance to any point outside the top-level rings searched so far"""
+        size = self.level_deg[-1]
+        d_lat = min(lat - (ty - radius) * size, (ty + radius + 1) * size - lat)
+        d_lng = min(lng - (tx - radius) * size, (tx + radius + 1) * size - lng)
+        return min(bound_m(lat, d_lat, 0.0), bound_m(lat, 0.0, d_lng))
+
+    def result(self, tourist_id: int, distance: float) -> Dict:
+        tourist = self.tourists[tourist_id]
+        entry = self.feed.state.get(tourist_id)
+        return {
+            "tourist_id": tourist_id,
+            "location": {"lat": tourist.lat, "lng": tourist.lng},
+            "distance_m": round(distance, 1),
+            "status": entry["status"] if entry else None,
+            "last_update": datetime.fromtimestamp(tourist.ts).isoformat()
+        }
+
+# Global proximity index, kept current by location pings and the live map feed
+tourist_proximity_index = TouristProximityIndex(live_map_feed)
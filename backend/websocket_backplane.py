@@ -0,0 +1,234 @@
+"""Cross-process pub/sub backplane for WebSocket fan-out
+
+Each uvicorn worker holds only its own sockets. A ConnectionManager delivers a
+message to its local sockets straight away and publishes it on the backplane
+so every other worker can deliver it to theirs. Publishes are buffered and
+sent in batches: one backplane message carries many routed messages.
+
+Backends:
+    memory  in-process hub; managers sharing a hub behave like separate workers
+    redis   Redis PUBLISH/SUBSCRIBE on one channel (REDIS_URL)
+"""
+from typing import Callable, Dict, List, Optional
+from decouple import config
+import asyncio
+import json
+import uuid
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Only needed for the redis backend
+    aioredis = None
+
+# Backplane backend: "memory" (single process) or "redis"
+WEBSOCKET_BACKPLANE = config("WEBSOCKET_BACKPLANE", default="memory")
+REDIS_URL = config("REDIS_URL", default="redis://localhost:6379/0")
+WEBSOCKET_BACKPLANE_CHANNEL = config("WEBSOCKET_BACKPLANE_CHANNEL", default="securesafar:websocket")
+
+# Published messages per backplane batch, and the longest a message waits for its batch to fill
+WEBSOCKET_BACKPLANE_BATCH_SIZE = config("WEBSOCKET_BACKPLANE_BATCH_SIZE", default=100, cast=int)
+WEBSOCKET_BACKPLANE_FLUSH_MS = config("WEBSOCKET_BACKPLANE_FLUSH_MS", default=5, cast=int)
+
+# Messages buffered while the backplane is unreachable before the oldest are dropped
+WEBSOCKET_BACKPLANE_MAX_PENDING = config("WEBSOCKET_BACKPLANE_MAX_PENDING", default=10000, cast=int)
+
+class Backplane:
+    """Batches published envelopes and hands received ones to the manager.
+
+    Subclasses implement send_batch, and subscribe/unsubscribe if they need a
+    connection. Envelopes are dicts tagged with the publishing backplane's
+    origin id; a backplane ignores its own envelopes because the publishing
+    manager has already delivered them locally.
+    """
+
+    def __init__(self, batch_size: int = WEBSOCKET_BACKPLANE_BATCH_SIZE,
+                 flush_ms: int = WEBSOCKET_BACKPLANE_FLUSH_MS,
+                 max_pending: int = WEBSOCKET_BACKPLANE_MAX_PENDING):
+        self.origin = uuid.uuid4().hex
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.max_pending = max_pending
+        self.pending: List[Dict] = []
+        self.has_pending = asyncio.Event()
+        self.batch_full = asyncio.Event()
+        self.handler: Optional[Callable[[Dict], None]] = None
+        self.publisher_task: Optional[asyncio.Task] = None
+        self.published_batches = 0
+        self.published_messages = 0
+        self.received_messages = 0
+        self.dropped_messages = 0
+
+    async def start(self, handler: Callable[[Dict], None]):
+        """Subscribe and start the batching publisher; handler receives remote envelopes"""
+        self.handler = handler
+        await self.subscribe()
+        self.publisher_task = asyncio.create_task(self.publish_loop())
+
+    async def close(self):
+        """Flush what is pending, then stop publishing and receiving"""
+        if self.publisher_task:
+            self.publisher_task.cancel()
+            try:
+                await self.publisher_task
+            except asyncio.CancelledError:
+                pass
+            self.publisher_task = None
+        if self.pending:
+            batch, self.pending = self.pending, []
+            await self.send_batch_safely(batch)
+        await self.unsubscribe()
+
+    def publish(self, envelope: Dict):
+        """Queue an envelope for the next batch without waiting"""
+        envelope["origin"] = self.origin
+        if len(self.pending) >= self.max_pending:
+            self.pending.pop(0)
+            self.dropped_messages += 1
+        self.pending.append(envelope)
+        self.has_pending.set()
+        if len(self.pending) >= self.batch_size:
+            self.batch_full.set()
+
+    async def publish_loop(self):
+        while True:
+            await self.has_pending.wait()
+            if len(self.pending) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self.batch_full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            if not self.pending:
+                self.has_pending.clear()
+            if len(self.pending) < self.batch_size:
+                self.batch_full.clear()
+            await self.send_batch_safely(batch)
+
+    async def send_batch_safely(self, batch: List[Dict]):
+        try:
+            await self.send_batch(batch)
+            self.published_batches += 1
+            self.published_messages += len(batch)
+        except Exception as e:
+            self.dropped_messages += len(batch)
+            print(f"Error publishing {len(batch)} WebSocket messages to the backplane: {e}")
+
+    def receive(self, batch: List[Dict]):
+        """Hand another process's envelopes to the local manager"""
+        for envelope in batch:
+            if envelope.get("origin") == self.origin:
+                continue
+            self.received_messages += 1
+            try:
+                self.handler(envelope)
+            except Exception as e:
+                print(f"Error delivering backplane message: {e}")
+
+    async def subscribe(self):
+        pass
+
+    async def unsubscribe(self):
+        pass
+
+    async def send_batch(self, batch: List[Dict]):
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict:
+        return {
+            "backend": type(self).__name__,
+            "pending": len(self.pending),
+            "published_batches": self.published_batches,
+            "published_messages": self.published_messages,
+            "received_messages": self.received_messages,
+            "dropped_messages": self.dropped_messages
+        }
+
+class InMemoryHub:
+    """Process-local stand-in for a broker channel"""
+
+    def __init__(self):
+        self.backplanes: List["InMemoryBackplane"] = []
+
+    def deliver(self, batch: List[Dict]):
+        for backplane in list(self.backplanes):
+            backplane.receive(batch)
+
+default_hub = InMemoryHub()
+
+class InMemoryBackplane(Backplane):
+    """Backplane between managers of one process (single worker, or tests)"""
+
+    def __init__(self, hub: InMemoryHub = default_hub, **kwargs):
+        super().__init__(**kwargs)
+        self.hub = hub
+
+    async def subscribe(self):
+        self.hub.backplanes.append(self)
+
+    async def unsubscribe(self):
+        if self in self.hub.backplanes:
+            self.hub.backplanes.remove(self)
+
+    async def send_batch(self, batch: List[Dict]):
+        self.hub.deliver(batch)
+
+class RedisBackplane(Backplane):
+    """Backplane over Redis pub/sub; every worker subscribes to one channel"""
+
+    def __init__(self, url: str = REDIS_URL, channel: str = WEBSOCKET_BACKPLANE_CHANNEL, **kwargs):
+        if aioredis is None:
+            raise RuntimeError("The redis package is required for the redis WebSocket backplane")
+        super().__init__(**kwargs)
+        self.url = url
+        self.channel = channel
+        self.client = None
+        self.pubsub = None
+        self.listener_task: Optional[asyncio.Task] = None
+
+    async def subscribe(self):
+        self.client = aioredis.from_url(self.url)
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await self.pubsub.subscribe(self.channel)
+        self.listener_task = asyncio.create_task(self.listen_loop())
+
+    async def unsubscribe(self):
+        if self.listener_task:
+            self.listener_task.cancel()
+            try:
+                await self.listener_task
+            except asyncio.CancelledError:
+                pass
+            self.listener_task = None
+        if self.pubsub:
+            await self.pubsub.aclose()
+            self.pubsub = None
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    async def listen_loop(self):
+        while True:
+            try:
+                async for message in self.pubsub.listen():
+                    if message.get("type") == "message":
+                        self.receive(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"WebSocket backplane subscription lost, resubscribing: {e}")
+                await asyncio.sleep(1)
+                try:
+                    await self.pubsub.subscribe(self.channel)
+                except Exception:
+                    pass
+
+    async def send_batch(self, batch: List[Dict]):
+        await self.client.publish(self.channel, json.dumps(batch))
+
+def create_backplane(backend: str = WEBSOCKET_BACKPLANE) -> Backplane:
+    """Backplane for the configured backend"""
+    if backend == "redis":
+        return RedisBackplane()
+    if backend == "memory":
+        return InMemoryBackplane()
+    raise ValueError(f"Unknown WebSocket backplane: {backend}")
@@ -1,71 +1,624 @@
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional, Set, Iterable, Tuple, Union
 from fastapi import WebSocket
+from decouple import config
+from shapely.geometry.base import BaseGeometry
+from spatial_subscriptions import AreaSubscriptionIndex
+from websocket_backplane import Backplane
+from collections import OrderedDict, deque
+import asyncio
+import bisect
+import json
+import time
+import uuid
 
-class ConnectionManager:
+try:
+    import msgpack
+except ImportError:  # Binary frames are optional; clients fall back to JSON text
+    msgpack = None
+
+SUPPORTED_ENCODINGS = ("json", "msgpack") if msgpack else ("json",)
+
+# Outbound messages buffered per connection before it counts as a slow consumer
+WEBSOCKET_SEND_QUEUE_SIZE = config("WEBSOCKET_SEND_QUEUE_SIZE", default=256, cast=int)
+
+# What happens when a slow consumer's queue overflows:
+# "drop" disconnects it, "downgrade" first sheds its oldest messages and
+# disconnects only if it overflows again before catching up
+WEBSOCKET_SLOW_CONSUMER_POLICY = config("WEBSOCKET_SLOW_CONSUMER_POLICY", default="downgrade")
+
+# Seconds between server pings, and silence after which a connection is reaped.
+# Any message from the client (including its "pong") counts as activity.
+WEBSOCKET_HEARTBEAT_INTERVAL = config("WEBSOCKET_HEARTBEAT_INTERVAL", default=20, cast=int)
+WEBSOCKET_HEARTBEAT_TIMEOUT = config("WEBSOCKET_HEARTBEAT_TIMEOUT", default=60, cast=int)
+
+# Routed messages kept for clients resuming after a reconnect: per audience for
+# broadcasts and for each role, and per user for messages addressed to one user,
+# with at most WEBSOCKET_EVENT_LOG_USERS user logs (least recently written dropped)
+WEBSOCKET_EVENT_LOG_SIZE = config("WEBSOCKET_EVENT_LOG_SIZE", default=1000, cast=int)
+WEBSOCKET_EVENT_LOG_USER_SIZE = config("WEBSOCKET_EVENT_LOG_USER_SIZE", default=50, cast=int)
+WEBSOCKET_EVENT_LOG_USERS = config("WEBSOCKET_EVENT_LOG_USERS", default=10000, cast=int)
+
+class OutboundFrame:
+    """A message encoded at most once per wire format, shared by every recipient"""
+    
+    __slots__ = ("payload", "text", "binary", "text_bytes")
+    
+    def __init__(self, payload: Optional[dict] = None, text: Optional[str] = None):
+        self.payload = payload
+        self.text = text
+        self.binary: Optional[bytes] = None
+        self.text_bytes: Optional[int] = None
+    
+    def as_text(self) -> str:
+        if self.text is None:
+            self.text = json.dumps(self.payload, default=str)
+        return self.text
+    
+    def as_binary(self) -> bytes:
+        if self.binary is None:
+            payload = self.payload if self.payload is not None else json.loads(self.text)
+            self.binary = msgpack.packb(payload, default=str)
+        return self.binary
+    
+    def size(self, encoding: str) -> int:
+        """Bytes on the wire (before compression) in one encoding"""
+        if encoding == "msgpack":
+            return len(self.as_binary())
+        if self.text_bytes is None:
+            self.text_bytes = len(self.as_text().encode("utf-8"))
+        return self.text_bytes
+
+def to_payload(message: Union[str, dict, OutboundFrame]) -> dict:
+    """The payload dict behind a message, parsing pre-serialized JSON if needed"""
+    if isinstance(message, OutboundFrame):
+        return message.payload if message.payload is not None else json.loads(message.text)
+    if isinstance(message, str):
+        return json.loads(message)
+    return message
+
+def to_frame(message: Union[str, dict, OutboundFrame]) -> OutboundFrame:
+    """Wrap a pre-serialized JSON string or a payload dict as a shared frame"""
+    if isinstance(message, OutboundFrame):
+        return message
+    if isinstance(message, str):
+        return OutboundFrame(text=message)
+    return OutboundFrame(payload=message)
+
+class LogRing:
+    """Bounded run of (seq, target, frame) entries for one audience, in seq order"""
+    
+    def __init__(self, size: int):
+        self.entries: deque = deque(maxlen=size)
+        self.evicted_through = 0  # Highest seq dropped from this ring
+    
+    def append(self, entry: Tuple[int, Dict, OutboundFrame]):
+        if len(self.entries) == self.entries.maxlen:
+            self.evicted_through = self.entries[0][0]
+        self.entries.append(entry)
+    
+    def since(self, last_seq: int) -> Optional[List]:
+        """Entries after last_seq, or None if some of them have already been evicted"""
+        if last_seq < self.evicted_through:
+            return None
+        missed = []
+        for entry in reversed(self.entries):
+            if entry[0] <= last_seq:
+                break
+            missed.append(entry)
+        missed.reverse()
+        return missed
+
+class EventLog:
+    """Sequenced routed messages, replayed to clients that resume.
+    
+    Messages are kept per audience - broadcasts, each role, each user - so
+    heavy traffic to one audience (e.g. per-tourist notifications) does not
+    evict another's replay window. Messages to a single connection are
+    sequenced but not kept: a reconnect gets a new client id.
+    
+    Sequence numbers are per worker process, and stream identifies the process.
+    The same message carries a different seq on each worker, so a client can
+    only resume against the worker it was connected to (e.g. behind sticky
+    load balancing); resuming against another one gets "resync_required".
+    """
+    
+    def __init__(self, size: int = WEBSOCKET_EVENT_LOG_SIZE, user_size: int = WEBSOCKET_EVENT_LOG_USER_SIZE,
+                 max_users: int = WEBSOCKET_EVENT_LOG_USERS):
+        self.stream = uuid.uuid4().hex[:12]
+        self.last_seq = 0
+        self.size = size
+        self.user_size = user_size
+        self.max_users = max_users
+        self.audiences: Dict[str, LogRing] = {}  # "all" or "role:<role>" -> ring
+        self.user_logs: OrderedDict = OrderedDict()  # user_id -> ring, least recently written first
+        # Highest seq of the user rings dropped as a whole, by hash slot of their user id
+        self.user_logs_evicted_through: List[int] = [0] * max(1, max_users)
+    
+    def append(self, target: Dict, payload: dict) -> OutboundFrame:
+        """Assign the next sequence number and keep the stamped frame for its audience"""
+        self.last_seq += 1
+        frame = OutboundFrame(payload=dict(payload, seq=self.last_seq))
+        entry = (self.last_seq, target, frame)
+        kind = target["kind"]
+        if kind == "user":
+            self.user_log(target["user_id"]).append(entry)
+        elif kind in ("role", "location"):
+            self.audience(f"role:{target['role']}").append(entry)
+        elif kind != "client":
+            self.audience("all").append(entry)
+        return frame
+    
+    def audience(self, key: str) -> LogRing:
+        ring = self.audiences.get(key)
+        if ring is None:
+            ring = self.audiences[key] = LogRing(self.size)
+        return ring
+    
+    def user_log(self, user_id: str) -> LogRing:
+        ring = self.user_logs.get(user_id)
+        if ring is None:
+            ring = self.user_logs[user_id] = LogRing(self.user_size)
+            # A ring dropped earlier for this user may have held messages a client missed
+            ring.evicted_through = self.user_logs_evicted_through[self.user_slot(user_id)]
+            if len(self.user_logs) > self.max_users:
+                dropped_user_id, dropped = self.user_logs.popitem(last=False)
+                if dropped.entries:
+                    slot = self.user_slot(dropped_user_id)
+                    self.user_logs_evicted_through[slot] = max(
+                        self.user_logs_evicted_through[slot], dropped.entries[-1][0]
+                    )
+        else:
+            self.user_logs.move_to_end(user_id)
+        return ring
+    
+    def user_slot(self, user_id: str) -> int:
+        return hash(user_id) % len(self.user_logs_evicted_through)
+    
+    def since(self, last_seq: int, role: Optional[str] = None, user_id: Optional[str] = None) -> Optional[List]:
+        """Entries after last_seq for a connection's audiences, in seq order, or None if any were evicted"""
+        if last_seq >= self.last_seq:
+            return []
+        rings = [self.audiences.get("all")]
+        if role:
+            rings.append(self.audiences.get(f"role:{role}"))
+        if user_id:
+            ring = self.user_logs.get(user_id)
+            if ring is None and last_seq < self.user_logs_evicted_through[self.user_slot(user_id)]:
+                return None  # Its ring may have been dropped with messages after last_seq
+            rings.append(ring)
+        missed = []
+        for ring in rings:
+            if ring is None:
+                continue
+            entries = ring.since(last_seq)
+            if entries is None:
+                return None
+            missed.extend(entries)
+        missed.sort(key=lambda entry: entry[0])
+        return missed
+
+class LatencyHistogram:
+    """Send latency counts in fixed millisecond buckets"""
+    
+    BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+    
     def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-        self.user_connections: Dict[str, List[str]] = {}  # user_id -> list of client_ids
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)  # Last bucket is everything slower
+        self.count = 0
+        self.total_seconds = 0.0
+    
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.BUCKETS_MS, seconds * 1000)] += 1
+        self.count += 1
+        self.total_seconds += seconds
+    
+    def snapshot(self) -> Dict:
+        buckets = {f"le_{bound}ms": count for bound, count in zip(self.BUCKETS_MS, self.counts)}
+        buckets["inf"] = self.counts[-1]
+        return {
+            "buckets": buckets,
+            "count": self.count,
+            "mean_ms": round(self.total_seconds / self.count * 1000, 3) if self.count else 0.0
+        }
+
+class ClientConnection:
+    """A WebSocket with its bounded outbound queue, drained by its own writer task"""
+    
+    def __init__(self, websocket: WebSocket, client_id: str, queue_size: int = WEBSOCKET_SEND_QUEUE_SIZE,
+                 encoding: str = "json"):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.encoding = encoding if encoding in SUPPORTED_ENCODINGS else "json"
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer_task: Optional[asyncio.Task] = None
+        self.degraded = False
+        self.sent_messages = 0
+        self.dropped_messages = 0
+        self.last_lag_seconds = 0.0  # Queue wait of the most recently sent message
+        self.last_seen = time.monotonic()  # Last message received from the client
+    
+    def enqueue(self, frame: OutboundFrame) -> bool:
+        """Queue a frame without waiting; False if the queue is full"""
+        try:
+            self.queue.put_nowait((time.monotonic(), frame))
+            return True
+        except asyncio.QueueFull:
+            return False
     
-    async def connect(self, websocket: WebSocket, client_id: str, user_id: str = None):
+    def shed_backlog(self):
+        """Drop the oldest half of the queue to make room for newer messages"""
+        for _ in range(max(1, self.queue.qsize() // 2)):
+            try:
+                self.queue.get_nowait()
+                self.dropped_messages += 1
+            except asyncio.QueueEmpty:
+                break
+    
+    def get_lag(self) -> Dict:
+        """Queue depth and how long the oldest queued message has been waiting"""
+        oldest_wait = 0.0
+        if not self.queue.empty():
+            # asyncio.Queue keeps its items in a deque; peek without dequeuing
+            enqueued_at, _ = self.queue._queue[0]
+            oldest_wait = time.monotonic() - enqueued_at
+        return {
+            "queued": self.queue.qsize(),
+            "oldest_wait_seconds": round(oldest_wait, 3),
+            "last_lag_seconds": round(self.last_lag_seconds, 3),
+            "sent": self.sent_messages,
+            "dropped": self.dropped_messages,
+            "degraded": self.degraded
+        }
+
+class ConnectionManager:
+    def __init__(self, send_queue_size: int = WEBSOCKET_SEND_QUEUE_SIZE,
+                 slow_consumer_policy: str = WEBSOCKET_SLOW_CONSUMER_POLICY,
+                 heartbeat_interval: int = WEBSOCKET_HEARTBEAT_INTERVAL,
+                 heartbeat_timeout: int = WEBSOCKET_HEARTBEAT_TIMEOUT):
+        self.send_queue_size = send_queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.heartbeat_task: Optional[asyncio.Task] = None
+        self.active_connections: Dict[str, ClientConnection] = {}
+        self.user_connections: Dict[str, Set[str]] = {}  # user_id -> client_ids
+        self.connection_users: Dict[str, str] = {}  # client_id -> user_id
+        self.connection_roles: Dict[str, str] = {}  # client_id -> role
+        self.role_connections: Dict[str, Set[str]] = {}  # role -> client_ids
+        self.connection_jurisdictions: Dict[str, str] = {}  # client_id -> jurisdiction
+        self.jurisdiction_connections: Dict[str, Set[str]] = {}  # jurisdiction -> client_ids
+        self.area_subscriptions = AreaSubscriptionIndex()  # client_id -> subscribed area
+        self.unfiltered_connections: Dict[str, Set[str]] = {}  # role -> client_ids without an area
+        self.slow_consumers_dropped = 0
+        self.idle_connections_reaped = 0
+        self.send_failures = 0
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.send_latency = LatencyHistogram()
+        self.backplane: Optional[Backplane] = None
+        self.event_handlers: Dict[str, List[Callable[[Dict], None]]] = {}  # topic -> handlers
+        self.event_log = EventLog()
+    
+    async def connect(self, websocket: WebSocket, client_id: str, user_id: str = None,
+                      role: str = None, jurisdiction: str = None, encoding: str = "json"):
+        """Accept a connection; encoding is "json" (text frames) or "msgpack" (binary frames)"""
         await websocket.accept()
-        self.active_connections[client_id] = websocket
+        if client_id in self.active_connections:
+            self.disconnect(client_id)  # Reconnect reusing its client id replaces the old socket
+        connection = ClientConnection(websocket, client_id, self.send_queue_size, encoding)
+        connection.writer_task = asyncio.create_task(self.write_loop(connection))
+        self.active_connections[client_id] = connection
         
         if user_id:
-            if user_id not in self.user_connections:
-                self.user_connections[user_id] = []
-            self.user_connections[user_id].append(client_id)
+            self.connection_users[client_id] = user_id
+            self.user_connections.setdefault(user_id, set()).add(client_id)
+        
+        if role:
+            self.connection_roles[client_id] = role
+            self.role_connections.setdefault(role, set()).add(client_id)
+            self.unfiltered_connections.setdefault(role, set()).add(client_id)
+        
+        if jurisdiction:
+            self.connection_jurisdictions[client_id] = jurisdiction
+            self.jurisdiction_connections.setdefault(jurisdiction, set()).add(client_id)
     
     def disconnect(self, client_id: str):
         if client_id in self.active_connections:
-            # Remove from active connections
-            del self.active_connections[client_id]
+            # Remove from active connections and stop its writer
+            connection = self.active_connections.pop(client_id)
+            if connection.writer_task and connection.writer_task is not asyncio.current_task():
+                connection.writer_task.cancel()
             
-            # Remove from user connections
-            for user_id, client_ids in self.user_connections.items():
-                if client_id in client_ids:
-                    client_ids.remove(client_id)
-                    if not client_ids:  # Remove user if no connections left
-                        del self.user_connections[user_id]
-                    break
-    
-    async def send_personal_message(self, message: str, client_id: str):
-        if client_id in self.active_connections:
-            websocket = self.active_connections[client_id]
+            # Remove from user, role and jurisdiction indexes
+            user_id = self.connection_users.pop(client_id, None)
+            if user_id:
+                self.discard_from_index(self.user_connections, user_id, client_id)
+            role = self.connection_roles.pop(client_id, None)
+            if role:
+                self.discard_from_index(self.role_connections, role, client_id)
+                self.discard_from_index(self.unfiltered_connections, role, client_id)
+            self.area_subscriptions.unsubscribe(client_id)
+            jurisdiction = self.connection_jurisdictions.pop(client_id, None)
+            if jurisdiction:
+                self.discard_from_index(self.jurisdiction_connections, jurisdiction, client_id)
+    
+    def disconnect_many(self, client_ids: Iterable[str]):
+        """Disconnect a batch of clients, e.g. everything behind a dropped cell tower"""
+        for client_id in list(client_ids):
+            self.disconnect(client_id)
+    
+    def disconnect_user(self, user_id: str):
+        """Disconnect every connection of a user"""
+        self.disconnect_many(self.user_connections.get(user_id, ()))
+    
+    def subscribe_area(self, client_id: str, area: BaseGeometry):
+        """Limit a connection's located events to those inside an area"""
+        if client_id not in self.active_connections:
+            return
+        self.area_subscriptions.subscribe(client_id, area)
+        role = self.connection_roles.get(client_id)
+        if role:
+            self.discard_from_index(self.unfiltered_connections, role, client_id)
+    
+    def unsubscribe_area(self, client_id: str):
+        """Return a connection to its role's full feed"""
+        if client_id not in self.active_connections:
+            return
+        self.area_subscriptions.unsubscribe(client_id)
+        role = self.connection_roles.get(client_id)
+        if role:
+            self.unfiltered_connections.setdefault(role, set()).add(client_id)
+    
+    @staticmethod
+    def discard_from_index(index: Dict[str, Set[str]], key: str, client_id: str):
+        client_ids = index.get(key)
+        if client_ids is not None:
+            client_ids.discard(client_id)
+            if not client_ids:
+                del index[key]
+    
+    async def write_loop(self, connection: ClientConnection):
+        """Drain one connection's queue; a failed send disconnects it"""
+        try:
+            while True:
+                enqueued_at, frame = await connection.queue.get()
+                if connection.encoding == "msgpack":
+                    await connection.websocket.send_bytes(frame.as_binary())
+                else:
+                    await connection.websocket.send_text(frame.as_text())
+                connection.sent_messages += 1
+                connection.last_lag_seconds = time.monotonic() - enqueued_at
+                self.messages_sent += 1
+                self.bytes_sent += frame.size(connection.encoding)
+                self.send_latency.observe(connection.last_lag_seconds)
+                if connection.degraded and connection.queue.empty():
+                    connection.degraded = False  # Caught up
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.send_failures += 1
+            self.disconnect(connection.client_id)
+    
+    def enqueue(self, frame: OutboundFrame, client_id: str):
+        """Queue a frame for one connection, applying the slow-consumer policy on overflow"""
+        connection = self.active_connections.get(client_id)
+        if connection is None or connection.enqueue(frame):
+            return
+        
+        if self.slow_consumer_policy == "downgrade" and not connection.degraded:
+            connection.degraded = True
+            connection.shed_backlog()
+            connection.enqueue(frame)
+            return
+        
+        connection.dropped_messages += 1
+        self.slow_consumers_dropped += 1
+        print(f"Dropping slow WebSocket consumer {client_id}")
+        self.disconnect(client_id)
+        asyncio.create_task(self.close_quietly(connection.websocket))
+    
+    @staticmethod
+    async def close_quietly(websocket: WebSocket, code: int = 1013):
+        # 1013: try again later
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+    
+    def touch(self, client_id: str):
+        """Record activity from a client; called for every message it sends"""
+        connection = self.active_connections.get(client_id)
+        if connection is not None:
+            connection.last_seen = time.monotonic()
+    
+    def reap_idle_connections(self, now: Optional[float] = None) -> int:
+        """Disconnect connections silent for longer than the heartbeat timeout"""
+        cutoff = (now if now is not None else time.monotonic()) - self.heartbeat_timeout
+        idle = [
+            connection for connection in self.active_connections.values()
+            if connection.last_seen < cutoff
+        ]
+        for connection in idle:
+            self.disconnect(connection.client_id)
+            asyncio.create_task(self.close_quietly(connection.websocket, code=1001))  # Going away
+        self.idle_connections_reaped += len(idle)
+        return len(idle)
+    
+    async def heartbeat_loop(self):
+        """Ping every connection and reap those that stopped answering"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
             try:
-                await websocket.send_text(message)
-            except Exception:
-                self.disconnect(client_id)
+                reaped = self.reap_idle_connections()
+                if reaped:
+                    print(f"Reaped {reaped} idle WebSocket connections")
+                await self.send_to_clients({"type": "ping", "ts": time.time()}, list(self.active_connections))
+            except Exception as e:
+                print(f"Error in WebSocket heartbeat: {e}")
+    
+    def start_heartbeat(self):
+        """Start the heartbeat in this worker process"""
+        if self.heartbeat_task is None or self.heartbeat_task.done():
+            self.heartbeat_task = asyncio.create_task(self.heartbeat_loop())
     
-    async def send_user_message(self, message: str, user_id: str):
+    async def stop_heartbeat(self):
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+            try:
+                await self.heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self.heartbeat_task = None
+    
+    async def send_personal_message(self, message: Union[str, dict, OutboundFrame], client_id: str):
+        self.route({"kind": "client", "client_id": client_id}, message)
+    
+    async def send_user_message(self, message: Union[str, dict, OutboundFrame], user_id: str):
         """Send message to all connections of a specific user"""
-        if user_id in self.user_connections:
-            client_ids = self.user_connections[user_id].copy()
-            for client_id in client_ids:
-                await self.send_personal_message(message, client_id)
-    
-    async def broadcast_to_role(self, message: str, role: str):
-        """Broadcast message to all users with a specific role"""
-        # This would need to be implemented based on your user role tracking
-        # For now, broadcast to all connections
-        await self.broadcast(message)
-    
-    async def broadcast(self, message: str):
+        self.route({"kind": "user", "user_id": user_id}, message)
+    
+    async def broadcast_to_role(self, message: Union[str, dict, OutboundFrame], role: str,
+                                jurisdiction: Optional[str] = None):
+        """Broadcast message to the connections of one role, optionally within one jurisdiction"""
+        self.route({"kind": "role", "role": role, "jurisdiction": jurisdiction}, message)
+    
+    async def broadcast_to_location(self, message: Union[str, dict, OutboundFrame], role: str,
+                                    lat: Optional[float], lng: Optional[float]):
+        """Send a located event to the role's connections whose area contains it.
+        
+        Connections of the role without an area subscription still receive every
+        event; an event without a location goes to the whole role.
+        """
+        if lat is None or lng is None:
+            await self.broadcast_to_role(message, role)
+            return
+        self.route({"kind": "location", "role": role, "lat": lat, "lng": lng}, message)
+    
+    async def broadcast(self, message: Union[str, dict, OutboundFrame]):
         """Broadcast message to all active connections"""
-        disconnected_clients = []
-        for client_id, websocket in self.active_connections.items():
+        self.route({"kind": "all"}, message)
+    
+    def route(self, target: Dict, message: Union[str, dict, OutboundFrame]):
+        """Sequence and deliver to matching local connections, and publish for the other workers"""
+        payload = to_payload(message)
+        self.deliver(target, self.event_log.append(target, payload))
+        if self.backplane:
+            self.backplane.publish({"target": target, "payload": payload})
+    
+    def receive_from_backplane(self, envelope: Dict):
+        """Sequence and deliver a message routed by another worker to this worker's connections"""
+        if "topic" in envelope:
+            self.dispatch_event(envelope["topic"], envelope["data"])
+            return
+        self.deliver(envelope["target"], self.event_log.append(envelope["target"], envelope["payload"]))
+    
+    def resume(self, client_id: str, last_seq: Optional[int] = None, stream: Optional[str] = None):
+        """Tell a new connection where the event stream is and replay what it missed.
+        
+        A client that reconnects with the stream and last seq it saw gets the
+        logged messages it would have received since. If they are no longer all
+        in the log (or would not fit its send queue), or the stream has changed
+        (a restart, or a reconnect that reached another worker), it is told to
+        reload with "resync_required".
+        """
+        connection = self.active_connections.get(client_id)
+        if connection is None:
+            return
+        
+        missed = None
+        if last_seq is not None and stream == self.event_log.stream:
+            entries = self.event_log.since(
+                last_seq, self.connection_roles.get(client_id), self.connection_users.get(client_id)
+            )
+            if entries is not None:
+                missed = [frame for _, target, frame in entries if self.matches(target, client_id)]
+                if len(missed) >= connection.queue.maxsize - connection.queue.qsize():
+                    missed = None
+        
+        self.enqueue(OutboundFrame(payload={
+            "type": "session" if missed is not None or last_seq is None else "resync_required",
+            "stream": self.event_log.stream,
+            "seq": self.event_log.last_seq
+        }), client_id)
+        for frame in missed or ():
+            self.enqueue(frame, client_id)
+    
+    def matches(self, target: Dict, client_id: str) -> bool:
+        """Whether a routing target covers a connection"""
+        kind = target["kind"]
+        if kind == "client":
+            return target["client_id"] == client_id
+        if kind == "user":
+            return self.connection_users.get(client_id) == target["user_id"]
+        if kind == "role":
+            return self.connection_roles.get(client_id) == target["role"] and (
+                target.get("jurisdiction") is None
+                or self.connection_jurisdictions.get(client_id) == target["jurisdiction"]
+            )
+        if kind == "location":
+            if self.connection_roles.get(client_id) != target["role"]:
+                return False
+            if client_id not in self.area_subscriptions:
+                return True
+            return self.area_subscriptions.covers(client_id, target["lat"], target["lng"])
+        return True
+    
+    def on_event(self, topic: str, handler: Callable[[Dict], None]):
+        """Register a handler for worker-to-worker events on a topic"""
+        self.event_handlers.setdefault(topic, []).append(handler)
+    
+    def publish_event(self, topic: str, data: Dict):
+        """Hand an event (not a socket message) to this worker's handlers and every other worker's"""
+        self.dispatch_event(topic, data)
+        if self.backplane:
+            self.backplane.publish({"topic": topic, "data": data})
+    
+    def dispatch_event(self, topic: str, data: Dict):
+        for handler in self.event_handlers.get(topic, ()):
             try:
-                await websocket.send_text(message)
-            except Exception:
-                disconnected_clients.append(client_id)
+                handler(data)
+            except Exception as e:
+                print(f"Error handling {topic} event: {e}")
+    
+    def deliver(self, target: Dict, frame: OutboundFrame):
+        """Queue a frame for the local connections matching a routing target"""
+        kind = target["kind"]
+        if kind == "client":
+            client_ids = [target["client_id"]]
+        elif kind == "user":
+            client_ids = list(self.user_connections.get(target["user_id"], ()))
+        elif kind == "role":
+            client_ids = self.role_connections.get(target["role"], set())
+            if target.get("jurisdiction") is not None:
+                client_ids = client_ids & self.jurisdiction_connections.get(target["jurisdiction"], set())
+            client_ids = list(client_ids)
+        elif kind == "location":
+            role = target["role"]
+            matched = {
+                client_id for client_id in self.area_subscriptions.subscribers_at(target["lat"], target["lng"])
+                if self.connection_roles.get(client_id) == role
+            }
+            matched.update(self.unfiltered_connections.get(role, ()))
+            client_ids = list(matched)
+        else:
+            client_ids = list(self.active_connections)
         
-        # Clean up disconnected clients
-        for client_id in disconnected_clients:
-            self.disconnect(client_id)
+        for client_id in client_ids:
+            self.enqueue(frame, client_id)
+    
+    async def send_to_clients(self, message: Union[str, dict, OutboundFrame], client_ids: Iterable[str]):
+        """Queue one shared frame for the given local connections; each writer delivers at its own pace.
+        
+        message may be a payload dict, which is serialized once per wire format no
+        matter how many connections receive it.
+        """
+        frame = to_frame(message)
+        for client_id in client_ids:
+            self.enqueue(frame, client_id)
     
     async def send_alert(self, alert_data: dict, target_roles: List[str] = None):
         """Send alert to specific roles or all users"""
-        import json
-        message = json.dumps({
+        message = OutboundFrame(payload={
             "type": "alert",
             "data": alert_data
         })
@@ -76,8 +629,48 @@ class ConnectionManager:
         else:
             await self.broadcast(message)
     
-    def get_connection_count(self) -> int:
+    async def start_backplane(self, backplane: Backplane):
+        """Share routed messages with the other workers through a backplane"""
+        await backplane.start(self.receive_from_backplane)
+        self.backplane = backplane
+    
+    async def stop_backplane(self):
+        if self.backplane:
+            backplane, self.backplane = self.backplane, None
+            await backplane.close()
+    
+    def get_connection_count(self, role: Optional[str] = None) -> int:
+        if role is not None:
+            return len(self.role_connections.get(role, ()))
         return len(self.active_connections)
     
+    def get_connection_counts(self) -> Dict[str, int]:
+        """Connection count per role, plus the total"""
+        counts = {role: len(client_ids) for role, client_ids in self.role_connections.items()}
+        counts["total"] = len(self.active_connections)
+        return counts
+    
+    def get_telemetry(self) -> Dict:
+        """Live socket metrics for this worker process"""
+        return {
+            "connections": self.get_connection_counts(),
+            "messages_sent": self.messages_sent,
+            "bytes_sent": self.bytes_sent,
+            "send_latency": self.send_latency.snapshot(),
+            "idle_connections_reaped": self.idle_connections_reaped,
+            "slow_consumers_dropped": self.slow_consumers_dropped,
+            "send_failures": self.send_failures,
+            "queued_messages": sum(connection.queue.qsize() for connection in self.active_connections.values()),
+            "event_log": {"stream": self.event_log.stream, "seq": self.event_log.last_seq},
+            "backplane": self.backplane.get_stats() if self.backplane else None
+        }
+    
+    def get_connection_lag(self) -> Dict[str, Dict]:
+        """Per-connection outbound queue metrics"""
+        return {client_id: connection.get_lag() for client_id, connection in self.active_connections.items()}
+    
     def get_user_connections(self, user_id: str) -> List[str]:
-        return self.user_connections.get(user_id, [])
\ No newline at end of file
+        return list(self.user_connections.get(user_id, ()))
+
+# Global connection manager instance (one per worker process)
+manager = ConnectionManager()
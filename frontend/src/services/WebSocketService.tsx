@@ -29,6 +29,11 @@ class WebSocketService {
       this.ws.onmessage = (event) => {
         try {
           const message: WebSocketMessage = JSON.parse(event.data);
+          if (message.type === 'ping') {
+            // Answer server heartbeats so the connection is not reaped as idle
+            this.send({ type: 'pong' });
+            return;
+          }
           const handler = this.messageHandlers.get(message.type);
           if (handler) {
             handler(message.data);